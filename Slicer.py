@@ -1,20 +1,32 @@
 from tkinter import *
 from tkinter import filedialog
 from tkinter import messagebox
-import pygame
+from tkinter import ttk
 import numpy as np
 import os
+import sys
+import time
+import queue
+import threading
 import base64
 import gtransform
 import orient
-import slice
-import path
-from drawlines import draw_lines
+import decimate
+import previewcache
+import job
+import patterns
+import motion
+import layerstore
+import layerview
+import meshcache
+import raster
+import streams
+from loader import Loader
 
 '''
-Program designed to open and view ASCII STL files and then slice them for 3D printing operations. Supports variable 
-slice heights and spacing between infill grid lines. Geometry moved to fit within a 8x8x6 inch print bed as large as
-possible according to the part orientation.
+Program designed to open and view ASCII STL files (and OBJ, PLY and 3MF meshes) and then slice them for 3D printing
+operations. Supports variable slice heights and spacing between infill grid lines. Geometry moved to fit within a
+8x8x6 inch print bed as large as possible according to the part orientation.
 Output files consist of an SVG file for each slice of the model showing the model outlines and the infill pattern and a
 CSV file that lists the coordinates of the print head at different times and whether or not the extruder is on during
 the move to that position.
@@ -25,40 +37,46 @@ echodor@clemson.edu
 '''
 
 
-# Class to draw an STL object from an ASCII STL file
+# Class to draw an STL object from an ASCII STL file (or an OBJ, PLY or 3MF model file)
 class DrawObject:
-    pxarray = []  # Initialize the pixel array variable to empty for the class
 
     def __init__(self):
-        # Initiate new Loader class and run load_stl with the selected file
+        # Initiate new Loader class and load the selected file (STL, OBJ, PLY or 3MF)
         self.model = Loader()
-        self.model.load_stl(window.filename)
+        start = time.perf_counter()
+        self.model.load(window.filename, compact_geometry.get(), mesh_cache if cache_meshes.get() else None)
+        self.load_time = time.perf_counter() - start
+        window.title("STL Slicer Application - " + self.model.name)  # Put filename in the GUI header
+
+        # Build the reduced level-of-detail mesh used for the preview (slicing keeps using the full geometry)
+        start = time.perf_counter()
+        self.preview_vertex, self.preview_face = decimate.cluster(self.model.geometry, embed_w, embed_h)
+        self.preview_time = time.perf_counter() - start
+
+        # Cache of rendered preview frames for each orientation, filled in the background by start_preview_worker
+        self.orientation = np.identity(4)  # Composed rotation from the loaded orientation
+        self.cache = previewcache.PreviewCache()
+        self.worker = None
 
     # Function to plot the initial object after loading
     def plot(self, loc):
 
+        layers_hide()  # Return from the layer viewer to the model preview
         # Orient the object to the origin and scale to fit the print bed dimensions
-        self.model.geometry = orient.to_origin(self.model.geometry)
-        self.model.geometry = orient.fit_bed(self.model.geometry, xdim.get(), ydim.get(), zdim.get())
-        # Apply isometric perspective to the geometry
-        plot_geometry, camera = gtransform.perspective(self.model.geometry)
-        # Draw lines between points of the geometry faces
-        plot_geometry = draw_lines(plot_geometry, self.model.normal, camera, view.get())
-
-        # Clear pixel array to white and then change each pixel color based on the XY pixel map
-        self.pxarray = pygame.PixelArray(loc)
-        self.pxarray[:][:] = (255, 255, 255)
-        for point in range(0, plot_geometry.shape[0]):
-            x = int(embed_w/2 + plot_geometry[point, 0])  # X coordinate (0,0 of screen is top left)
-            y = int(embed_h/2 + plot_geometry[point, 1])  # Y coordinate (0,0 of screen is top left)
-            # Plot all front facing lines and back facing when wireplot is selected
-            if plot_geometry[point, 2] == 1 or view.get() == 'wire':
-                self.pxarray[x][y] = (0, 0, 0)  # Color = black
-            # Plot grey lines only if grey lines are selected and the line is not already plotted black
-            elif plot_geometry[point, 2] == 0 and view.get() == 'grey' and self.pxarray[x][y] != 0:
-                self.pxarray[x][y] = (210, 210, 210)  # Color = grey
-        # Plot pixel array to screen and refresh window/GUI
-        pygame.surfarray.blit_array(loc, self.pxarray)
+        self.model.geometry, self.model.bounds = orient.to_origin(self.model.geometry, self.model.bounds)
+        self.model.geometry, self.model.bounds = orient.fit_bed(self.model.geometry, xdim.get(), ydim.get(), zdim.get(),
+                                                                self.model.bounds)
+        # Reuse the cached frame for this orientation if it has already been rendered
+        key = (previewcache.orientation_key(self.orientation), view.get())
+        frame = self.cache.get(key)
+        if frame is None:
+            # Project the reduced preview geometry and draw lines between points of the geometry faces
+            frame = previewcache.render_frame(self.model.geometry, self.model.normal, self.preview_vertex,
+                                              self.preview_face, view.get(), embed_w, embed_h)
+            self.cache.put(key, frame)
+
+        # Plot greyscale frame to screen and refresh window/GUI
+        pygame.surfarray.blit_array(loc, np.dstack((frame, frame, frame)))
         pygame.display.flip()
         window.update()
 
@@ -68,129 +86,96 @@ class DrawObject:
         # Transform geometry based on the selected transformation
         self.model.geometry, self.model.normal = gtransform.transform(self.model.geometry, self.model.normal, transtype,
                                                                       data)
+        self.model.bounds = gtransform.transform_bounds(self.model.bounds, gtransform.transform_matrix(transtype, data))
+        # Track the composed orientation to look up cached preview frames (exact for the 90 degree button rotations)
+        if transtype == 'rotation':
+            self.orientation = np.rint(self.orientation.dot(gtransform.rotation_matrix(data[0], data[1])))
         self.plot(loc)  # Rescale within print bed and plot the geometry for the new orientation
 
+    # Function to render the preview of every button reachable orientation in the background
+    def start_preview_worker(self):
+        self.stop_preview_worker()
+        self.worker = previewcache.PreviewWorker(self.cache, self.model.geometry, self.model.normal, self.model.bounds,
+                                                 self.orientation, self.preview_vertex, self.preview_face, view.get(),
+                                                 xdim.get(), ydim.get(), zdim.get(), embed_w, embed_h)
+        self.worker.start()
+
+    def stop_preview_worker(self):
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker = None
+
     # Function to run the slicer algorithm
     def slice_geometry(self):
 
-        # Calculate slice thickness/number of slices parameters and infill spacing
-        h = ydim.get()
+        # Calculate slice thickness and infill spacing parameters
         step = slice_size.get()
         # Check for incorrect slice heights (negative or zero)
         if step <= 0:
             step = 0.1
-        num_steps = int(h/step)  # Calculate number of slices
         space = infill_space.get()
         # Check for incorrect infill spacing (negative or zero)
         if space <= 0:
             space = 0.1
 
-        # Make sure the output directory exists for saving the outputs
-        outputdir = 'outputs'
-        if not os.path.exists(outputdir):
-            os.makedirs(outputdir)
-
-        # Try to delete previous output files (SVGs and path CSV) if they exist
-        try:
-            list(map(os.unlink, (os.path.join(outputdir, f) for f in os.listdir(outputdir))))
-        except OSError:
-            pass
-
-        # Loop over the number of slices through the print area based on the slice thickness selected
-        for level in range(num_steps+2):
-            offset = 0.01  # Negligible offset to handle rounding error with first and last slice (<0.001 in)
-            if level == 0:
-                z = round(level * step + offset, 2)
-            elif level == num_steps + 1:
-                z = round(level * step - offset, 2)
-            else:
-                z = round(level * step + offset, 2)
-
-            # Rotate the object around the X-axis by 180deg to align with print bed coordinate system
-            geometry, normals = gtransform.rotation(self.model.geometry, self.model.normal, 1, 180)
-            # Compute the clipped point pairs at the current slice z coordinate
-            point_pairs = slice.compute_points_on_z(geometry, z, xdim.get(), ydim.get(), zdim.get())
-            # Create infill paths (X direction)
-            fillx = slice.infill(point_pairs, 0, space)
-            # Create infill path (Y direction)
-            filly = slice.infill(point_pairs, 1, space)
-            # Output the slices to svg files for confirmation/viewing
-            path.svgcreate(point_pairs, z, xdim.get(), fillx, filly)
-            # Run the contour building algorithm to sort the point pairs into continuous contour sets
-            contour = slice.build_contours(point_pairs)
-            # Create printer head path CSV file (main path and infill pattern)
-            path.headpath(contour, fillx, filly, z)
-
-        # Calculate time vector describing the head motion and add to the CSV file
-        speed = 1  # Print head speed (inch/sec)
-        path.time_calc(speed)
-
-        # Info box to give information when the slicer is completed
-        messagebox.showinfo('Slicing Complete!',
-                            'The slicer has completed slicing the model successfully! \n\n'
-                            'Check the created "outputs" folder for an SVG file of each slice of the model and'
-                            ' the "path.csv" file for the print head coordinate instructions')
-
-
-# STL file loader class
-class Loader:
-    # Initialize class variables
-    geometry = []
-    normal = []
-    name = []
-    normal_face = []
-
-    # Load ASCII STL File (no Binary STLs - based on project requirements)
-    def load_stl(self, filename):
-        self.geometry = []  # Clear previous geometry data
-        self.name = []  # Clear previous STL model name
-        self.normal = []  # Clear previous STL normal data
-        triangle = []  # Initialize empty triangle set
-        fp = open(filename, 'r')  # Open and read selected file into memory
-
-        # Loop over each line in the STL file
-        for line in fp.readlines():
-            parts = line.split()  # Split line into parts by spaces
-            if len(parts) > 0:
-                # Start of filename, store embedded filename
-                if parts[0] == 'solid':
-                    self.name = line[6:-1]
-                # Beginning of a new face - store normals and begin new triangle variable
-                if parts[0] == 'facet':
-                    triangle = []
-                    # Select face normal components
-                    self.normal_face = (float(parts[2]), float(parts[3]), float(parts[4]), 1)
-                # Store all the vertex points in 'triangle'
-                if parts[0] == 'vertex':
-                    triangle.append((float(parts[1]), float(parts[2]), float(parts[3]), 1))
-                # End of face - append new face to the model data
-                if parts[0] == 'endloop':
-                    self.geometry.append([triangle[0], triangle[1], triangle[2]])
-                    self.normal.append(self.normal_face)
-        fp.close()
-        # Convert lists to numpy arrays of the correct dimensions (Nx4 matrices)
-        self.normal = np.asarray(self.normal).reshape((-1, 4))
-        self.geometry = np.asarray(self.geometry).reshape((-1, 4))
-        window.title("STL Slicer Application - " + self.name)  # Put filename in the GUI header
+        # Only run one slicing job at a time
+        if SliceProgress.active is not None:
+            return
+
+        # Motion limits of the printer used for the time vector of the path CSV file (inches and seconds)
+        xy_speed, xy_acc = max(xy_velocity.get(), 0.01), max(xy_accel.get(), 0.01)
+        machine = motion.Machine(max(print_speed.get(), 0.01), max(travel_speed.get(), 0.01),
+                                 (xy_speed, xy_speed, max(z_velocity.get(), 0.01)),
+                                 (xy_acc, xy_acc, max(z_accel.get(), 0.01)), max(junction_dev.get(), 0.0))
+        # Bitmap of every layer for mask based (DLP/SLA) printers, written on a background thread while slicing
+        masks = None
+        if mask_output.get():
+            masks = raster.MaskWriter(max(mask_pixel.get(), 0.01), mask_archive.get())
+        # Compressed path file and all SVG files in one archive instead of thousands of small files
+        outputs = None
+        if compress_output.get():
+            outputs = streams.OutputStreams('gzip', 6, 1 << 20, archive=True)
+
+        # Run the slicer on a worker thread with a private copy of the geometry so the GUI stays responsive and the
+        # model can still be rotated in the preview while slicing
+        SliceProgress(window, self.model.geometry.copy(), self.model.normal.copy(), self.model.bounds.copy(),
+                      xdim.get(), ydim.get(), zdim.get(), step, space, machine, max(gap_size.get(), 0.0),
+                      max(shell_count.get(), 1), max(shell_width.get(), 0.01), infill_pattern.get(),
+                      max(infill_density.get(), 1.0)/100, masks, max(simplify_tol.get(), 0.0), outputs,
+                      grid_size.get() if grid_size.get() > 0 else None)
 
 
 def file_select():
-    # Function to select an STL file and store the path as "filename"
-    window.filename = filedialog.askopenfilename(initialdir="C:\\", title="Select STL File",
-                                                 filetypes=(("STL files", "*.STL"), ("All files", "*.*")))
+    # Function to select a model file and store the path as "filename"
+    models = "*.stl *.STL *.obj *.OBJ *.ply *.PLY *.3mf *.3MF"  # ASCII STL and the indexed mesh formats
+    window.filename = filedialog.askopenfilename(initialdir="C:\\", title="Select Model File",
+                                                 filetypes=(("Model files", models), ("All files", "*.*")))
     # Check whether or not a file was selected or not
     if window.filename:
+        # Stop filling the preview cache of the previously opened model
+        if hasattr(file_select, 'stlobject'):
+            file_select.stlobject.stop_preview_worker()
         status_text = "Opened: " + window.filename  # Add file name/path to bottom status bar
         status.configure(text=status_text)
         file_select.stlobject = DrawObject()  # Create new stlobject class for the selected file
-        DrawObject.plot(file_select.stlobject, screen)  # Run initial object plot function for the class
+        stlobject = file_select.stlobject
+        # Report whether the model was mapped from the parsed mesh cache or parsed from the file and how long it took
+        status_text += "    {} in {:.3f} s".format('Cached' if stlobject.model.from_cache else 'Parsed',
+                                                   stlobject.load_time)
+        # Report the size of the reduced preview mesh and the time taken to build it
+        status_text += "    Preview: {} of {} facets ({:.3f} s)".format(len(stlobject.preview_face),
+                                                                       stlobject.model.normal.shape[0],
+                                                                       stlobject.preview_time)
+        status.configure(text=status_text)
+        DrawObject.plot(file_select.stlobject, display())  # Run initial object plot function for the class
+        file_select.stlobject.start_preview_worker()  # Pre-render the other orientations in the background
 
 
 # Class to create a slicer settings popup dialog box for user input
 class SettingsDialog:
     def __init__(self, parent):
         top = self.top = Toplevel(parent)  # Use Tkinter top for a separate popup GUI
-        top.geometry("240x200")  # Window dimensions
+        top.geometry("240x460")  # Window dimensions
         top.resizable(0, 0)  # Un-resizable
         top.title('Settings')  # Window title
 
@@ -277,30 +262,240 @@ class SettingsDialog:
         top.wm_iconbitmap(temfile)  # Set window icon to the icon image
         os.remove(temfile)
 
-        self.NameLabel = Label(top, text='Slicer Settings').place(x=50, rely=.1, anchor="c")
-        self.zLabel = Label(top, text='Slice Height (in)').place(x=55, rely=.3, anchor="c")
-        self.InfillLabel = Label(top, text='Infill Spacing (in)').place(x=55, rely=.6, anchor="c")
-        self.zBox = Entry(top)  # Z spacing entry box
-        self.zBox.place(x=165, rely=.3, anchor="c", width=100)
-        self.zBox.insert(0, slice_size.get()/25.4)  # Prefill with Slice Height variable value (inches)
-        self.InfillBox = Entry(top)  # Infill spacing entry box
-        self.InfillBox.place(x=165, rely=.6, anchor="c", width=100)
-        self.InfillBox.insert(0, infill_space.get()/25.4)  # Prefill with infill grid spacing variable value (inches)
+        self.NameLabel = Label(top, text='Slicer Settings').place(x=50, y=20, anchor="c")
+        self.zBox = self.entry('Slice Height (in)', slice_size.get()/25.4, 1)  # Z spacing entry box
+        self.InfillBox = self.entry('Infill Spacing (in)', infill_space.get()/25.4, 2)  # Infill grid spacing entry box
+        self.GapBox = self.entry('Gap Closing (in)', gap_size.get()/25.4, 3)  # Largest contour crack to bridge
+        self.ShellBox = self.entry('Shells', shell_count.get(), 4)  # Number of perimeters (outline + inner shells)
+        self.WidthBox = self.entry('Shell Spacing (in)', shell_width.get()/25.4, 5)  # Extrusion width between shells
+        self.DensityBox = self.entry('Infill Density (%)', infill_density.get(), 6)  # Infill relative to the full grid
+        self.pattern = StringVar(value=infill_pattern.get())
+        Label(top, text='Infill Pattern').place(x=55, y=20 + 40*7, anchor="c")
+        OptionMenu(top, self.pattern, *patterns.PATTERNS).place(x=165, y=20 + 40*7, anchor="c", width=100)
+        self.SimplifyBox = self.entry('Simplify (in)', simplify_tol.get()/25.4, 8)  # Contour chord error tolerance
+        self.GridBox = self.entry('Integer Grid (in)', grid_size.get()/25.4, 9)  # Fixed point resolution (0 = off)
 
         # Save button, runs command to store/send variables back to the main window space
-        self.mySubmitButton = Button(top, text='Save', command=self.send).place(relx=.5, rely=.85, anchor="c")
+        self.mySubmitButton = Button(top, text='Save', command=self.send).place(relx=.5, rely=.9, anchor="c")
+
+    def entry(self, text, value, row):
+        # Create a labelled entry box on the given row prefilled with the current value of the setting
+        Label(self.top, text=text).place(x=55, y=20 + 40*row, anchor="c")
+        box = Entry(self.top)
+        box.place(x=165, y=20 + 40*row, anchor="c", width=100)
+        box.insert(0, value)
+        return box
 
     def send(self):
         # Update main window variables with those filled in the entry boxes
         slice_size.set(float(self.zBox.get())*25.4)
         infill_space.set(float(self.InfillBox.get())*25.4)
+        gap_size.set(float(self.GapBox.get())*25.4)
+        shell_count.set(int(self.ShellBox.get()))
+        shell_width.set(float(self.WidthBox.get())*25.4)
+        infill_density.set(float(self.DensityBox.get()))
+        infill_pattern.set(self.pattern.get())
+        simplify_tol.set(float(self.SimplifyBox.get())*25.4)
+        grid_size.set(max(float(self.GridBox.get()), 0.0)*25.4)
         self.top.destroy()  # Destroy popup window and return to main window loop
 
 
+# Class to create a machine settings popup dialog box (motion limits used for the print time estimate)
+class MachineDialog(SettingsDialog):
+    def __init__(self, parent):
+        top = self.top = Toplevel(parent)  # Use Tkinter top for a separate popup GUI
+        top.geometry("240x420")  # Window dimensions
+        top.resizable(0, 0)  # Un-resizable
+        top.title('Machine')  # Window title
+
+        self.NameLabel = Label(top, text='Machine Settings').place(x=55, y=20, anchor="c")
+        self.PrintBox = self.entry('Print Speed (in/s)', print_speed.get(), 1)  # Speed while extruding
+        self.TravelBox = self.entry('Travel Speed (in/s)', travel_speed.get(), 2)  # Speed with the extruder off
+        self.XYSpeedBox = self.entry('Max XY Speed (in/s)', xy_velocity.get(), 3)  # X and Y axis velocity limit
+        self.ZSpeedBox = self.entry('Max Z Speed (in/s)', z_velocity.get(), 4)  # Z axis velocity limit
+        self.XYAccelBox = self.entry('XY Accel (in/s^2)', xy_accel.get(), 5)  # X and Y axis acceleration limit
+        self.ZAccelBox = self.entry('Z Accel (in/s^2)', z_accel.get(), 6)  # Z axis acceleration limit
+        self.JunctionBox = self.entry('Junction Dev. (in)', junction_dev.get(), 7)  # Cornering tolerance
+        self.PixelBox = self.entry('Mask Pixel (in)', mask_pixel.get()/25.4, 8)  # Pixel size of the layer masks
+
+        # Save button, runs command to store/send variables back to the main window space
+        self.mySubmitButton = Button(top, text='Save', command=self.send).place(relx=.5, rely=.9, anchor="c")
+
+    def send(self):
+        # Update main window variables with those filled in the entry boxes
+        print_speed.set(float(self.PrintBox.get()))
+        travel_speed.set(float(self.TravelBox.get()))
+        xy_velocity.set(float(self.XYSpeedBox.get()))
+        z_velocity.set(float(self.ZSpeedBox.get()))
+        xy_accel.set(float(self.XYAccelBox.get()))
+        z_accel.set(float(self.ZAccelBox.get()))
+        junction_dev.set(float(self.JunctionBox.get()))
+        mask_pixel.set(float(self.PixelBox.get())*25.4)
+        self.top.destroy()  # Destroy popup window and return to main window loop
+
+
+# Class to create a slicing progress popup with a cancel button while the slicer runs on a worker thread
+class SliceProgress:
+    active = None  # Currently running slicing job (only one at a time)
+
+    def __init__(self, parent, geometry, normal, bounds, xdim, ydim, zdim, step, space, machine, gap, shells, width,
+                 pattern, density, masks=None, tolerance=0.0, outputs=None, resolution=None):
+        top = self.top = Toplevel(parent)  # Use Tkinter top for a separate popup GUI
+        top.geometry("320x130")  # Window dimensions
+        top.resizable(0, 0)  # Un-resizable
+        top.title('Slicing')  # Window title
+        top.protocol("WM_DELETE_WINDOW", self.cancel)  # Closing the popup cancels the job
+
+        self.bar = ttk.Progressbar(top, orient=HORIZONTAL, length=280, mode='determinate')
+        self.bar.place(relx=.5, rely=.2, anchor="c")
+        self.info = Label(top, text='Starting...')
+        self.info.place(relx=.5, rely=.45, anchor="c")
+        self.CancelButton = Button(top, text='Cancel', command=self.cancel)
+        self.CancelButton.place(relx=.5, rely=.78, anchor="c")
+
+        # Messages from the worker thread are passed through a queue and read on the GUI thread
+        self.messages = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.store = layerstore.LayerStore()  # Sliced data of every layer, kept for the layer viewer
+        self.masks = masks  # raster.MaskWriter of the layer masks (None when no masks are written)
+        self.tolerance = tolerance  # Contour simplification tolerance in mm (0 = off)
+        self.outputs = outputs  # streams.OutputStreams of the compressed outputs (None writes plain files)
+        self.resolution = resolution  # Integer grid step in mm (None slices with floating point coordinates)
+        self.worker = threading.Thread(target=self.run, daemon=True,
+                                       args=(geometry, normal, bounds, xdim, ydim, zdim, step, space, machine, gap,
+                                             shells, width, pattern, density))
+        SliceProgress.active = self
+        self.worker.start()
+        top.after(100, self.poll)
+
+    def run(self, geometry, normal, bounds, xdim, ydim, zdim, step, space, machine, gap, shells, width, pattern,
+            density):
+        # Worker thread - no Tkinter calls are allowed here
+        def progress(done, total, segments, elapsed):
+            self.messages.put(('progress', done, total, segments, elapsed))
+
+        try:
+            report = job.slice_model(geometry, normal, xdim, ydim, zdim, step, space, 'outputs', progress,
+                                     self.cancel_event, machine.print_speed, bounds, gap, shells, width, pattern,
+                                     density, machine, store=self.store, masks=self.masks,
+                                     tolerance=self.tolerance, streams=self.outputs, resolution=self.resolution)
+            self.messages.put(('done', job.summarize(report)) if report is not None else ('cancelled',))
+        except Exception as error:
+            self.messages.put(('error', str(error)))
+
+    def poll(self):
+        # Read all pending messages from the worker and update the progress display
+        finished = None
+        while not self.messages.empty():
+            message = self.messages.get()
+            if message[0] == 'progress':
+                done, total, segments, elapsed = message[1:]
+                eta = elapsed/done*(total - done)  # Remaining time at the average time per layer so far
+                rate = segments/elapsed if elapsed > 0 else 0.0
+                self.bar['value'] = 100.0*done/total
+                self.info.configure(text='Layer {} of {}    ETA {:.0f} s    {:.0f} segments/s'.format(done, total,
+                                                                                                   eta, rate))
+            else:
+                finished = message
+        if finished is None:
+            self.top.after(100, self.poll)  # Keep polling until the worker reports the end of the job
+            return
+
+        SliceProgress.active = None
+        self.top.destroy()
+        if finished[0] == 'done':
+            layers_show.store = self.store  # Layers of the last completed job for Slicer > View Layers
+            # Info box to give information when the slicer is completed
+            totals = finished[1]
+            masks = ''
+            if self.masks is not None:
+                masks = 'Layer masks: {} written ({:.0f} kB, {:.1f} layers/s)\n'.format(
+                    self.masks.layers, self.masks.bytes/1024, self.masks.rate())
+            if self.outputs is not None:
+                masks += 'Compressed outputs: {:.0f} kB written for {:.0f} kB of path and SVG data\n'.format(
+                    self.outputs.written/1024, self.outputs.raw/1024)
+            messagebox.showinfo('Slicing Complete!',
+                                'The slicer has completed slicing the model successfully! \n\n'
+                                'Check the created "outputs" folder for an SVG file of each slice of the model and'
+                                ' the "path.csv" file for the print head coordinate instructions\n\n'
+                                'Contour gaps repaired: {}\nContours left open: {}\n'
+                                'Contour segments removed by simplification: {}\n'
+                                'Layers reused from the layer below (prismatic sections): {}\n'
+                                'Estimated print time: {:.0f} s ({:.0f} s saved by the infill pattern)\n'
+                                '{}(per-layer counts in "report.csv")\n\n'
+                                'Use Slicer > View Layers to scrub through the sliced layers'.format(
+                                    totals.get('repaired', 0), totals.get('open', 0), totals.get('removed', 0),
+                                    totals.get('reused', 0), totals.get('time', 0),
+                                    totals.get('saved', 0), masks))
+        elif finished[0] == 'cancelled':
+            status.configure(text="Slicing cancelled - previous outputs left unchanged")
+        else:
+            messagebox.showerror('Slicing Failed', 'The slicer stopped with an error:\n\n' + finished[1])
+
+    def cancel(self):
+        # Ask the worker to stop before the next layer, the popup closes once it has cleaned up
+        self.cancel_event.set()
+        self.info.configure(text='Cancelling...')
+        self.CancelButton.configure(state=DISABLED)
+
+
+def layers_show(store=None):
+    # Show the sliced layers of a layer store (the last completed job by default) with the Z slider
+    store = store if store is not None else getattr(layers_show, 'store', None)
+    if store is None or len(store) == 0:
+        messagebox.showinfo('View Layers', 'Run the slicer or open a saved "layers" folder first.')
+        return
+    layers_hide()
+    layers_show.viewer = layerview.LayerViewer(store, embed_w, embed_h)
+    layer_scale.configure(from_=0, to=len(store) - 1)
+    layer_scale.place(x=50, y=645)
+    layer_scale.set(0)
+    layers_draw(0)
+
+
+def layers_draw(value):
+    # Draw the layer selected with the Z slider (called for every slider move)
+    viewer = getattr(layers_show, 'viewer', None)
+    if viewer is None:
+        return
+    screen = display()  # Creates the display (and imports PyGame) on first use
+    i = int(float(value))
+    frame = viewer.frame(i)
+    pygame.surfarray.blit_array(screen, np.dstack((frame, frame, frame)))
+    pygame.display.flip()
+    status.configure(text="Layer {} of {}    Z = {:.3f} in".format(i + 1, len(viewer),
+                                                                   viewer.store.height(i)/25.4))
+
+
+def layers_hide():
+    # Stop the layer viewer and hide the Z slider
+    viewer = getattr(layers_show, 'viewer', None)
+    if viewer is not None:
+        viewer.stop()
+        layers_show.viewer = None
+        layer_scale.place_forget()
+
+
+def layers_open():
+    # Open the "layers" folder saved by an earlier slicing job (memory-mapped, only viewed layers are read)
+    directory = filedialog.askdirectory(title="Select Layers Folder")
+    if directory:
+        try:
+            store = layerstore.load(directory)
+        except (OSError, ValueError) as error:
+            messagebox.showerror('View Layers', 'Could not open the layer data:\n\n' + str(error))
+            return
+        layers_show(store)
+
+
 def save_click():
     SettingsDialog(window)  # Create a new instance of the popup window class
 
 
+def machine_click():
+    MachineDialog(window)  # Create a new instance of the machine settings popup window class
+
+
 def about_popup():
     # Info box about the software from the Help menu
     messagebox.showinfo('About STL Slicer',
@@ -315,7 +510,27 @@ def settings_popup():
                         'Slice Height:\n\nEnter a value in inches for the vertical spacing between consecutive STL'
                         ' slices in the Z direction.\n\n'
                         'Infill Spacing:\n\nEnter a value in inches for the spacing between the passes of the'
-                        ' grid infill pattern.')
+                        ' grid infill pattern.\n\n'
+                        'Gap Closing:\n\nEnter a value in inches for the largest crack between the ends of open'
+                        ' contours that is bridged when repairing the sliced contours.\n\n'
+                        'Shells:\n\nEnter the number of perimeters printed around each island (1 prints the outline'
+                        ' only). The infill fills the inside of the innermost shell.\n\n'
+                        'Shell Spacing:\n\nEnter a value in inches for the spacing between perimeter shells'
+                        ' (extrusion width).\n\n'
+                        'Infill Density:\n\nEnter the amount of infill as a percentage of the full X and Y grid at'
+                        ' the infill spacing.\n\n'
+                        'Infill Pattern:\n\nSelect the full X and Y grid or a sparse pattern: alternating X/Y lines'
+                        ' (rectilinear), triangles, honeycomb or gyroid.\n\n'
+                        'Simplify:\n\nEnter a value in inches for the largest distance a simplified contour may'
+                        ' move away from the sliced contour (chord error). Vertices within this distance of the line'
+                        ' between their neighbours are removed to shrink the path and SVG files. 0 keeps every'
+                        ' sliced segment.\n\n'
+                        'Integer Grid:\n\nEnter a value in inches (e.g. 0.00004 = 1 micron) to slice the model'
+                        ' with its coordinates rounded to that grid, so that the sliced segments join exactly and'
+                        ' no contour gaps need repairing. 0 slices with floating point coordinates.\n\n'
+                        'Machine Settings:\n\nPrint and travel speeds, the velocity and acceleration limits of the'
+                        ' axes and the junction deviation (cornering tolerance) used to estimate the print time, and'
+                        ' the pixel size of the layer masks.')
 
 
 def output_popup():
@@ -326,7 +541,20 @@ def output_popup():
                         'CSV File:\n\nThe slicer outputs a "path.csv" file describing the position of the print head'
                         ' during printing. Each row represents the elapsed time in seconds, the X,Y,Z coordinate in'
                         ' space and fifth value indicates whether the print head should be on (1) or off (0) when'
-                        ' making the move to the position from its previous position.')
+                        ' making the move to the position from its previous position.\n\n'
+                        'Report File:\n\nThe slicer outputs a "report.csv" file with one row of statistics for each'
+                        ' slice, such as the number of repaired and still open contours.\n\n'
+                        'Layer Data:\n\nThe sliced segments, printed contours and infill of every slice are saved as'
+                        ' NumPy arrays in the "layers" folder (see layerstore.py) for viewing and analysis tools.\n\n'
+                        'Layer Masks:\n\nWith Edit > Layer Masks (PNG) checked, a black and white bitmap of the'
+                        ' filled area of every slice is written to the "masks" folder for mask based (DLP/SLA) resin'
+                        ' printers, as one PNG file per slice or packed in "masks.zip".\n\n'
+                        'Compressed Outputs:\n\nWith Edit > Compress Outputs checked, the path is written as'
+                        ' "path.csv.gz" and the SVG files of all slices are written into one "svg.zip" archive, which'
+                        ' is much faster on network drives.\n\n'
+                        'Parsed Model Cache:\n\nWith Edit > Cache Parsed Models checked, the parsed geometry of every'
+                        ' opened model is kept in the ".stl-slicer/meshcache" folder of the home directory, so opening'
+                        ' the same unchanged file again maps the saved arrays instead of parsing the file.')
 
 
 # ****** Initialize Main Window ******
@@ -397,13 +625,19 @@ cube = \
         AAAf/gAAH/4AAB/+AAAf/gAAH/4AAB/+AAAf/gAAH/4AAB/+AAAf+AAAH8AAAB4AAAAQAAAAAAPwAAAf/AAA//+AAD/8AAADwADA\
         AAAD/AAAP//AA/8="
 
-icondata = base64.b64decode(cube)  # Decode base64 image
-tempfile = "icon.ico"  # Create temporary file
-iconfile = open(tempfile, "wb")  # Open temporary file
-iconfile.write(icondata)  # Write icon data
-iconfile.close()
-window.wm_iconbitmap(tempfile)  # Set window icon to the icon image
-os.remove(tempfile)
+
+def set_icon():
+    # Decode the icon and write it to a temporary file once the window is up (run from the first idle callback)
+    icondata = base64.b64decode(cube)  # Decode base64 image
+    tempfile = "icon.ico"  # Create temporary file
+    iconfile = open(tempfile, "wb")  # Open temporary file
+    iconfile.write(icondata)  # Write icon data
+    iconfile.close()
+    window.wm_iconbitmap(tempfile)  # Set window icon to the icon image
+    os.remove(tempfile)
+
+
+window.after_idle(set_icon)
 
 # ****** Embed PyGame Window (Pixel Map Display) ******
 
@@ -411,14 +645,26 @@ embed_w = 800  # Width of object display screen
 embed_h = 600  # Height of object display screen
 embed = Frame(window, width=embed_w, height=embed_h)  # Embed in the GUI window
 embed.place(x=50, y=40)  # Location of placement
-# Set appropriate environment variables for embedding the PyGame pixel display window in the GUI
-os.environ['SDL_WINDOWID'] = str(embed.winfo_id())
-os.environ['SDL_VIDEODRIVER'] = 'windib'
-screen = pygame.display.set_mode((embed_w, embed_h))  # Create screen with specified width and height
-# Set embed screen to white and refresh the screen object
-screen.fill((255, 255, 255))
-pygame.display.init()
-pygame.display.flip()
+
+
+def display():
+    # PyGame display embedded in the GUI, created the first time something is drawn (importing PyGame and starting the
+    # SDL display is a large part of the start up time and is not needed until a model or layer is shown)
+    if display.screen is None:
+        global pygame
+        import pygame
+        # Set appropriate environment variables for embedding the PyGame pixel display window in the GUI
+        os.environ['SDL_WINDOWID'] = str(embed.winfo_id())
+        os.environ['SDL_VIDEODRIVER'] = 'windib'
+        display.screen = pygame.display.set_mode((embed_w, embed_h))  # Create screen with specified width and height
+        # Set embed screen to white and refresh the screen object
+        display.screen.fill((255, 255, 255))
+        pygame.display.init()
+        pygame.display.flip()
+    return display.screen
+
+
+display.screen = None
 
 # Code to load a base64 version of the coordinate axes to display on the GUI for the print bed coordinate system
 # Load and place on the bottom right of the window below the controls for user reference
@@ -464,9 +710,15 @@ coords = \
         167yN9NQHA9ST/F2iIjC68YRiGUY3/ARxUpOOUQIkQAAAAAElFTkS\
         uQmCC"
 
-coordimg = PhotoImage(data=coords)
-image = Label(window, image=coordimg)
-image.place(x=975, rely=0.825, anchor="c")
+
+def show_axes():
+    # Decode the image once the window is up (run from the first idle callback)
+    show_axes.image = PhotoImage(data=coords)  # Keep a reference so the image is not garbage collected
+    image = Label(window, image=show_axes.image)
+    image.place(x=975, rely=0.825, anchor="c")
+
+
+window.after_idle(show_axes)
 
 # ****** Define Default 3D Printing Options and View Type ******
 
@@ -485,6 +737,57 @@ slice_size.set(0.5*25.4)
 # Default infill grid spacing in mm
 infill_space = DoubleVar()
 infill_space.set(0.5*25.4)
+# Default largest gap between open contour ends that is bridged in mm
+gap_size = DoubleVar()
+gap_size.set(0.02*25.4)
+# Default number of perimeters of each island (1 = outline only) and spacing between them in mm
+shell_count = IntVar()
+shell_count.set(1)
+shell_width = DoubleVar()
+shell_width.set(0.02*25.4)
+# Default infill pattern and density (percent of the extruded length of the full X and Y grid)
+infill_pattern = StringVar()
+infill_pattern.set('grid')
+infill_density = DoubleVar()
+infill_density.set(100)
+# Default contour simplification tolerance (chord error) in mm, 0 = off
+simplify_tol = DoubleVar()
+simplify_tol.set(0.0)
+# Default integer grid step for fixed point slicing in mm, 0 = floating point coordinates
+grid_size = DoubleVar()
+grid_size.set(0.0)
+# Default printer motion limits (inches and seconds) for the print time estimate
+print_speed = DoubleVar()
+print_speed.set(1)
+travel_speed = DoubleVar()
+travel_speed.set(4)
+xy_velocity = DoubleVar()
+xy_velocity.set(8)
+z_velocity = DoubleVar()
+z_velocity.set(0.5)
+xy_accel = DoubleVar()
+xy_accel.set(40)
+z_accel = DoubleVar()
+z_accel.set(4)
+junction_dev = DoubleVar()
+junction_dev.set(0.002)
+# Store newly opened geometry as compact float32 XYZ arrays instead of float64 homogeneous coordinates
+compact_geometry = BooleanVar()
+compact_geometry.set(False)
+# Write a PNG bitmap of every layer (mask based printers), its pixel size in mm and whether to pack them in a zip file
+mask_output = BooleanVar()
+mask_output.set(False)
+mask_pixel = DoubleVar()
+mask_pixel.set(0.004*25.4)
+mask_archive = BooleanVar()
+mask_archive.set(False)
+# Stream the path file (gzip) and the SVG files (one zip archive) of the outputs compressed
+compress_output = BooleanVar()
+compress_output.set(False)
+# Keep the parsed arrays of opened models in ~/.stl-slicer/meshcache so reopening a model maps them instead of parsing
+cache_meshes = BooleanVar()
+cache_meshes.set(True)
+mesh_cache = meshcache.MeshCache()
 
 # ****** Toolbar ******
 
@@ -496,6 +799,7 @@ window.config(menu=menu)
 subMenu = Menu(menu, tearoff=False)
 menu.add_cascade(label="File", menu=subMenu)
 subMenu.add_command(label="Open File", command=file_select)
+subMenu.add_command(label="Open Layer Data", command=layers_open)
 subMenu.add_command(label="Exit", command=window.destroy)
 
 # Create "Edit View" submenu
@@ -506,12 +810,20 @@ subMenu.add_cascade(label="View Type", menu=viewMenu)
 viewMenu.add_radiobutton(label='Wireframe', variable=view, value='wire')  # Full wireframe
 viewMenu.add_radiobutton(label='Hide Faces', variable=view, value='hide')  # Hide non-visible faces
 viewMenu.add_radiobutton(label='Partial Hidden', variable=view, value='grey')  # Grey hidden lines
+subMenu.add_checkbutton(label="Compact Geometry (float32)", variable=compact_geometry)  # Used for the next file
+subMenu.add_checkbutton(label="Cache Parsed Models", variable=cache_meshes)  # Map reopened models from the cache
+subMenu.add_checkbutton(label="Layer Masks (PNG)", variable=mask_output)  # Bitmap of every layer
+subMenu.add_checkbutton(label="Pack Masks in Zip", variable=mask_archive)  # One masks.zip instead of PNG files
+subMenu.add_checkbutton(label="Compress Outputs", variable=compress_output)  # path.csv.gz and svg.zip
 subMenu.add_command(label="Slicer Settings", command=save_click)
+subMenu.add_command(label="Machine Settings", command=machine_click)
 
 # Create "Help" submenu
 subMenu = Menu(menu, tearoff=False)
 menu.add_cascade(label="Slicer", menu=subMenu)
 subMenu.add_command(label="Run Slicer", command=lambda: DrawObject.slice_geometry(file_select.stlobject))
+subMenu.add_command(label="View Layers", command=layers_show)
+subMenu.add_command(label="View Model", command=lambda: DrawObject.plot(file_select.stlobject, display()))
 
 # Create "Help" submenu
 subMenu = Menu(menu, tearoff=False)
@@ -533,25 +845,29 @@ zaxis = Label(window, text="Z", font=("Helvetica", 16))
 zaxis.place(x=975, rely=0.6, anchor="c")
 
 # Rotation buttons layout
-x_l = Button(window, text="<-", width=5, command=lambda: DrawObject.plot_transform(file_select.stlobject, screen,
+x_l = Button(window, text="<-", width=5, command=lambda: DrawObject.plot_transform(file_select.stlobject, display(),
                                                                                    'rotation', [3, -90]))
 x_l.place(x=925, rely=.2, anchor="c")
-x_r = Button(window, text="->", width=5, command=lambda: DrawObject.plot_transform(file_select.stlobject, screen,
+x_r = Button(window, text="->", width=5, command=lambda: DrawObject.plot_transform(file_select.stlobject, display(),
                                                                                    'rotation', [3, 90]))
 x_r.place(x=1025, rely=.2, anchor="c")
-y_l = Button(window, text="<-", width=5, command=lambda: DrawObject.plot_transform(file_select.stlobject, screen,
+y_l = Button(window, text="<-", width=5, command=lambda: DrawObject.plot_transform(file_select.stlobject, display(),
                                                                                    'rotation', [1, -90]))
 y_l.place(x=925, rely=.40, anchor="c")
-y_r = Button(window, text="->", width=5, command=lambda: DrawObject.plot_transform(file_select.stlobject, screen,
+y_r = Button(window, text="->", width=5, command=lambda: DrawObject.plot_transform(file_select.stlobject, display(),
                                                                                    'rotation', [1, 90]))
 y_r.place(x=1025, rely=.40, anchor="c")
-z_l = Button(window, text="<-", width=5, command=lambda: DrawObject.plot_transform(file_select.stlobject, screen,
+z_l = Button(window, text="<-", width=5, command=lambda: DrawObject.plot_transform(file_select.stlobject, display(),
                                                                                    'rotation', [2, 90]))
 z_l.place(x=925, rely=.6, anchor="c")
-z_r = Button(window, text="->", width=5, command=lambda: DrawObject.plot_transform(file_select.stlobject, screen,
+z_r = Button(window, text="->", width=5, command=lambda: DrawObject.plot_transform(file_select.stlobject, display(),
                                                                                    'rotation', [2, -90]))
 z_r.place(x=1025, rely=.6, anchor="c")
 
+# ****** Layer Viewer Z Slider (shown while viewing the sliced layers) ******
+
+layer_scale = Scale(window, orient=HORIZONTAL, length=embed_w, showvalue=0, command=layers_draw)
+
 # ****** Status Bar ******
 
 status = Label(window, text="Waiting...", bd=1, relief=SUNKEN, anchor=W)
@@ -559,4 +875,8 @@ status.pack(side=BOTTOM, fill=X)
 
 # ****** Run Main GUI Loop ******
 
+# Close the window as soon as it is ready when started by the start up benchmark (python benchmark.py startup)
+if '--exit-when-ready' in sys.argv:
+    window.after_idle(window.destroy)
+
 window.mainloop()  # Main loop to run the GUI, waits for button input
@@ -24,6 +24,6 @@ exe = EXE(pyz,
           name='Slicer',
           debug=False,
           strip=False,
-          upx=True,
+          upx=False,
           runtime_tmpdir=None,
           console=False , icon='cube.ico')
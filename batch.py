@@ -0,0 +1,148 @@
+import argparse
+import csv
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import numpy as np
+import gtransform
+import job
+import meshcache
+import packing
+import patterns
+import streams
+from loader import Loader
+
+'''
+Batch slicing of many parts at their real size, run from the command line with a list of model files:
+    python batch.py part1.stl part2.stl part3.stl --output plates --workers 4
+ - load: reads the geometry of one model file, from the parsed mesh cache when it has the file (run on the worker
+         processes)
+ - place: moves a part onto the print bed at a packed position (optionally turned by 90 degrees about Z)
+ - bed_frame: converts model coordinates (Z up) to the print bed coordinates used by the slicing job
+ - slice_plate: slices the combined geometry of one plate into its own output directory (run on the worker processes)
+ - run: loads the models, packs their footprints onto as few plates as possible and slices the plates in parallel
+
+Models are not scaled: model units are millimetres and the model Z axis is the build direction. Each plate is written to
+its own directory (plate_1, plate_2, ...) under the output directory together with a plates.csv file listing where each
+part was placed.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+# Print bed dimensions in mm (same as the GUI): the plate is ZDIM long (print X) by XDIM wide (print Y), YDIM high
+XDIM = 8*25.4
+YDIM = 6*25.4
+ZDIM = 8*25.4
+
+
+def load(filename, cache=None):
+    model = Loader()
+    model.load(filename, cache=cache)
+    return model.geometry, model.normal, model.bounds
+
+
+def place(geometry, bounds, x, y, turned):
+    # Turn the part by 90 degrees about Z if required and move its footprint to (x, y) with its base on the bed (Z = 0)
+    mat = np.identity(4)
+    if turned:
+        mat = gtransform.rotation_matrix(3, 90)
+    low = gtransform.transform_bounds(bounds, mat)[0]
+    mat = mat.dot(gtransform.translation_matrix(x - low[0], y - low[1], -low[2]))
+    return gtransform.apply(geometry, mat)
+
+
+def bed_frame(geometry):
+    # Model (X, Y, Z up) to the slicing coordinates (screen X = print Y, screen Y = height, screen Z = print X)
+    return geometry[:, [1, 2, 0, 3]]
+
+
+def slice_plate(geometry, normal, outputdir, settings):
+    # Slice one plate with the settings dictionary (mm), returns the output directory and the per-layer report
+    height = float(np.max(geometry[:, 1]))  # Only slice up to the top of the tallest part on the plate
+    report = job.slice_model(geometry, normal, XDIM, height, ZDIM, settings['step'], settings['space'], outputdir,
+                             gap=settings['gap'], shells=settings['shells'], width=settings['width'],
+                             pattern=settings['pattern'], density=settings['density'], fit=False,
+                             tolerance=settings['tolerance'], streams=settings['streams'],
+                             resolution=settings['resolution'])
+    return outputdir, report
+
+
+def run(filenames, outputdir, workers, spacing, settings, cache=None):
+    start = time.perf_counter()
+    os.makedirs(outputdir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Read the models in parallel (cache: meshcache.MeshCache or None to always parse the files)
+        models = list(pool.map(partial(load, cache=cache), filenames))
+
+        # Pack the footprints (model X along the plate length, model Y across it) of the parts that are not too tall
+        sizes = np.array([bounds[1, 0:2] - bounds[0, 0:2] for _, _, bounds in models]).reshape((-1, 2))
+        heights = np.array([bounds[1, 2] - bounds[0, 2] for _, _, bounds in models])
+        low = heights <= YDIM
+        plate, position = np.full(len(models), -1), np.zeros((len(models), 2))
+        turned = np.zeros(len(models), dtype=bool)
+        plate[low], position[low], turned[low] = packing.shelf_pack(sizes[low], ZDIM, XDIM, spacing)
+        for i in np.flatnonzero(plate < 0):
+            print('Skipped {}: larger than the print bed'.format(filenames[i]))
+
+        # Combine the parts of each plate and slice the plates in parallel
+        futures = []
+        rows = []
+        for number, p in enumerate(np.unique(plate[plate >= 0]), start=1):
+            parts = np.flatnonzero(plate == p)
+            geometry = np.concatenate([place(models[i][0], models[i][2], position[i, 0], position[i, 1], turned[i])
+                                       for i in parts])
+            normal = np.concatenate([models[i][1] for i in parts])
+            platedir = os.path.join(outputdir, 'plate_{}'.format(number))
+            futures.append(pool.submit(slice_plate, bed_frame(geometry), normal, platedir, settings))
+            rows += [{'file': filenames[i], 'plate': number, 'x': round(position[i, 0]/25.4, 3),
+                      'y': round(position[i, 1]/25.4, 3), 'turned': int(turned[i])} for i in parts]
+
+        for future in futures:
+            platedir, report = future.result()
+            totals = job.summarize(report)
+            print('{}: {} layers ({} reused), {} segments, estimated print time {:.0f} s'.format(
+                platedir, len(report), totals.get('reused', 0), totals.get('segments', 0), totals.get('time', 0)))
+
+    # Record where every part was placed
+    with open(os.path.join(outputdir, 'plates.csv'), 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=['file', 'plate', 'x', 'y', 'turned'])
+        writer.writeheader()
+        writer.writerows(rows)
+    print('{} parts on {} plates in {:.1f} s'.format(len(rows), len(futures), time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack and slice many model files at their real size')
+    parser.add_argument('models', nargs='+', help='ASCII STL, OBJ, PLY or 3MF files (mm, Z up)')
+    parser.add_argument('--output', default='plates', help='directory for the plate output directories')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+    parser.add_argument('--part-spacing', type=float, default=0.2, help='clearance between parts (in)')
+    parser.add_argument('--slice-height', type=float, default=0.5, help='slice height (in)')
+    parser.add_argument('--infill-spacing', type=float, default=0.5, help='infill spacing (in)')
+    parser.add_argument('--gap', type=float, default=0.02, help='largest contour gap to close (in)')
+    parser.add_argument('--shells', type=int, default=1, help='number of perimeters')
+    parser.add_argument('--shell-spacing', type=float, default=0.02, help='spacing between perimeters (in)')
+    parser.add_argument('--pattern', default='grid', choices=patterns.PATTERNS, help='infill pattern')
+    parser.add_argument('--density', type=float, default=100, help='infill density (percent of the full grid)')
+    parser.add_argument('--grid', type=float, default=0.0,
+                        help='integer grid step for fixed point slicing (in, 0 = floating point)')
+    parser.add_argument('--compress', default='none', choices=sorted(streams.CODECS),
+                        help='compression of the path file, also packs the SVG files in svg.zip unless none')
+    parser.add_argument('--level', type=int, default=6, help='compression level (0-9)')
+    parser.add_argument('--buffer-size', type=int, default=1 << 20, help='output write buffer (bytes)')
+    parser.add_argument('--simplify', type=float, default=0.0, help='contour simplification tolerance (in)')
+    parser.add_argument('--mesh-cache', default=None,
+                        help='parsed model cache directory (default: ~/.stl-slicer/meshcache)')
+    parser.add_argument('--no-mesh-cache', action='store_true', help='always parse the model files')
+    args = parser.parse_args()
+    run(args.models, args.output, args.workers, args.part_spacing*25.4,
+        {'step': args.slice_height*25.4, 'space': args.infill_spacing*25.4, 'gap': args.gap*25.4,
+         'shells': max(args.shells, 1), 'width': args.shell_spacing*25.4, 'pattern': args.pattern,
+         'density': max(args.density, 1.0)/100, 'tolerance': max(args.simplify, 0.0)*25.4,
+         'resolution': args.grid*25.4 if args.grid > 0 else None,
+         'streams': None if args.compress == 'none' else
+         streams.OutputStreams(args.compress, args.level, args.buffer_size, archive=True)},
+        None if args.no_mesh_cache else meshcache.MeshCache(args.mesh_cache))
@@ -0,0 +1,320 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import gtransform
+import job
+import meshcache
+import motion
+import orient
+import slice
+import streams
+import zindex
+from loader import Loader
+
+'''
+Benchmarks for the slicer pipeline, run from the command line with a model file:
+    python benchmark.py storage model.stl
+    python benchmark.py motion outputs/path.csv
+    python benchmark.py zindex model.stl
+    python benchmark.py simplify model.stl --tolerance 0.002
+    python benchmark.py outputs model.stl --codec gzip --level 6 --buffer-size 1048576
+    python benchmark.py meshcache model.stl
+    python benchmark.py startup Slicer.py --limit 1.5
+ - storage: compares the default float64 Nx4 geometry storage with the compact float32 Nx3 storage (memory use,
+            transformation and slicing throughput) and checks that the sliced points agree within the slicer tolerance
+ - motion: throughput of the acceleration limited print time estimate for a path CSV file (X, Y, Z, On/Off rows with
+           or without the leading time column) compared with a constant speed estimate
+ - layer_query: time of single-layer slices through the facet height index compared with slicing every facet, and
+                checks that both give the same point pairs
+ - layer_sizes: number of path rows and bytes (path CSV rows and SVG file) of every layer of a job's outputs
+ - simplification: slices a model with and without contour simplification and reports the segments removed and the
+                   reduction of the output size of every layer
+ - output_size: number of files and bytes of the path and SVG outputs of a job's output directory
+ - compressed_outputs: slices a model with plain outputs and with streamed compressed outputs (path file through the
+                       codec and SVG files in one zip archive) and compares the wall time, files and bytes written
+ - cached_load: time to parse a model file compared with opening it from a parsed mesh cache (first access of the
+                mapped arrays included), for both storage types, and checks that the cached arrays equal the parsed ones
+ - import_profile: reads the output of python -X importtime into (module, own time, cumulative time) rows
+ - startup: time from launching the GUI script until its window is ready and the modules that take the longest to
+            import, failing (exit status 1) when the start up time is over the --limit in seconds
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+# Default print bed dimensions in mm (same as the GUI)
+XDIM = 8*25.4
+YDIM = 6*25.4
+ZDIM = 8*25.4
+
+
+def timed(func, *args, repeat=3):
+    # Best of "repeat" runs of func(*args), returns (seconds, result of the last run)
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def transform_chain(geometry, normal):
+    # Transformations run for every preview update: rotation, centering, bed fitting and projection
+    geometry, normal = gtransform.rotation(geometry, normal, 3, 90)
+    geometry, bounds = orient.to_origin(geometry)
+    geometry, bounds = orient.fit_bed(geometry, XDIM, YDIM, ZDIM, bounds)
+    gtransform.perspective(geometry)
+    return geometry, normal
+
+
+def slice_layers(geometry, normal, heights):
+    # Slice the geometry at each height the same way the slicing job does
+    geometry, normal = gtransform.rotation(geometry, normal, 1, 180)
+    geometry, _ = slice.geom_to_bed_coords(geometry, XDIM, YDIM, ZDIM)
+    return [slice.compute_points_on_z(geometry, z) for z in heights]
+
+
+def storage(filename, layers=10):
+    full = Loader()
+    full.load(filename)
+    compact = Loader()
+    compact.load(filename, compact=True)
+    num_faces = full.normal.shape[0]
+    heights = np.linspace(0.01, YDIM - 0.01, layers)
+
+    print('Model: {} ({} facets)'.format(filename, num_faces))
+    results = {}
+    for name, model in (('float64 Nx4', full), ('float32 Nx3', compact)):
+        geometry, bounds = orient.to_origin(model.geometry, model.bounds)
+        geometry, _ = orient.fit_bed(geometry, XDIM, YDIM, ZDIM, bounds)
+        size = model.geometry.nbytes + model.normal.nbytes
+        transform_time, _ = timed(transform_chain, geometry, model.normal)
+        slice_time, points = timed(slice_layers, geometry, model.normal, heights, repeat=1)
+        results[name] = points
+        print('{:12s} {:8.1f} bytes/facet  transform {:8.1f} Mfacets/s  slice {:8.1f} layers/s'.format(
+            name, size/num_faces, num_faces/transform_time/1e6, layers/slice_time))
+
+    # Compare the sliced point pairs layer by layer
+    tol = 0.005  # Slicer tolerance for unique points (0.005 mm = 5 micron)
+    worst = 0.0
+    mismatched = 0
+    for ref, test in zip(results['float64 Nx4'], results['float32 Nx3']):
+        if ref.shape != test.shape:
+            mismatched += 1
+            continue
+        if len(ref):
+            worst = max(worst, float(np.max(np.abs(np.sort(ref, axis=0) - np.sort(test, axis=0)))))
+    print('Slice output: max deviation {:.6f} mm, {} of {} layers with a different segment count -> {}'.format(
+        worst, mismatched, layers, 'OK' if worst < tol and mismatched == 0 else 'OUT OF TOLERANCE'))
+
+
+def motion_estimate(filename):
+    points = np.loadtxt(filename, delimiter=' ', ndmin=2)
+    if points.shape[1] == 5:
+        points = points[:, 1:]  # Drop the time column written by time_calc
+    machine = motion.Machine()
+    estimate_time, times = timed(motion.move_times, points, machine)
+    length = np.sqrt(np.sum(np.diff(points[:, 0:3], axis=0)**2, axis=1))
+    constant = np.sum(length/np.where(points[1:, 3] > 0, machine.print_speed, machine.travel_speed))
+    print('Path: {} ({} moves)'.format(filename, len(points) - 1))
+    print('Motion model {:8.2f} Mmoves/s  print time {:10.1f} s (constant speed estimate {:10.1f} s)'.format(
+        (len(points) - 1)/estimate_time/1e6, np.sum(times), constant))
+
+
+def layer_query(filename, layers=20):
+    model = Loader()
+    model.load(filename)
+    geometry, bounds = orient.to_origin(model.geometry, model.bounds)
+    geometry, _ = orient.fit_bed(geometry, XDIM, YDIM, ZDIM, bounds)
+    geometry, _ = gtransform.rotation(geometry, model.normal, 1, 180)
+    geometry, _ = slice.geom_to_bed_coords(geometry, XDIM, YDIM, ZDIM)
+    heights = np.linspace(0.01, YDIM - 0.01, layers)
+
+    build_time, index = timed(zindex.ZIndex, geometry, repeat=1)
+    full_time, full = timed(lambda: [slice.compute_points_on_z(geometry, z) for z in heights], repeat=1)
+    query_time, indexed = timed(lambda: [index.section(z) for z in heights])
+    cut = np.mean([len(index.query(z)) for z in heights])
+    same = all(np.array_equal(a, b) for a, b in zip(full, indexed))
+    print('Model: {} ({} facets, {:.0f} cut per layer on average)'.format(filename, len(index), cut))
+    print('Index built in {:.3f} s, layer {:8.2f} ms indexed vs {:8.2f} ms all facets ({:.0f}x) -> {}'.format(
+        build_time, query_time/layers*1e3, full_time/layers*1e3, full_time/query_time,
+        'OK' if same else 'DIFFERENT OUTPUT'))
+
+
+def layer_sizes(outputdir):
+    # {z (in): [path rows, bytes]} of the path CSV rows (grouped by their Z column) and SVG file of every layer
+    sizes = {}
+    with open(os.path.join(outputdir, 'path.csv')) as csvfile:
+        for line in csvfile:
+            z = float(line.split(' ')[3])  # Time, X, Y, Z, On/Off
+            size = sizes.setdefault(round(z, 3), [0, 0])
+            size[0] += 1
+            size[1] += len(line)
+    for name in os.listdir(outputdir):
+        if name.endswith('.svg'):
+            sizes.setdefault(float(name[:-4]), [0, 0])[1] += os.path.getsize(os.path.join(outputdir, name))
+    return sizes
+
+
+def simplification(filename, tolerance, step=0.1*25.4, space=0.5*25.4):
+    model = Loader()
+    model.load(filename)
+    geometry, bounds = orient.to_origin(model.geometry, model.bounds)
+    geometry, bounds = orient.fit_bed(geometry, XDIM, YDIM, ZDIM, bounds)
+    scratch = tempfile.mkdtemp()
+    try:
+        results = []
+        for tol in (0.0, tolerance):
+            outputdir = os.path.join(scratch, 'outputs')
+            start = time.perf_counter()
+            report = job.slice_model(geometry, model.normal, XDIM, YDIM, ZDIM, step, space, outputdir, bounds=bounds,
+                                     tolerance=tol)
+            results.append((time.perf_counter() - start, report, layer_sizes(outputdir)))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    (full_time, _, full), (simple_time, report, simple) = results
+    print('Model: {} (tolerance {:.4f} in)'.format(filename, tolerance/25.4))
+    print('{:>8s} {:>9s} {:>15s} {:>21s}'.format('z (in)', 'removed', 'path rows', 'bytes'))
+    for row in report:
+        if row['removed'] == 0:
+            continue
+        before, after = full.get(row['z'], [0, 0]), simple.get(row['z'], [0, 0])
+        print('{:8.3f} {:9d} {:7d} {:7d} {:10d} {:10d} ({:5.1f}% smaller)'.format(
+            row['z'], row['removed'], before[0], after[0], before[1], after[1],
+            100*(1 - after[1]/before[1]) if before[1] else 0.0))
+    before, after = np.sum(list(full.values()), axis=0), np.sum(list(simple.values()), axis=0)
+    print('Total: {} segments removed, {} -> {} path rows, {} -> {} bytes ({:.1f}% smaller), job {:.2f} s -> {:.2f} s'
+          .format(sum(row['removed'] for row in report), before[0], after[0], before[1], after[1],
+                  100*(1 - after[1]/before[1]), full_time, simple_time))
+
+
+def output_size(outputdir):
+    # (files, bytes) of the path and SVG outputs (plain or compressed)
+    names = [name for name in os.listdir(outputdir) if name.startswith('path.csv') or name.startswith('svg.zip') or
+             name.endswith('.svg')]
+    return len(names), sum(os.path.getsize(os.path.join(outputdir, name)) for name in names)
+
+
+def compressed_outputs(filename, codec, level, buffer_size, step=0.1*25.4, space=0.5*25.4):
+    model = Loader()
+    model.load(filename)
+    geometry, bounds = orient.to_origin(model.geometry, model.bounds)
+    geometry, bounds = orient.fit_bed(geometry, XDIM, YDIM, ZDIM, bounds)
+    outputs = streams.OutputStreams(codec, level, buffer_size, archive=True)
+    scratch = tempfile.mkdtemp()
+    try:
+        results = []
+        for name, stream in (('plain', None), (codec, outputs)):
+            outputdir = os.path.join(scratch, name)
+            start = time.perf_counter()
+            job.slice_model(geometry, model.normal, XDIM, YDIM, ZDIM, step, space, outputdir, bounds=bounds,
+                            streams=stream)
+            results.append((name, time.perf_counter() - start) + output_size(outputdir))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    print('Model: {} ({} level {}, {} byte buffer, {} kB of path and SVG data)'.format(
+        filename, codec, level, buffer_size, outputs.raw//1024))
+    for name, elapsed, files, size in results:
+        print('{:8s} job {:8.2f} s  {:6d} files  {:10d} bytes ({:5.1f}% of plain)'.format(
+            name, elapsed, files, size, 100*size/results[0][3]))
+
+
+def cached_load(filename, repeat=3):
+    scratch = tempfile.mkdtemp()
+    try:
+        cache = meshcache.MeshCache(scratch)
+        print('Model: {} ({:.1f} MB)'.format(filename, os.path.getsize(filename)/2**20))
+        for compact in (False, True):
+            parsed = Loader()
+            parse_time, _ = timed(parsed.load, filename, compact, repeat=repeat)
+            Loader().load(filename, compact, cache)  # Fill the cache
+
+            def reopen():
+                model = Loader()
+                model.load(filename, compact, cache)
+                return model, float(np.sum(model.geometry[:, 0:3]))  # Touch every page of the mapped geometry
+            cache_time, (cached, _) = timed(reopen, repeat=repeat)
+            same = np.array_equal(cached.geometry, parsed.geometry) and np.array_equal(cached.normal, parsed.normal)
+            print('{:8s} parse {:8.3f} s  cached {:8.3f} s  ({:6.1f}x faster, from cache: {}, equal: {})'.format(
+                'float32' if compact else 'float64', parse_time, cache_time, parse_time/max(cache_time, 1e-9),
+                cached.from_cache, same))
+        print('Cache: {} entries, {} bytes'.format(len(cache.entries()), sum(size for _, size, _ in cache.entries())))
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def import_profile(text):
+    # Rows of "import time: self [us] | cumulative | imported package", nested imports are indented under their parent
+    rows = []
+    for line in text.splitlines():
+        parts = line.split('|')
+        if not line.startswith('import time:') or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].rstrip()
+        rows.append((name.strip(), int(parts[0].split(':')[1])/1e6, int(parts[1])/1e6, len(name) - len(name.lstrip())))
+    return rows
+
+
+def startup(script, repeat=5, limit=None, top=10):
+    # Start the GUI in a new interpreter each time (cold imports) and close it as soon as its window is ready
+    command = [sys.executable, '-X', 'importtime', script, '--exit-when-ready']
+    best = float('inf')
+    profile = ''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run(command, stderr=subprocess.PIPE, universal_newlines=True,
+                                cwd=os.path.dirname(os.path.abspath(script)))
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            print('\n'.join(line for line in result.stderr.splitlines() if not line.startswith('import time:')))
+            raise SystemExit('{} exited with status {}'.format(script, result.returncode))
+        if elapsed < best:
+            best, profile = elapsed, result.stderr
+
+    # Top level imports of the profile (the script's own and the interpreter's) sorted by their cumulative import time
+    rows = import_profile(profile)
+    indent = min([level for _, _, _, level in rows] or [0])
+    imports = sorted([row for row in rows if row[3] == indent], key=lambda row: -row[2])
+    print('Start up: {} ready in {:.3f} s (best of {}), imports {:.3f} s'.format(
+        script, best, repeat, sum(row[2] for row in imports)))
+    for name, own, cumulative, _ in imports[:top]:
+        print('{:30s} {:8.1f} ms  ({:.1f} ms own)'.format(name, cumulative*1e3, own*1e3))
+    if limit is not None and best > limit:
+        raise SystemExit('Start up time {:.3f} s is over the limit of {:.3f} s'.format(best, limit))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='STL slicer benchmarks')
+    parser.add_argument('benchmark', choices=['storage', 'motion', 'zindex', 'simplify', 'outputs', 'meshcache',
+                                              'startup'])
+    parser.add_argument('model', help='model file (storage, zindex, simplify, outputs, meshcache), path CSV file '
+                                      '(motion) or GUI script (startup)')
+    parser.add_argument('--limit', type=float, default=None, help='largest allowed start up time (s)')
+    parser.add_argument('--tolerance', type=float, default=0.002, help='contour simplification tolerance (in)')
+    parser.add_argument('--codec', default='gzip', choices=sorted(streams.CODECS), help='path file compression')
+    parser.add_argument('--level', type=int, default=6, help='compression level (0-9)')
+    parser.add_argument('--buffer-size', type=int, default=1 << 20, help='output write buffer (bytes)')
+    args = parser.parse_args()
+    if args.benchmark == 'storage':
+        storage(args.model)
+    elif args.benchmark == 'motion':
+        motion_estimate(args.model)
+    elif args.benchmark == 'zindex':
+        layer_query(args.model)
+    elif args.benchmark == 'simplify':
+        simplification(args.model, args.tolerance*25.4)
+    elif args.benchmark == 'outputs':
+        compressed_outputs(args.model, args.codec, args.level, args.buffer_size)
+    elif args.benchmark == 'meshcache':
+        cached_load(args.model)
+    elif args.benchmark == 'startup':
+        startup(args.model, limit=args.limit)
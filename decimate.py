@@ -0,0 +1,63 @@
+import numpy as np
+
+'''
+Code to build a reduced level-of-detail mesh for the interactive preview window
+ - grid_size: computes the clustering cell size so that one cell covers a few pixels of the preview viewport
+ - cluster: vertex clustering decimation - snaps every vertex to a uniform 3D grid, keeps one representative vertex
+            per occupied cell and drops the faces that collapse or duplicate another face
+
+The reduced mesh is returned as row indices into the full resolution geometry and normal arrays rather than as a new
+set of coordinates. Any transformation applied to the full geometry (rotation, centering, bed scaling) is therefore
+automatically carried over to the preview and the slicer always keeps working on the full resolution data.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+def grid_size(geometry, view_w, view_h, pixels=2):
+    # Size the clustering grid to the preview viewport. The object is drawn to roughly fill the shorter side of the
+    # viewport, so dividing the largest object dimension by that many pixels gives the size of one pixel in model
+    # units. Details smaller than "pixels" screen pixels cannot be seen in the preview and are merged together.
+    extent = np.max(geometry[:, 0:3], axis=0) - np.min(geometry[:, 0:3], axis=0)  # Object X,Y,Z dimensions
+    cells = min(view_w, view_h)/pixels  # Number of grid cells across the longest object dimension
+
+    return max(float(np.max(extent))/cells, np.finfo(float).eps)
+
+
+def cluster(geometry, view_w, view_h, pixels=2, min_faces=5000):
+    # Decimate the geometry using vertex clustering on a grid sized to the viewport
+    # Returns the indices of the preview vertex rows (3 per face) and the index of the original face for each preview
+    # face so that the normals can be looked up from the full resolution normal array
+    num_faces = int((geometry.shape[0])/3)  # Every 3 points represents a single face (length/3)
+
+    # Small models are already cheap to draw - use the full resolution mesh for the preview
+    if num_faces <= min_faces:
+        return np.arange(geometry.shape[0]), np.arange(num_faces)
+
+    cell = grid_size(geometry, view_w, view_h, pixels)
+    points = geometry[:, 0:3]  # Specifically pull the X,Y,Z coordinates - ignore H
+
+    # Integer grid cell of every vertex, combined into a single key per cell
+    grid = np.floor((points - np.min(points, axis=0))/cell).astype(np.int64)
+    dims = np.max(grid, axis=0) + 1
+    keys = grid[:, 0] + dims[0]*(grid[:, 1] + dims[1]*grid[:, 2])
+
+    # First vertex in each occupied cell is the representative, "cell_id" maps every vertex to its cell
+    _, first, cell_id = np.unique(keys, return_index=True, return_inverse=True)
+    cell_id = cell_id.reshape((-1, 3))  # Cell of each of the 3 points of every face
+
+    # Drop faces that collapse to a line or a point (two or more corners in the same cell)
+    keep = ((cell_id[:, 0] != cell_id[:, 1]) & (cell_id[:, 1] != cell_id[:, 2]) &
+            (cell_id[:, 0] != cell_id[:, 2]))
+    faces = np.nonzero(keep)[0]
+
+    # Drop faces that now connect the same three cells as another face (same face regardless of corner order)
+    corners = np.sort(cell_id[faces], axis=1)
+    _, unique_face = np.unique(corners, axis=0, return_index=True)
+    faces = faces[np.sort(unique_face)]
+
+    vertex_index = first[cell_id[faces]].reshape(-1)  # Row of the representative vertex for each preview point
+
+    return vertex_index, faces
@@ -0,0 +1,177 @@
+import numpy as np
+from collections import deque
+
+'''
+Code to slice geometry on an integer grid so that the ends of the sliced segments match exactly instead of within a
+tolerance
+ - quantize: screen X,Y,Z coordinates of geometry positioned on the print bed as int64 multiples of the resolution (mm)
+ - plane: height of the slice plane for a slice at z (mm), in half grid units (2*height/resolution, always odd)
+ - section: integer X1,Y1,X2,Y2 point pairs of the facets cut by a slice plane (print bed X,Y like
+            slice.compute_points_on_z)
+ - build_contours: chains integer point pairs into X1,Y1,X2,Y2,contour_num contours by joining equal end points
+ - to_mm: converts integer point pairs or contours back to millimetres (the contour numbers are unchanged)
+ - infill: grid infill lines of contours (mm) with the crossings found by exact integer comparisons, same output as
+           slice.infill
+
+Slice planes and infill lines are moved to halfway between two grid points (by at most half a resolution step), so no
+vertex can ever lie on them: a facet is cut by a plane when its lowest vertex is below and its highest vertex above,
+and every facet cut by a plane gives exactly one point pair. The point where an edge crosses a plane is computed from
+the two vertices of the edge taken in a fixed order and rounded to the grid with integer arithmetic, so the two facets
+sharing an edge give the same integer point and the contours are joined by sorting the point coordinates instead of
+searching for points within a tolerance.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+def quantize(geometry, resolution):
+    # Round the X,Y,Z columns of the geometry (mm) to the nearest multiple of the resolution (mm)
+    return np.rint(np.asarray(geometry[:, 0:3], dtype=float)/resolution).astype(np.int64)
+
+
+def plane(z, resolution):
+    # Slice plane just above the grid height at or below z, in half grid units
+    return 2*int(np.floor(z/resolution)) + 1
+
+
+def section(points, height, faces=None):
+    # Point pairs (print X = screen Z, print Y = screen X) where the facets cross the plane at "height" (plane());
+    # faces are the numbers of the facets to slice (all of them if None, see zindex.ZIndex.query)
+    if faces is None:
+        faces = np.arange(len(points)//3)
+    corners = points[(3*np.asarray(faces, dtype=int)[:, None] + np.arange(3)).reshape(-1)].reshape((-1, 3, 3))
+    above = 2*corners[:, :, 1] > height
+    cut = np.any(above, axis=1) & ~np.all(above, axis=1)
+    corners, above = corners[cut], above[cut]
+
+    # The vertex alone on its side of the plane and the two edges from it that cross the plane
+    alone = np.where(np.sum(above, axis=1) == 1, np.argmax(above, axis=1), np.argmin(above, axis=1))
+    rows = np.arange(len(corners))
+    ends = []
+    for step in (1, 2):
+        p, q = corners[rows, alone], corners[rows, (alone + step) % 3]
+        # Lower vertex first so both facets of an edge compute the same point
+        swap = p[:, 1] > q[:, 1]
+        p, q = np.where(swap[:, None], q, p), np.where(swap[:, None], p, q)
+        rise, climb = 2*(q[:, 1] - p[:, 1]), height - 2*p[:, 1]
+        # Round p + (q - p)*climb/rise to the nearest grid point with integer division (rise > 0)
+        ends.append(np.column_stack([p[:, axis] + (2*(q[:, axis] - p[:, axis])*climb + rise)//(2*rise)
+                                     for axis in (2, 0)]))
+    pairs = np.hstack(ends)
+    # Drop point pairs that round to a single point (the plane passes within a grid step of a vertex), the contour
+    # still joins up through the neighbouring facets which end on that same point
+    return pairs[np.any(pairs[:, 0:2] != pairs[:, 2:4], axis=1)]
+
+
+def build_contours(pairs):
+    # Join the integer point pairs into contours (X1,Y1,X2,Y2,contour_num rows), open contours are left for
+    # repair.close_gaps like slice.build_contours
+    pairs = np.asarray(pairs, dtype=np.int64).reshape((-1, 4))
+    if len(pairs) == 0:
+        return np.empty((0, 5), dtype=np.int64)
+    # Number the distinct points (sort based join) and list the point pairs at every point
+    _, point = np.unique(pairs.reshape((-1, 2)), axis=0, return_inverse=True)
+    point = point.reshape((-1, 2))
+    order = np.argsort(point.reshape(-1), kind='stable')
+    start = np.searchsorted(point.reshape(-1)[order], np.arange(np.max(point) + 2)).tolist()
+    at = (order//2).tolist()
+    point = point.tolist()
+    used = [False]*len(pairs)
+
+    def next_pair(p):
+        # Unused point pair with an end at point p, returns (pair index, matched end) or None
+        for i in at[start[p]:start[p + 1]]:
+            if not used[i]:
+                return i, 0 if point[i][0] == p else 1
+        return None
+
+    loops = []
+    for first in range(len(pairs)):
+        if used[first]:
+            continue
+        used[first] = True
+        loop = deque([(first, 0)])  # (pair, end it is entered from)
+        head, tail = point[first]
+        while tail != head:
+            found = next_pair(tail)
+            if found is None:
+                break
+            used[found[0]] = True
+            loop.append(found)
+            tail = point[found[0]][1 - found[1]]
+        if tail != head:
+            # Open contour (crack in the mesh) - also extend backwards from the head of the contour
+            while True:
+                found = next_pair(head)
+                if found is None:
+                    break
+                used[found[0]] = True
+                loop.appendleft((found[0], 1 - found[1]))
+                head = point[found[0]][1 - found[1]]
+        loops.append(loop)
+
+    index = np.array([i for loop in loops for i, _ in loop])
+    flip = np.array([end for loop in loops for _, end in loop], dtype=bool)
+    rows = pairs[index]
+    rows[flip] = rows[flip][:, [2, 3, 0, 1]]
+    num = np.repeat(np.arange(1, len(loops) + 1), [len(loop) for loop in loops])
+    return np.column_stack((rows, num))
+
+
+def to_mm(rows, resolution):
+    # Integer point pairs or contours in millimetres
+    rows = np.asarray(rows).astype(float)
+    rows[:, 0:4] *= resolution
+    return rows
+
+
+def infill(pairs, direct, spacing, resolution, origin=None):
+    # Infill lines like slice.infill (direction 0 = X, 1 = Y) for contours in mm, with the lines halfway between grid
+    # points and the contours rounded to the grid so every line crosses a closed contour an even number of times
+    fill = []
+
+    if len(pairs) != 0:
+        grid = np.rint(np.asarray(pairs, dtype=float)[:, 0:4]/resolution).astype(np.int64)
+        a, b = grid[:, direct], grid[:, direct+2]
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        if origin is None:
+            origin = np.min(lo)*resolution
+        first = int(np.floor((np.min(lo)*resolution - origin)/spacing))  # First infill line at or below the points
+        num_passes = int((np.max(hi)*resolution - origin)/spacing) - first  # Number of infill lines
+        middle = np.min(lo) + np.max(hi)  # Middle of the contours in half grid units
+
+        def half_grid(k):
+            # Line k moved to the nearest half grid position. A line on a grid point (such as the line at the origin
+            # along the lowest wall) moves to the side its floating point position rounds to, or away from the middle
+            # of the contours when it is exactly on it, so a line on the first or last wall crosses the contours
+            # exactly when the strict crossing test of slice.infill does instead of always filling along the wall
+            position = origin + k*spacing
+            grid = np.rint(position/resolution).astype(np.int64)
+            side = np.sign(position - grid*resolution)
+            side = np.where(side == 0, np.where(2*grid < middle, -1, 1), side).astype(np.int64)
+            return np.where(np.abs(position/resolution - grid) < 1e-6, 2*grid + side,
+                            2*np.floor(position/resolution).astype(np.int64) + 1)
+
+        # Candidate lines of each segment (one extra on each side), kept when they cross it exactly
+        k_lo = np.floor((lo*resolution - origin)/spacing).astype(int) - 1
+        k_hi = np.ceil((hi*resolution - origin)/spacing).astype(int) + 1
+        counts = k_hi - k_lo + 1
+        segment = np.repeat(np.arange(len(grid)), counts)
+        k = np.repeat(k_lo, counts) + np.arange(len(segment)) - np.repeat(np.cumsum(counts) - counts, counts)
+        line = half_grid(k)  # Half grid units
+        cross = (2*lo[segment] < line) & (line < 2*hi[segment])
+        segment, k, line = segment[cross], k[cross], line[cross]
+        p1, p2 = grid[segment, 1-direct], grid[segment, 3-direct]
+        pts = (p1 + (line/2 - a[segment])*(p2 - p1)/(b[segment] - a[segment]))*resolution
+
+        # Sort points in order along each infill line to construct infill path lines
+        order = np.lexsort((pts, k))
+        k, pts = k[order], pts[order]
+        split = np.searchsorted(k, np.arange(first, first + num_passes + 2))
+        for fill_pass in range(num_passes+1):
+            loc = half_grid(first + fill_pass)/2*resolution
+            fill.append((loc, pts[split[fill_pass]:split[fill_pass+1]].tolist()))
+
+    return fill
@@ -7,6 +7,10 @@ Functions for the various geometric transformations and perspectives
  - Rotation (about all 3 axes)
  - Global scaling (s value)
  - Perspective (isometric)
+ - Axis-aligned bounding boxes (computed once, then carried through each transformation by its 8 corners)
+
+Geometry is either float64 Nx4 [x y z h] homogeneous coordinates or compact float32 Nx3 [x y z] coordinates, all
+transformations go through apply so both storage types are handled the same way
 
 Evan Chodora, 2018
 https://github.com/evanchodora/stl-slicer
@@ -25,59 +29,100 @@ def transform(geometry, normals, transtype, data):
     return geometry, normals
 
 
+# Transformation matrix matching transform() for updating cached bounding boxes
+def transform_matrix(transtype, data):
+    mat = np.identity(4)
+    if transtype == 'translate':
+        mat = translation_matrix(data[0], data[1], data[2])
+    if transtype == 'rotation':
+        mat = rotation_matrix(data[0], data[1])
+    if transtype == 'zoom':
+        mat = scale_matrix(data[0])
+    return mat
+
+
+# Apply a 4x4 transformation matrix (row vector convention) to homogeneous or compact geometry
+def apply(geometry, mat):
+    if geometry.shape[1] == 4:
+        return geometry.dot(mat)
+    # Compact geometry has an implied h = 1: multiply by the 3x3 linear part and add the translation row directly
+    mat = np.asarray(mat, dtype=geometry.dtype)
+    return geometry.dot(mat[0:3, 0:3]) + mat[3, 0:3]
+
+
+# Axis-aligned bounding box of the geometry as a 2x3 array: [[min X, min Y, min Z], [max X, max Y, max Z]]
+def bounding_box(geometry):
+    return np.array([np.min(geometry[:, 0:3], axis=0), np.max(geometry[:, 0:3], axis=0)], dtype=float)
+
+
+# Bounding box of the geometry after a transformation, found by transforming the 8 corners of the current box
+# Exact for translation, scaling and 90 degree rotations (the extents are just permuted and negated) and a conservative
+# box for general rotations, without rescanning every vertex of the geometry
+def transform_bounds(bounds, mat):
+    corners = np.array([[x, y, z] for x in bounds[:, 0] for y in bounds[:, 1] for z in bounds[:, 2]])
+    corners = apply(corners, mat)
+    return np.array([np.min(corners, axis=0), np.max(corners, axis=0)])
+
+
+# Translation matrix by x, y, z
+def translation_matrix(x, y, z):
+    return np.array([[1.0, 0.0, 0.0, 0.0],
+                     [0.0, 1.0, 0.0, 0.0],
+                     [0.0, 0.0, 1.0, 0.0],
+                     [x, y, z, 1.0]])
+
+
 # Translate geometry by x, y, z
 def translate(geometry, x, y, z):
-    geometry = geometry.dot(np.array([[1.0, 0.0, 0.0, 0.0],
-                                      [0.0, 1.0, 0.0, 0.0],
-                                      [0.0, 0.0, 1.0, 0.0],
-                                      [x, y, z, 1.0]]))
+    geometry = apply(geometry, translation_matrix(x, y, z))
     return geometry
 
 
-# Scale geometry globally
-def scale(geometry, s):
+# Global scaling matrix
+def scale_matrix(s):
     scale_mat = np.array([[1.0, 0.0, 0.0, 0.0],
                           [0.0, 1.0, 0.0, 0.0],
                           [0.0, 0.0, 1.0, 0.0],
                           [0.0, 0.0, 0.0, s]])
-    scale_mat = scale_mat/s  # Normalize such that s = 1 in the transformation matrix
-    geometry = geometry.dot(scale_mat)
+    return scale_mat/s  # Normalize such that s = 1 in the transformation matrix
+
+
+# Scale geometry globally
+def scale(geometry, s):
+    geometry = apply(geometry, scale_matrix(s))
     return geometry
 
 
-# Rotate geometry and the object outward normals about x, y, or z by an angle (in degrees)
-def rotation(geometry, normals, axis, ang):
+# Rotation matrix about x, y, or z by an angle (in degrees)
+def rotation_matrix(axis, ang):
     ang = m.radians(ang)  # Convert angle to radians for computation
     s = m.sin(ang)  # sine (radians)
     c = m.cos(ang)  # cosine (radians)
 
+    rot = np.identity(4)
     if axis == 1:  # Rotation about x-axis
-        geometry = geometry.dot(np.array([[1.0, 0.0,  0.0, 0.0],
-                                          [0.0, c,    s,   0.0],
-                                          [0.0, -1*s, c,   0.0],
-                                          [0.0, 0.0,  0.0, 1.0]]))
-        normals = normals.dot(np.array([[1.0, 0.0,  0.0, 0.0],
-                                        [0.0, c,    s,   0.0],
-                                        [0.0, -1*s, c,   0.0],
-                                        [0.0, 0.0,  0.0, 1.0]]))
+        rot = np.array([[1.0, 0.0,  0.0, 0.0],
+                        [0.0, c,    s,   0.0],
+                        [0.0, -1*s, c,   0.0],
+                        [0.0, 0.0,  0.0, 1.0]])
     if axis == 2:  # Rotation about y-axis
-        geometry = geometry.dot(np.array([[c,   0.0, -1*s, 0.0],
-                                          [0.0, 1.0, 0.0,  0.0],
-                                          [s,   0.0, c,    0.0],
-                                          [0.0, 0.0, 0.0,  1.0]]))
-        normals = normals.dot(np.array([[c,   0.0, -1*s, 0.0],
-                                        [0.0, 1.0, 0.0,  0.0],
-                                        [s,   0.0, c,    0.0],
-                                        [0.0, 0.0, 0.0,  1.0]]))
+        rot = np.array([[c,   0.0, -1*s, 0.0],
+                        [0.0, 1.0, 0.0,  0.0],
+                        [s,   0.0, c,    0.0],
+                        [0.0, 0.0, 0.0,  1.0]])
     if axis == 3:  # Rotation about z-axis
-        geometry = geometry.dot(np.array([[c,    s,   0.0, 0.0],
-                                          [-1*s, c,   0.0, 0.0],
-                                          [0.0,  0.0, 1.0, 0.0],
-                                          [0.0,  0.0, 0.0, 1.0]]))
-        normals = normals.dot(np.array([[c,    s,   0.0, 0.0],
-                                        [-1*s, c,   0.0, 0.0],
-                                        [0.0,  0.0, 1.0, 0.0],
-                                        [0.0,  0.0, 0.0, 1.0]]))
+        rot = np.array([[c,    s,   0.0, 0.0],
+                        [-1*s, c,   0.0, 0.0],
+                        [0.0,  0.0, 1.0, 0.0],
+                        [0.0,  0.0, 0.0, 1.0]])
+    return rot
+
+
+# Rotate geometry and the object outward normals about x, y, or z by an angle (in degrees)
+def rotation(geometry, normals, axis, ang):
+    rot = rotation_matrix(axis, ang)
+    geometry = apply(geometry, rot)
+    normals = apply(normals, rot)
     return geometry, normals
 
 
@@ -101,9 +146,7 @@ def perspective(geometry):
                      [0, 0, 0, 1]])
 
     # Apply transformations to the geometry for the chosen perspective
-    geometry = geometry.dot(rot_1)  # Rotation about Y
-    geometry = geometry.dot(rot_2)  # Rotation about X
-    geometry = geometry.dot(flat)  # Flatten to Z = 0
+    geometry = apply(geometry, rot_1.dot(rot_2).dot(flat))  # Rotation about Y, rotation about X, flatten to Z = 0
 
     # Apply same rotations to camera vector (but in the opposite order)
     camera = np.array([0, 0, -1, 1]).dot(rot_2)
@@ -0,0 +1,297 @@
+import os
+import shutil
+import time
+import numpy as np
+import gtransform
+import slice
+import fixedpoint
+import repair
+import nesting
+import offset
+import patterns
+import path
+import motion
+import layerstore
+import simplify
+import zindex
+
+'''
+Code to run a complete slicing job outside of the GUI so that it can be run on a background worker thread
+ - slice_heights: computes the z value of every slice through the print area for a given slice thickness
+ - slice_model: slices the geometry layer by layer and writes the SVG and path CSV outputs (and optionally a bitmap
+                mask of every layer), reporting progress after every layer and stopping when cancelled. The contours
+                can be simplified within a chord error tolerance before they are used (see the simplify module) and
+                the outputs streamed into compressed files (see the streams module). The geometry can also be
+                sliced on an integer grid with exact end point matching (see the fixedpoint module)
+ - grid_infill: X and Y grid infill lines of an island (floating point or integer grid slicing)
+ - shell_walls: offsets the island contours of a slice inwards to create the inner perimeter shells of every island
+ - summarize: totals of the per-layer report of a job for display
+
+Each island is printed as its outline at the sliced position followed by (shells - 1) inward perimeter shells spaced by
+the extrusion width, and the innermost shell is used as the boundary of the infill of the island. The infill is either
+the full X and Y grid or one of the sparse patterns of the patterns module at the selected density, and the print time
+saved compared to the full grid is reported for every layer.
+
+Outputs are written to a staging directory next to the output directory and only moved into place once the whole job
+has completed, so a cancelled or failed job leaves the previous contents of the output directory untouched.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+def slice_heights(h, step):
+    # Calculate the z value of each slice through the print area based on the slice thickness selected
+    num_steps = int(h/step)  # Calculate number of slices
+    heights = []
+    for level in range(num_steps+2):
+        offset = 0.01  # Negligible offset to handle rounding error with first and last slice (<0.001 in)
+        if level == num_steps + 1:
+            z = round(level * step - offset, 2)
+        else:
+            z = round(level * step + offset, 2)
+        heights.append(z)
+
+    return heights
+
+
+def slice_model(geometry, normal, xdim, ydim, zdim, step, space, outputdir='outputs', progress=None, cancel=None,
+                speed=1, bounds=None, gap=0.5, shells=1, width=0.5, pattern='grid', density=1.0, machine=None,
+                fit=True, store=None, masks=None, tolerance=0.0, streams=None, resolution=None,
+                reuse_layers=True):
+    # Slice the geometry and write the outputs, returns the per-layer report (list of dicts) or None if cancelled
+    # bounds is the cached bounding box of the geometry (computed from the geometry if not supplied)
+    # gap is the largest crack (mm) between contour ends that is bridged when repairing open contours
+    # shells is the number of perimeters of each island (including the outline) and width the spacing between them (mm)
+    # pattern is one of patterns.PATTERNS and density the infill length relative to the full grid at spacing "space"
+    # machine holds the motion limits used for the print time estimate (motion.Machine extruding at "speed" by default)
+    # fit scales and centres the geometry to fill the print bed, otherwise the geometry must already be in print bed
+    # coordinates at its real size (screen X across the bed, screen Y the height above the bed, screen Z along the bed)
+    # store is a layerstore.LayerStore that receives the sliced data of every layer (a new one is used if not supplied),
+    # it is saved to the "layers" directory of the outputs
+    # masks is a raster.MaskWriter that writes a bitmap of the closed contours of every layer to the "masks" directory
+    # tolerance is the chord error (mm) allowed when simplifying the contours, 0 keeps every sliced segment. The SVG
+    # outlines are then drawn from the simplified contours instead of the sliced segments
+    # streams is a streams.OutputStreams that writes the path and SVG outputs (compressed path file, SVG archive)
+    # instead of the plain path.csv file and one SVG file per layer
+    # resolution (mm) slices the geometry quantised to integer multiples of the resolution (e.g. 0.001 = 1 micron) with
+    # exact integer intersections, contour joining and grid infill crossings instead of the 0.005 mm tolerances
+    # Layers cutting the same vertical facets as the layer below reuse its contours and grid infill (prismatic parts),
+    # the "reused" column of the report marks them (reuse_layers=False computes every layer)
+    # progress(layers_done, num_layers, segments, elapsed) is called after every layer
+    # cancel is a threading.Event (or anything with is_set) checked before every layer
+
+    if machine is None:
+        machine = motion.Machine(print_speed=speed)
+    if store is None:
+        store = layerstore.LayerStore()
+
+    # Start from an empty staging directory for the outputs of this job
+    staging = outputdir + '.partial'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+
+    heights = slice_heights(ydim, step)
+    rows_stream = None  # Path rows (before the time column is added) when writing through the output streams
+    if streams is not None:
+        streams.start(staging)
+        rows_stream = streams.open('path_rows.csv')
+    if masks is not None:
+        masks.start(os.path.join(staging, 'masks'), zdim, xdim)  # Print X spans zdim and print Y spans xdim
+    start = time.perf_counter()
+    segments = 0  # Number of sliced segments so far (for throughput reporting)
+    report = []  # Per-layer statistics written to report.csv
+
+    if fit:
+        # Rotate the object around the X-axis by 180deg to align with print bed coordinate system
+        if bounds is None:
+            bounds = gtransform.bounding_box(geometry)
+        geometry, normal = gtransform.rotation(geometry, normal, 1, 180)
+        bounds = gtransform.transform_bounds(bounds, gtransform.rotation_matrix(1, 180))
+        # Position and size geometry on the print bed once for all of the layers
+        geometry, bounds = slice.geom_to_bed_coords(geometry, xdim, ydim, zdim, bounds)
+    # Index the height ranges of the facets so each layer only slices the facets it cuts
+    if resolution:
+        fixed = fixedpoint.quantize(geometry, resolution)  # Quantised once for all of the layers
+        index = zindex.ZIndex(fixed)
+        vertical = zindex.vertical_faces(fixed)
+    else:
+        index = zindex.ZIndex(geometry)
+        vertical = zindex.vertical_faces(geometry)
+    cached = None  # Facets cut by the last computed layer, its contours and islands and its grid infill of each island
+
+    # The output streams and the mask writer are closed on every exit (finished, cancelled or failed job)
+    try:
+        # Loop over the slices through the print area
+        for level, z in enumerate(heights):
+            if cancel is not None and cancel.is_set():
+                report = None
+                break
+
+            # A layer cutting the same facets as the last computed layer, all of them vertical, has the same
+            # cross-section (the part is a prism between the two heights), so its contours and grid infill are reused
+            height = fixedpoint.plane(z, resolution) if resolution else z
+            faces = index.query(height/2 if resolution else z)
+            reuse = reuse_layers and cached is not None and np.all(vertical[faces]) and np.array_equal(faces, cached[0])
+            if reuse:
+                (point_pairs, contour, open_contours, repaired, removed, loops, islands, origin, walls, boundaries,
+                 num_shells) = cached[1]
+                walls = list(walls)
+            else:
+                if resolution:
+                    # Integer point pairs joined into contours by their exact end points
+                    pairs = fixedpoint.section(fixed, height, faces)
+                    point_pairs = fixedpoint.to_mm(pairs, resolution)
+                    contour = fixedpoint.to_mm(fixedpoint.build_contours(pairs), resolution)
+                else:
+                    # Compute the clipped point pairs at the current slice z coordinate
+                    point_pairs = index.section(z, faces)
+                    # Run the contour building algorithm to sort the point pairs into continuous contour sets
+                    contour = slice.build_contours(point_pairs)
+                # Join the dangling ends of contours left open by cracks in the mesh
+                contour, open_contours, repaired = repair.close_gaps(contour, gap)
+                removed = 0  # Contour segments removed by the simplification
+                if tolerance > 0 and len(contour):
+                    simplified = simplify.contours(contour, tolerance)
+                    removed = len(contour) - len(simplified)
+                    contour = simplified
+
+                # Print island by island: each outer contour with its holes, followed by the infill inside that island
+                # only
+                loops = nesting.by_number(contour)
+                islands = nesting.islands(contour, open_contours)
+                origin = [0.0, 0.0]  # Infill grid origin shared by all islands of the slice
+                if len(point_pairs) != 0:
+                    origin = [min(np.min(point_pairs[:, 0]), np.min(point_pairs[:, 2])),
+                              min(np.min(point_pairs[:, 1]), np.min(point_pairs[:, 3]))]
+                walls, boundaries, num_shells = shell_walls(loops, islands, shells, width)
+                cached = (faces, (point_pairs, contour, open_contours, repaired, removed, loops, islands, origin,
+                                  list(walls), boundaries, num_shells), {})
+            fillx, filly, fill_segments = [], [], []
+            infill_time, grid_time = 0.0, 0.0  # Print time of the infill of this layer and of the full grid (s)
+            for i, (rows, boundary) in enumerate(zip(walls, boundaries)):
+                island_fillx, island_filly, island_segments = [], [], np.empty((0, 4))
+                if len(boundary) and pattern == 'grid':
+                    # Create infill paths (X and Y direction) inside the innermost shell
+                    if reuse:
+                        island_fillx, island_filly, island_time, full_time = cached[2][i]
+                    else:
+                        island_fillx, island_filly = grid_infill(boundary, space/density, origin, resolution)
+                        island_time = path.infill_time(island_fillx, island_filly, z, machine)
+                        full_time = island_time if density == 1 else path.infill_time(
+                            *grid_infill(boundary, space, origin, resolution), z, machine)
+                    cached[2][i] = (island_fillx, island_filly, island_time, full_time)
+                    infill_time += island_time
+                    grid_time += full_time
+                elif len(boundary):
+                    # Sparse patterns change from layer to layer, so they are always computed
+                    island_segments = patterns.fill(boundary, pattern, space, density, level, z)
+                    infill_time += path.infill_time([], [], z, machine, island_segments)
+                    grid_time += path.infill_time(*grid_infill(boundary, space, origin, resolution), z, machine)
+                # Create printer head path CSV file (outline, shells and infill pattern)
+                path.headpath(rows, island_fillx, island_filly, z, staging, fill_segments=island_segments,
+                              stream=rows_stream)
+                fillx += island_fillx
+                filly += island_filly
+                fill_segments.append(island_segments)
+            # Contours that are not part of an island (still open or too small to enclose an area) are printed last
+            leftover = sorted(set(loops) - set(num for island in islands for num in island))
+            if leftover:
+                rows = np.concatenate([loops[num] for num in leftover])
+                path.headpath(rows, [], [], z, staging, open_contours, stream=rows_stream)
+                walls.append(rows)
+
+            # Output the slices to svg files for confirmation/viewing (sliced segments and inner shells)
+            inner = [rows[rows[:, 4] > max(loops), 0:4] for rows in walls]
+            outline = point_pairs if tolerance <= 0 else np.reshape(contour, (-1, 5))[:, 0:4]
+            path.svgcreate(np.concatenate([outline] + inner), z, xdim, fillx, filly, staging,
+                           np.concatenate([np.empty((0, 4))] + fill_segments), streams)
+            if masks is not None:
+                # Exposed area of the layer: the closed contours of the islands (holes are left empty by the even-odd
+                # fill)
+                masks.add(z, np.concatenate([np.empty((0, 5))] + [loops[num] for island in islands
+                                                                  for num in island]))
+            store.append(z, segments=point_pairs, contours=np.concatenate([np.empty((0, 5))] + walls),
+                         infill=np.concatenate([layerstore.grid_segments(fillx, 0),
+                                                layerstore.grid_segments(filly, 1)] + fill_segments))
+            # Saved time is the infill print time saved compared to the full grid, both timed with the motion model
+            report.append({'z': round(z/25.4, 3), 'segments': len(point_pairs), 'islands': len(islands),
+                           'shells': num_shells, 'repaired': repaired, 'open': len(open_contours),
+                           'removed': removed, 'reused': int(reuse),
+                           'saved': round(max(grid_time - infill_time, 0.0), 2)})
+
+            segments += len(point_pairs)
+            if progress is not None:
+                progress(level + 1, len(heights), segments, time.perf_counter() - start)
+
+        if report is not None:
+            # Calculate time vector describing the head motion and add to the CSV file
+            if streams is not None:
+                streams.finish(rows_stream, count=False)
+            layer_times = path.time_calc(speed, staging, machine, streams)
+            for row, z in zip(report, heights):
+                row['time'] = round(layer_times.get(round(z/25.4, 4), 0.0), 2)  # Print time of the layer (s)
+            path.report_create(report, staging)
+            store.save(os.path.join(staging, 'layers'))
+    finally:
+        try:
+            if masks is not None:
+                masks.close()  # Wait for the last masks to be written (before a cancelled job is removed)
+        finally:
+            if streams is not None:
+                streams.close()  # Also closed when the mask writer failed
+    if report is None:
+        shutil.rmtree(staging, ignore_errors=True)  # Discard the partial outputs of a cancelled job
+        return None
+
+    # Replace the previous outputs with the completed job
+    shutil.rmtree(outputdir, ignore_errors=True)
+    os.rename(staging, outputdir)
+
+    return report
+
+
+def grid_infill(boundary, spacing, origin, resolution=None):
+    # X and Y grid infill lines inside the infill boundary of an island, on the integer grid with a resolution
+    if resolution:
+        return (fixedpoint.infill(boundary, 0, spacing, resolution, origin[0]),
+                fixedpoint.infill(boundary, 1, spacing, resolution, origin[1]))
+    return slice.infill(boundary, 0, spacing, origin[0]), slice.infill(boundary, 1, spacing, origin[1])
+
+
+def shell_walls(loops, islands, shells, width):
+    # Perimeters of the islands of a slice: the island contours followed by (shells - 1) inward shells spaced by
+    # "width", offset for all of the islands at once. Returns the contour array of the perimeters of each island, the
+    # contour array of the innermost shell of each island (the infill boundary, empty when the island is too thin) and
+    # the number of shell contours created
+    walls = [[loops[num] for num in island] for island in islands]
+    boundaries = [np.concatenate(wall) for wall in walls]
+    count = 0
+    if shells > 1 and len(islands) != 0:
+        island_of = {num: i for i, island in enumerate(islands) for num in island}
+        contours = np.concatenate(boundaries)
+        holes = [num for island in islands for num in island[1:]]
+        start = max(loops) + 1  # Shell contours are numbered after the sliced contours
+        for k in range(1, shells):
+            shell, source = offset.inset(contours, holes, k*width, start=start)
+            inner = [[] for _ in islands]
+            for num, loop in nesting.by_number(shell).items():
+                inner[island_of[source[int(num - start)]]].append(loop)
+            for i in range(len(islands)):
+                walls[i] += inner[i]
+                boundaries[i] = np.concatenate(inner[i]) if inner[i] else np.empty((0, 5))
+            start += len(source)
+            count += len(source)
+
+    return [np.concatenate(wall) for wall in walls], boundaries, count
+
+
+def summarize(report):
+    # Sum each numeric column of the per-layer report (except the z height)
+    totals = {}
+    for row in report:
+        for key, value in row.items():
+            if key != 'z':
+                totals[key] = totals.get(key, 0) + value
+    return totals
@@ -0,0 +1,103 @@
+import os
+import numpy as np
+
+'''
+Code to keep the sliced data of every layer of a job in a few contiguous arrays
+ - LayerStore: per-layer sliced segments, printed contours and infill segments stored one after the other in one
+               array per kind of data, with CSR offsets giving the rows of each layer (O(1) access to any layer as
+               array views)
+ - grid_segments: converts the (position, [start, end, ...]) lines of the X and Y grid infill into X1,Y1,X2,Y2 segments
+ - load: opens a saved layer store, memory-mapping the arrays so only the layers that are used are read from disk
+
+A store is saved as a directory of .npy files (z.npy, and <name>.npy and <name>_offsets.npy for each kind of data) so it
+can be memory-mapped by viewers and analysis tools without parsing the SVG or path CSV files.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+class LayerStore:
+    # Kinds of per-layer data and their number of columns (all in mm in print bed coordinates)
+    # segments: sliced point pairs (X1,Y1,X2,Y2), contours: printed perimeters (X1,Y1,X2,Y2,contour_num) and
+    # infill: infill segments (X1,Y1,X2,Y2)
+    FIELDS = {'segments': 4, 'contours': 5, 'infill': 4}
+
+    def __init__(self):
+        self.z = np.empty(0)
+        self.arrays = {name: np.empty((0, cols)) for name, cols in self.FIELDS.items()}
+        self.offsets = {name: np.zeros(1, dtype=np.int64) for name in self.FIELDS}
+        self.pending = []  # Layers appended since the arrays were last built: (z, {name: array})
+
+    def __len__(self):
+        return len(self.z) + len(self.pending)
+
+    def append(self, z, **layer):
+        # Add the next layer (missing kinds of data are stored as empty arrays)
+        self.pending.append((z, {name: np.asarray(layer.get(name, np.empty((0, cols))), dtype=float).reshape((-1, cols))
+                                 for name, cols in self.FIELDS.items()}))
+
+    def finish(self):
+        # Build the contiguous arrays and offsets from the appended layers
+        if not self.pending:
+            return self
+        self.z = np.r_[self.z, [z for z, _ in self.pending]]
+        for name in self.FIELDS:
+            parts = [layer[name] for _, layer in self.pending]
+            counts = [len(part) for part in parts]
+            self.offsets[name] = np.r_[self.offsets[name], self.offsets[name][-1] + np.cumsum(counts)].astype(np.int64)
+            self.arrays[name] = np.concatenate([self.arrays[name]] + parts)
+        self.pending = []
+        return self
+
+    def layer(self, i):
+        # Dictionary of name -> rows of layer i (views into the contiguous arrays, no copies)
+        if i >= len(self.z):
+            return self.pending[i - len(self.z)][1]
+        return {name: self.arrays[name][self.offsets[name][i]:self.offsets[name][i+1]] for name in self.FIELDS}
+
+    def height(self, i):
+        # Z value (mm) of layer i
+        return self.z[i] if i < len(self.z) else self.pending[i - len(self.z)][0]
+
+    def nearest(self, z):
+        # Index of the layer closest to height z (mm)
+        self.finish()
+        if len(self.z) == 0:
+            return -1
+        i = int(np.searchsorted(self.z, z))
+        return min([j for j in (i - 1, i) if 0 <= j < len(self.z)], key=lambda j: abs(self.z[j] - z))
+
+    def save(self, directory):
+        # Write the store as .npy files in the directory
+        self.finish()
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, 'z.npy'), self.z)
+        for name in self.FIELDS:
+            np.save(os.path.join(directory, name + '.npy'), self.arrays[name])
+            np.save(os.path.join(directory, name + '_offsets.npy'), self.offsets[name])
+
+
+def grid_segments(fill, direct):
+    # X1,Y1,X2,Y2 segments of grid infill lines (direct: lines at fixed X = 0, lines at fixed Y = 1)
+    lines = [(loc, pts) for loc, pts in fill if len(pts) > 1]
+    if not lines:
+        return np.empty((0, 4))
+    counts = np.array([len(pts)//2 for _, pts in lines])
+    loc = np.repeat([loc for loc, _ in lines], counts)
+    pts = np.concatenate([np.asarray(pts[:2*(len(pts)//2)]).reshape((-1, 2)) for _, pts in lines])
+    if direct == 0:
+        return np.column_stack((loc, pts[:, 0], loc, pts[:, 1]))
+    return np.column_stack((pts[:, 0], loc, pts[:, 1], loc))
+
+
+def load(directory, mmap=True):
+    # Open a saved layer store (memory-mapped read-only unless mmap is False)
+    mode = 'r' if mmap else None
+    store = LayerStore()
+    store.z = np.load(os.path.join(directory, 'z.npy'), mmap_mode=mode)
+    for name in LayerStore.FIELDS:
+        store.arrays[name] = np.load(os.path.join(directory, name + '.npy'), mmap_mode=mode)
+        store.offsets[name] = np.load(os.path.join(directory, name + '_offsets.npy'))
+    return store
@@ -0,0 +1,128 @@
+import numpy as np
+import threading
+import previewcache
+
+'''
+Code to draw the sliced layers of a job in the display window straight from a layer store (no SVG files are written or
+read) and to scrub through them with a Z slider
+ - extents: lower left and upper right corners (mm) of all of the sliced data of a layer store
+ - fit: scale and origin mapping print bed coordinates (mm) to pixels so the extents fill the display window
+ - rasterize: draws X1,Y1,X2,Y2 segments into a greyscale frame, all segments of a layer at once
+ - render_layer: greyscale frame of one layer (infill in grey under the printed contours in black)
+ - LayerViewer: frames of the layers of a store kept in a least recently used cache, with a background thread that
+                renders the layers on either side of the one being viewed before the slider reaches them
+
+Each segment is sampled at one point per pixel along its longest screen direction, so a whole layer is drawn with a few
+array operations whatever its number of segments. The frames are indexed [x][y] like the PyGame pixel array.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+def extents(store):
+    # Bounding box of the segments, contours and infill of every layer (print X, Y in mm)
+    store.finish()
+    low, high = np.full(2, np.inf), np.full(2, -np.inf)
+    for name in store.FIELDS:
+        data = store.arrays[name]
+        if len(data) == 0:
+            continue
+        points = np.asarray(data[:, 0:4]).reshape((-1, 2))
+        low, high = np.minimum(low, points.min(axis=0)), np.maximum(high, points.max(axis=0))
+    if not np.all(np.isfinite(low)):
+        return np.zeros(2), np.ones(2)
+    return low, high
+
+
+def fit(low, high, width, height, margin=20):
+    # Same scale in X and Y, centered in the window with a margin (pixels) on every side
+    size = np.maximum(high - low, 1e-9)
+    scale = min((width - 2*margin)/size[0], (height - 2*margin)/size[1])
+    origin = (low + high)/2 - np.array([width, height])/(2*scale)  # Print coordinates of the window's lower left
+    return scale, origin
+
+
+def rasterize(segments, frame, scale, origin, shade):
+    # Sample every segment at (about) one point per pixel and set those pixels to the shade
+    if len(segments) == 0:
+        return frame
+    width, height = frame.shape
+    ends = (np.asarray(segments[:, 0:4], dtype=float).reshape((-1, 2)) - origin)*scale
+    ends[:, 1] = height - 1 - ends[:, 1]  # +Y of the print bed is up on the screen
+    start, delta = ends[0::2], ends[1::2] - ends[0::2]
+
+    steps = np.ceil(np.max(np.abs(delta), axis=1)).astype(int) + 1  # Samples of each segment (both ends included)
+    seg = np.repeat(np.arange(len(steps)), steps)
+    first = np.r_[0, np.cumsum(steps)[:-1]]
+    t = (np.arange(len(seg)) - first[seg])/np.maximum(steps - 1, 1)[seg]  # Position of each sample along its segment
+    x = np.rint(start[seg, 0] + delta[seg, 0]*t).astype(int)
+    y = np.rint(start[seg, 1] + delta[seg, 1]*t).astype(int)
+    on_screen = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    frame[x[on_screen], y[on_screen]] = shade
+    return frame
+
+
+def render_layer(layer, scale, origin, width, height):
+    frame = np.full((width, height), 255, dtype=np.uint8)  # Clear to white
+    rasterize(layer['infill'], frame, scale, origin, 170)  # Infill in grey
+    # Printed contours in black (the sliced segments when the layer has no closed contours)
+    outline = layer['contours'] if len(layer['contours']) else layer['segments']
+    return rasterize(outline, frame, scale, origin, 0)
+
+
+class LayerViewer:
+    # Frames of the layers of a layer store with prefetching of the neighbouring layers
+
+    def __init__(self, store, width, height, radius=8, max_bytes=64*1024*1024):
+        self.store = store.finish()
+        self.width = width
+        self.height = height
+        self.radius = radius  # Layers rendered ahead on each side of the viewed layer
+        self.scale, self.origin = fit(*extents(store), width, height)  # Same view for every layer
+        self.cache = previewcache.PreviewCache(max_bytes)
+        self.wanted = None  # Layer index the prefetch thread works around
+        self.running = True
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self.prefetch, daemon=True)
+        self.thread.start()
+
+    def __len__(self):
+        return len(self.store)
+
+    def render(self, i):
+        frame = self.cache.get(i)
+        if frame is None:
+            frame = render_layer(self.store.layer(i), self.scale, self.origin, self.width, self.height)
+            self.cache.put(i, frame)
+        return frame
+
+    def frame(self, i):
+        # Frame of layer i (rendered now if it is not cached yet), then prefetch the layers around it
+        frame = self.render(i)
+        with self.condition:
+            self.wanted = i
+            self.condition.notify()
+        return frame
+
+    def prefetch(self):
+        # Render the nearest layers first (i+1, i-1, i+2, ...) and start again whenever the viewed layer changes
+        while True:
+            with self.condition:
+                while self.running and self.wanted is None:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                center, self.wanted = self.wanted, None
+            for step in range(1, self.radius + 1):
+                for i in (center + step, center - step):
+                    if self.wanted is not None or not self.running:
+                        break
+                    if 0 <= i < len(self.store) and i not in self.cache:
+                        self.render(i)
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
@@ -0,0 +1,335 @@
+import os
+import zipfile
+import xml.etree.ElementTree as ElementTree
+import numpy as np
+import gtransform
+
+'''
+Code to load model geometry from files into the arrays used by the viewer and slicer
+ - geometry: every row represents a point and every 3 rows represents a connected object face
+ - normal: one row per face with the outward normal vector of that face
+Both arrays are stored as float64 Nx4 [x y z h] homogeneous coordinates, or optionally as compact float32 Nx3 [x y z]
+arrays with the homogeneous coordinate implied (see gtransform.apply)
+ - Loader.load: reads a model file, choosing the format from the file extension (.obj, .ply, .3mf, otherwise STL), or
+                maps its arrays from a parsed mesh cache (see meshcache.py)
+ - Loader.load_stl: ASCII STL files (normals read from the file)
+ - Loader.load_obj: Wavefront OBJ files (vertex and face lines parsed in bulk, polygons split into triangles)
+ - Loader.load_ply: binary (little or big endian) and ASCII PLY files (binary data read with np.frombuffer)
+ - Loader.load_3mf: 3MF packages (vertex and triangle lists of the model parsed as a stream, build item and component
+                    transforms applied, converted to millimetres)
+ - triangulate: splits polygons of any number of vertices into triangles (fan from the first vertex)
+ - face_normals: unit normals of all triangles at once from the cross product of their edges
+
+The indexed formats store each shared vertex once with faces referring to it, they are expanded to the repeated
+vertices of the geometry array and given face normals computed from the vertex order (counter-clockwise = outward).
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+# STL file loader class
+class Loader:
+    # Initialize class variables
+    geometry = []
+    normal = []
+    name = []
+    normal_face = []
+    bounds = []  # Cached axis-aligned bounding box of the geometry (see gtransform.bounding_box)
+    from_cache = False  # Arrays memory-mapped from a meshcache.MeshCache instead of parsed from the file
+
+    # Load ASCII STL File (no Binary STLs - based on project requirements)
+    # compact = True stores the geometry and normals as float32 Nx3 [x y z] arrays (homogeneous coordinate implied)
+    def load_stl(self, filename, compact=False):
+        self.geometry = []  # Clear previous geometry data
+        self.name = []  # Clear previous STL model name
+        self.normal = []  # Clear previous STL normal data
+        triangle = []  # Initialize empty triangle set
+        fp = open(filename, 'r')  # Open and read selected file into memory
+
+        # Loop over each line in the STL file
+        for line in fp.readlines():
+            parts = line.split()  # Split line into parts by spaces
+            if len(parts) > 0:
+                # Start of filename, store embedded filename
+                if parts[0] == 'solid':
+                    self.name = line[6:-1]
+                # Beginning of a new face - store normals and begin new triangle variable
+                if parts[0] == 'facet':
+                    triangle = []
+                    # Select face normal components
+                    self.normal_face = (float(parts[2]), float(parts[3]), float(parts[4]), 1)
+                # Store all the vertex points in 'triangle'
+                if parts[0] == 'vertex':
+                    triangle.append((float(parts[1]), float(parts[2]), float(parts[3]), 1))
+                # End of face - append new face to the model data
+                if parts[0] == 'endloop':
+                    self.geometry.append([triangle[0], triangle[1], triangle[2]])
+                    self.normal.append(self.normal_face)
+        fp.close()
+        # Convert lists to numpy arrays of the correct dimensions (Nx4 matrices)
+        self.normal = np.asarray(self.normal).reshape((-1, 4))
+        self.geometry = np.asarray(self.geometry).reshape((-1, 4))
+        self.bounds = gtransform.bounding_box(self.geometry)  # Scanned once here, then updated with each transform
+        if compact:
+            self.to_compact()
+
+    # Load a model file of any supported format
+    # cache is a meshcache.MeshCache: files parsed before are memory-mapped from it and new ones are added to it
+    def load(self, filename, compact=False, cache=None):
+        self.from_cache = cache is not None and cache.restore(self, filename, compact)
+        if self.from_cache:
+            return
+        ext = os.path.splitext(filename)[1].lower()
+        loaders = {'.obj': self.load_obj, '.ply': self.load_ply, '.3mf': self.load_3mf}
+        loaders.get(ext, self.load_stl)(filename, compact)
+        if cache is not None:
+            cache.store(self, filename, compact)
+
+    # Load a Wavefront OBJ file (only the vertex "v" and face "f" lines are used)
+    def load_obj(self, filename, compact=False):
+        with open(filename, 'r') as fp:
+            lines = [line.split() for line in fp.read().splitlines()]  # Keyword and values separated by any whitespace
+        # Vertex lines in one bulk conversion (optional 4th w and colour values are dropped)
+        vertex_lines = [parts[1:4] for parts in lines if parts and parts[0] == 'v']
+        vertices = np.array(vertex_lines, dtype=float).reshape((-1, 3))
+        # Face lines: "f 1 2 3", "f 1/1 2/2 3/3" or "f 1/1/1 2//2 ..." with 1-based indices (negative indices count back
+        # from the end of the vertex list)
+        faces = [parts[1:] for parts in lines if parts and parts[0] == 'f']
+        counts = np.array([len(face) for face in faces], dtype=int)
+        indices = np.array([corner.split('/')[0] for face in faces for corner in face], dtype=int)
+        indices = np.where(indices < 0, len(vertices) + indices, indices - 1)
+        self.set_mesh(vertices, triangulate(counts, indices), os.path.splitext(os.path.basename(filename))[0], compact)
+
+    # Load a PLY file (binary little endian, binary big endian or ASCII)
+    def load_ply(self, filename, compact=False):
+        with open(filename, 'rb') as fp:
+            data = fp.read()
+        end = data.index(b'end_header') + len(b'end_header')
+        end = data.index(b'\n', end) + 1
+        header = data[:end].decode('ascii', 'replace').splitlines()
+
+        # Elements in file order: [name, count, [(property name, type) or (name, count type, index type)]]
+        fmt = None
+        elements = []
+        for line in header:
+            parts = line.split()
+            if not parts:
+                continue
+            if parts[0] == 'format':
+                fmt = parts[1]
+            elif parts[0] == 'element':
+                elements.append([parts[1], int(parts[2]), []])
+            elif parts[0] == 'property' and parts[1] == 'list':
+                elements[-1][2].append((parts[4], parts[2], parts[3]))
+            elif parts[0] == 'property':
+                elements[-1][2].append((parts[2], parts[1]))
+
+        if fmt == 'ascii':
+            vertices, counts, indices = ply_ascii(data[end:], elements)
+        else:
+            vertices, counts, indices = ply_binary(data, end, elements, '>' if fmt == 'binary_big_endian' else '<')
+        self.set_mesh(vertices, triangulate(counts, indices), os.path.splitext(os.path.basename(filename))[0], compact)
+
+    # Load a 3MF package (zip file with the model as XML in 3D/*.model)
+    def load_3mf(self, filename, compact=False):
+        with zipfile.ZipFile(filename) as package:
+            model = [name for name in package.namelist() if name.lower().endswith('.model')]
+            model = sorted(model, key=lambda name: name.lower() != '3d/3dmodel.model')[0]  # Root model part first
+            with package.open(model) as stream:
+                vertices, triangles = read_3mf(stream)
+        self.set_mesh(vertices, triangles, os.path.splitext(os.path.basename(filename))[0], compact)
+
+    # Expand an indexed triangle mesh (vertices Nx3, triangles Mx3 vertex indices) into the geometry and normal arrays
+    def set_mesh(self, vertices, triangles, name, compact=False):
+        corners = np.asarray(vertices, dtype=float)[np.asarray(triangles, dtype=int).reshape(-1)]
+        self.name = name
+        self.geometry = np.hstack((corners, np.ones((len(corners), 1))))
+        self.normal = np.hstack((face_normals(corners), np.ones((len(corners)//3, 1))))
+        self.bounds = gtransform.bounding_box(self.geometry) if len(corners) else np.zeros((2, 3))
+        if compact:
+            self.to_compact()
+
+    # Convert the geometry and normals to the compact float32 Nx3 representation
+    def to_compact(self):
+        self.geometry = np.ascontiguousarray(self.geometry[:, 0:3], dtype=np.float32)
+        self.normal = np.ascontiguousarray(self.normal[:, 0:3], dtype=np.float32)
+
+
+# NumPy types of the PLY property types
+PLY_TYPES = {'char': 'i1', 'uchar': 'u1', 'short': 'i2', 'ushort': 'u2', 'int': 'i4', 'uint': 'u4', 'float': 'f4',
+             'double': 'f8', 'int8': 'i1', 'uint8': 'u1', 'int16': 'i2', 'uint16': 'u2', 'int32': 'i4', 'uint32': 'u4',
+             'float32': 'f4', 'float64': 'f8'}
+
+# Scale of the 3MF model units to millimetres
+UNITS_3MF = {'micron': 0.001, 'millimeter': 1.0, 'centimeter': 10.0, 'inch': 25.4, 'foot': 304.8, 'meter': 1000.0}
+
+
+def triangulate(counts, indices):
+    # Triangles (Mx3 vertex indices) of polygons given as the number of vertices of each polygon and the flat list of
+    # their vertex indices, each polygon is split into a fan of triangles (0, j, j+1) around its first vertex
+    counts = np.asarray(counts, dtype=int)
+    indices = np.asarray(indices, dtype=int)
+    starts = np.cumsum(counts) - counts
+    fans = np.maximum(counts - 2, 0)  # Triangles of each polygon (lines and points give none)
+    poly = np.repeat(np.arange(len(counts)), fans)
+    j = np.arange(len(poly)) - np.repeat(np.cumsum(fans) - fans, fans) + 1  # Fan position 1 .. count - 2
+    first = starts[poly]
+    return np.column_stack((indices[first], indices[first + j], indices[first + j + 1]))
+
+
+def face_normals(corners):
+    # Unit normals of the triangles (every 3 rows of corners), zero for degenerate triangles
+    corners = corners[:, 0:3].reshape((-1, 3, 3))
+    normal = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    length = np.sqrt(np.sum(normal**2, axis=1))
+    return normal/np.where(length > 0, length, 1)[:, None]
+
+
+def ply_binary(data, offset, elements, order):
+    # Vertices and faces (counts and flat vertex indices) of a binary PLY file from the data after the header
+    vertices = np.empty((0, 3))
+    counts, indices = np.empty(0, dtype=int), np.empty(0, dtype=int)
+    for name, count, props in elements:
+        if all(len(prop) == 2 for prop in props):
+            # Fixed size records: read the whole element at once
+            dtype = np.dtype([(prop[0], order + PLY_TYPES[prop[1]]) for prop in props])
+            records = np.frombuffer(data, dtype, count, offset)
+            offset += dtype.itemsize*count
+            if name == 'vertex':
+                vertices = np.column_stack([records[axis].astype(float) for axis in ('x', 'y', 'z')])
+            continue
+        # Records with a list property (faces): when every list has the same length (usually all triangles) the records
+        # are fixed size too, which is checked from the count of the first record
+        offset, lists = ply_lists(data, offset, count, props, order)
+        if name == 'face':
+            counts, indices = lists
+    return vertices, counts, indices
+
+
+def ply_lists(data, offset, count, props, order):
+    # Read "count" records with list properties, returns the offset after them and the polygon sizes and flat vertex
+    # indices of the vertex index list
+    lists = [prop[0] for prop in props if len(prop) == 3]
+    key = 'vertex_indices' if 'vertex_indices' in lists else ('vertex_index' if 'vertex_index' in lists else lists[0])
+    if count == 0:
+        return offset, (np.empty(0, dtype=int), np.empty(0, dtype=int))
+
+    # Fixed size records with the list lengths of the first record (all triangles, all quads, ...), read at once
+    fields = []
+    position = offset
+    for prop in props:
+        if len(prop) == 2:
+            fields.append((prop[0], np.dtype(order + PLY_TYPES[prop[1]])))
+            position += fields[-1][1].itemsize
+        else:
+            count_type, index_type = np.dtype(order + PLY_TYPES[prop[1]]), np.dtype(order + PLY_TYPES[prop[2]])
+            size = int(np.frombuffer(data, count_type, 1, position)[0])
+            fields += [(prop[0] + '_count', count_type), (prop[0], index_type, (size,))]
+            position += count_type.itemsize + index_type.itemsize*size
+    dtype = np.dtype(fields)
+    if offset + dtype.itemsize*count <= len(data):
+        records = np.frombuffer(data, dtype, count, offset)
+        if all(np.all(records[name + '_count'] == dtype[name].shape[0]) for name in lists):
+            indices = records[key].astype(int).reshape(count, -1)
+            return offset + dtype.itemsize*count, (np.full(count, indices.shape[1]), indices.reshape(-1))
+
+    # Mixed list lengths (e.g. triangles and quads): read the records one at a time
+    counts, indices = [], []
+    for _ in range(count):
+        for prop in props:
+            if len(prop) == 2:
+                offset += np.dtype(PLY_TYPES[prop[1]]).itemsize
+                continue
+            count_type, index_type = np.dtype(order + PLY_TYPES[prop[1]]), np.dtype(order + PLY_TYPES[prop[2]])
+            size = int(np.frombuffer(data, count_type, 1, offset)[0])
+            values = np.frombuffer(data, index_type, size, offset + count_type.itemsize)
+            offset += count_type.itemsize + index_type.itemsize*size
+            if prop[0] == key:
+                counts.append(size)
+                indices.append(values)
+    return offset, (np.array(counts, dtype=int), np.concatenate(indices).astype(int))
+
+
+def ply_ascii(data, elements):
+    # Vertices and faces (counts and flat vertex indices) of an ASCII PLY file from the text after the header
+    lines = [line.split() for line in data.decode('ascii', 'replace').splitlines() if line.strip()]
+    vertices = np.empty((0, 3))
+    counts, indices = np.empty(0, dtype=int), np.empty(0, dtype=int)
+    start = 0
+    for name, count, props in elements:
+        rows = lines[start:start + count]
+        start += count
+        names = [prop[0] for prop in props]
+        if name == 'vertex':
+            columns = [names.index(axis) for axis in ('x', 'y', 'z')]
+            vertices = np.array([[row[i] for i in columns] for row in rows], dtype=float).reshape((-1, 3))
+        elif name == 'face' and count:
+            # The vertex index list is taken to be the first list of the record (scalar properties before it are
+            # skipped, anything after it is ignored)
+            first = [len(prop) for prop in props].index(3)
+            counts = np.array([int(row[first]) for row in rows], dtype=int)
+            indices = np.array([value for row, n in zip(rows, counts) for value in row[first + 1:first + 1 + n]],
+                               dtype=int)
+    return vertices, counts, indices
+
+
+def transform_3mf(text):
+    # 4x4 row-vector matrix of a 3MF transform attribute (12 values: the 3x3 linear part by rows, then the translation)
+    mat = np.identity(4)
+    if text:
+        mat[:, 0:3] = np.array(text.split(), dtype=float).reshape((4, 3))
+    return mat
+
+
+def read_3mf(stream):
+    # Vertices and triangles of the build items of a 3MF model part, parsed as a stream with the vertex and triangle
+    # elements cleared as soon as their attributes are stored
+    meshes = {}  # Object id -> (vertices, triangles)
+    components = {}  # Object id -> [(component object id, transform)]
+    items = []  # (object id, transform) of the build items
+    scale = 1.0
+    obj = None
+    for event, elem in ElementTree.iterparse(stream, events=('start', 'end')):
+        tag = elem.tag.rsplit('}', 1)[-1]  # Drop the XML namespace
+        if event == 'start':
+            if tag == 'model':
+                scale = UNITS_3MF.get(elem.get('unit', 'millimeter'), 1.0)
+            elif tag == 'object':
+                obj = elem.get('id')
+                coords, corners = [], []
+            continue
+        if tag == 'vertex':
+            coords += [elem.get('x'), elem.get('y'), elem.get('z')]
+            elem.clear()
+        elif tag == 'triangle':
+            corners += [elem.get('v1'), elem.get('v2'), elem.get('v3')]
+            elem.clear()
+        elif tag == 'mesh':
+            # Strings converted in bulk once the whole list has been read
+            meshes[obj] = (np.array(coords, dtype=float).reshape((-1, 3))*scale,
+                           np.array(corners, dtype=int).reshape((-1, 3)))
+        elif tag == 'component':
+            components.setdefault(obj, []).append((elem.get('objectid'), transform_3mf(elem.get('transform'))))
+        elif tag == 'item':
+            items.append((elem.get('objectid'), transform_3mf(elem.get('transform'))))
+    if not items:
+        items = [(obj, np.identity(4)) for obj in meshes]  # No build section: use every mesh as it is
+
+    # Place the meshes of the build items and their components (component transform first, then the parent's)
+    parts = []
+    pending = list(items)
+    while pending:
+        obj, mat = pending.pop(0)
+        if obj in meshes:
+            vertices, triangles = meshes[obj]
+            mat = mat.copy()
+            mat[3, 0:3] *= scale  # Translations are given in model units
+            parts.append((gtransform.apply(vertices, mat), triangles))
+        pending += [(child, child_mat.dot(mat)) for child, child_mat in components.get(obj, [])]
+
+    vertices = np.concatenate([np.empty((0, 3))] + [part[0] for part in parts])
+    offsets = np.cumsum([0] + [len(part[0]) for part in parts])
+    triangles = np.concatenate([np.empty((0, 3), dtype=int)] + [part[1] + start for part, start in zip(parts, offsets)])
+    return vertices, triangles
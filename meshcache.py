@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import shutil
+import numpy as np
+
+'''
+Code to keep the parsed geometry of model files on disk so that reopening a large model only maps its arrays instead of
+parsing the file again
+ - fingerprint: content hash of a model file from its size and evenly spaced blocks of its data (the whole file when it
+                is small), cheap enough to check on every open
+ - MeshCache: directory of parsed models, one entry per model file and storage type (float64 Nx4 or compact float32
+              Nx3) holding the geometry and normal arrays as uncompressed .npy files and a mesh.json file
+   - restore: fills a loader.Loader with the cached arrays of a file (memory-mapped copy-on-write, so the first access
+              of each page reads it from disk and changes are never written back), False when the file is not cached
+   - store: saves the arrays of a freshly parsed file and evicts the least recently used entries over the size limit
+
+Entries are found by the absolute path, size and modification time of the model file and are only used when the
+content hash stored with them still matches the file, so a file replaced with the same size and time is parsed again.
+Each use of an entry updates the modification time of its directory, which orders the entries for the LRU eviction.
+Entries are written to a temporary directory and renamed into place, so parallel loaders never see a partial entry.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+def fingerprint(filename, size, samples=16, block=1 << 16):
+    # BLAKE2 hash of the file size and "samples" blocks of "block" bytes spread from the start to the end of the file
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(filename, 'rb') as fp:
+        if size <= samples*block:
+            digest.update(fp.read())
+        else:
+            for offset in np.linspace(0, size - block, samples).astype(np.int64).tolist():
+                fp.seek(offset)
+                digest.update(fp.read(block))
+    return digest.hexdigest()
+
+
+class MeshCache:
+
+    def __init__(self, directory=None, max_bytes=2 << 30):
+        if directory is None:
+            directory = os.path.join(os.path.expanduser('~'), '.stl-slicer', 'meshcache')
+        self.directory = directory
+        self.max_bytes = max_bytes  # Largest total size of the cached arrays before the oldest entries are evicted
+        self.hits = 0
+        self.misses = 0
+
+    def entry(self, filename, compact):
+        # Directory of the entry of a model file, named by a hash of its path, size, time and storage type
+        stat = os.stat(filename)
+        key = '{}|{}|{}|{}'.format(os.path.abspath(filename), stat.st_size, stat.st_mtime_ns, bool(compact))
+        return os.path.join(self.directory, hashlib.blake2b(key.encode(), digest_size=16).hexdigest()), stat.st_size
+
+    def restore(self, model, filename, compact=False):
+        # Load the cached arrays of the file into the model, returns False if there is no valid entry
+        entry, size = self.entry(filename, compact)
+        try:
+            with open(os.path.join(entry, 'mesh.json')) as fp:
+                meta = json.load(fp)
+            if meta['fingerprint'] != fingerprint(filename, size):
+                shutil.rmtree(entry, ignore_errors=True)  # Same size and time but different content
+                self.misses += 1
+                return False
+            geometry = np.load(os.path.join(entry, 'geometry.npy'), mmap_mode='c')
+            normal = np.load(os.path.join(entry, 'normal.npy'), mmap_mode='c')
+            os.utime(entry)  # Most recently used
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return False
+        model.geometry, model.normal = geometry, normal
+        model.name = meta['name']
+        model.bounds = np.array(meta['bounds'], dtype=float).reshape((2, 3))
+        self.hits += 1
+        return True
+
+    def store(self, model, filename, compact=False):
+        # Save the parsed arrays of the model (errors such as a full disk only mean the file is not cached)
+        entry, size = self.entry(filename, compact)
+        temp = '{}.tmp{}'.format(entry, os.getpid())
+        try:
+            os.makedirs(temp, exist_ok=True)
+            np.save(os.path.join(temp, 'geometry.npy'), np.asarray(model.geometry))
+            np.save(os.path.join(temp, 'normal.npy'), np.asarray(model.normal))
+            with open(os.path.join(temp, 'mesh.json'), 'w') as fp:
+                json.dump({'path': os.path.abspath(filename), 'fingerprint': fingerprint(filename, size),
+                           'name': model.name if isinstance(model.name, str) else '',
+                           'bounds': np.asarray(model.bounds, dtype=float).tolist()}, fp)
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(temp, entry)
+        except OSError:
+            shutil.rmtree(temp, ignore_errors=True)
+            return False
+        self.evict(keep=entry)
+        return True
+
+    def entries(self):
+        # (last use, bytes, directory) of every entry, oldest first
+        found = []
+        if not os.path.isdir(self.directory):
+            return found
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if '.tmp' in name or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, item)) for item in os.listdir(path))
+                found.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue  # Removed by another process
+        return sorted(found)
+
+    def evict(self, keep=None):
+        # Remove the least recently used entries until the cache fits in max_bytes (the entry "keep" is never removed)
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path != keep:
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+        return total
@@ -0,0 +1,100 @@
+import numpy as np
+
+'''
+Codes to estimate the print time of a print head path with acceleration limits (trapezoidal velocity profiles)
+ - Machine: motion limits of the printer (per axis velocity and acceleration, junction deviation and the travel and
+            extrusion speeds)
+ - junction_speeds: largest speed allowed through the corner between consecutive moves (junction deviation model)
+ - look_ahead: limits the speed at every junction so the head can always accelerate and decelerate between junctions
+ - trapezoid_times: time of each move from its entry, exit and cruise speeds and its acceleration
+ - move_times: time of every move of a path array (X, Y, Z, On/Off rows)
+
+Everything works on whole path arrays. The look-ahead pass limits the speed at each junction by the junction speeds of
+all of the later (backward pass) and earlier (forward pass) junctions, which reduces to reverse and forward running
+minimums over the prefix sums of 2*acceleration*distance of the moves.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+class Machine:
+    # Motion limits of the printer in inches and seconds
+
+    def __init__(self, print_speed=1.0, travel_speed=4.0, max_velocity=(8.0, 8.0, 0.5), acceleration=(40.0, 40.0, 4.0),
+                 junction_deviation=0.002):
+        self.print_speed = print_speed  # Speed while extruding (in/s)
+        self.travel_speed = travel_speed  # Speed of moves with the extruder off (in/s)
+        self.max_velocity = np.asarray(max_velocity, dtype=float)  # X, Y, Z velocity limits (in/s)
+        self.acceleration = np.asarray(acceleration, dtype=float)  # X, Y, Z acceleration limits (in/s^2)
+        self.junction_deviation = junction_deviation  # Cornering tolerance (in)
+
+
+def axis_limit(direction, limits):
+    # Largest speed (or acceleration) along each unit direction that keeps every axis within its limit
+    with np.errstate(divide='ignore'):
+        return np.min(limits/np.abs(direction), axis=1)
+
+
+def junction_speeds(direction, accel, cruise, deviation):
+    # Speed limit at the start of every move (the junction with the previous move), zero at the first move
+    # Junction deviation model: the head is allowed to cut the corner along an arc that deviates from the corner point
+    # by at most "deviation", at the speed giving the acceleration limit as centripetal acceleration
+    cos_theta = -np.sum(direction[1:]*direction[:-1], axis=1)  # Cosine of the angle between the moves at the corner
+    sin_half = np.sqrt(np.clip((1 - cos_theta)/2, 0, 1))
+    with np.errstate(divide='ignore'):
+        v2 = np.where(sin_half < 1 - 1e-9, accel[1:]*deviation*sin_half/(1 - sin_half), np.inf)  # Straight = no limit
+    limit = np.sqrt(v2)
+    return np.r_[0.0, np.minimum(limit, np.minimum(cruise[1:], cruise[:-1]))]
+
+
+def look_ahead(junction, accel, length):
+    # Entry speed of every move and the exit speed of the last one (the head stops at the end of the path)
+    # Backward pass: v[j]^2 <= v[m]^2 + 2*a*(distance from j to m) for all later junctions m
+    # Forward pass: v[j]^2 <= v[m]^2 + 2*a*(distance from m to j) for all earlier junctions m
+    limit = np.r_[junction, 0.0]**2  # Junction limits including the stop at the end
+    reach = np.r_[0.0, np.cumsum(2*accel*length)]  # Prefix sums of 2*a*d at each junction
+    backward = np.minimum.accumulate((limit + reach)[::-1])[::-1] - reach
+    v2 = np.minimum(limit, backward)
+    forward = np.minimum.accumulate(v2 - reach) + reach
+    return np.sqrt(np.maximum(np.minimum(v2, forward), 0))
+
+
+def trapezoid_times(entry, exit_speed, cruise, accel, length):
+    # Accelerate from the entry speed to the cruise speed, cruise, then decelerate to the exit speed
+    # Moves too short to reach the cruise speed accelerate to a peak speed and decelerate immediately (triangle profile)
+    accel_dist = (cruise**2 - entry**2)/(2*accel)
+    decel_dist = (cruise**2 - exit_speed**2)/(2*accel)
+    peak = np.sqrt(np.maximum((2*accel*length + entry**2 + exit_speed**2)/2, 0))
+    triangle = accel_dist + decel_dist > length
+    top = np.where(triangle, np.minimum(peak, cruise), cruise)
+    cruise_dist = np.where(triangle, 0.0, length - accel_dist - decel_dist)
+    return (top - entry)/accel + (top - exit_speed)/accel + cruise_dist/cruise
+
+
+def move_times(points, machine):
+    # Time of every move to points[i] from points[i-1] (the first row is the start position, time 0)
+    # points is an array of X, Y, Z, On/Off rows: moves to a row with On = 1 extrude at the print speed and the others
+    # travel at the travel speed
+    times = np.zeros(len(points))
+    if len(points) < 2:
+        return times
+    delta = np.diff(points[:, 0:3], axis=0)
+    length = np.sqrt(np.sum(delta**2, axis=1))
+    moving = length > 1e-9  # Moves that return to the same position take no time
+    delta, length = delta[moving], length[moving]
+    if len(length) == 0:
+        return times
+    direction = delta/length[:, None]
+
+    # Cruise speed and acceleration of every move limited by every axis
+    requested = np.where(points[1:, 3][moving] > 0, machine.print_speed, machine.travel_speed)
+    cruise = np.minimum(requested, axis_limit(direction, machine.max_velocity))
+    accel = axis_limit(direction, machine.acceleration)
+
+    junction = junction_speeds(direction, accel, cruise, machine.junction_deviation)
+    speeds = look_ahead(junction, accel, length)
+    times[1:][moving] = trapezoid_times(speeds[:-1], speeds[1:], cruise, accel, length)
+
+    return times
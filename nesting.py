@@ -0,0 +1,226 @@
+import numpy as np
+
+'''
+Codes to build the nesting hierarchy (outer walls and holes) of the closed contours on a slice
+ - polygons: converts the closed contours into one vertex array with per-polygon offsets (CSR layout)
+ - candidate_pairs: bounding box pruning of (point, polygon) containment tests using a uniform grid over the slice
+ - box_pairs: overlapping pairs of boxes from two sets of bounding boxes using the same uniform grid pruning
+ - winding_numbers: vectorized winding number of many (point, polygon) pairs at once (signed ray crossings)
+ - points_in_polygons: vectorized even-odd crossing test of many (point, polygon) pairs at once
+ - hierarchy: finds the parent (smallest enclosing contour) and nesting depth of every closed contour
+ - islands: groups the contours into islands - an outer contour (even depth) together with its holes (odd depth)
+ - by_number: splits a contour array into the rows of each contour number, for selecting the contours of an island
+
+Everything is computed with whole-slice numpy arrays so slices with thousands of separate islands (lattices) stay fast.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+def polygons(contours, open_contours=()):
+    # Returns the contour numbers of the closed contours, their vertices (first point of every segment, Nx2) and the
+    # offsets of the first vertex of each polygon in the vertex array (length = number of polygons + 1)
+    if len(contours) == 0:
+        return np.empty(0), np.empty((0, 2)), np.zeros(1, dtype=int)
+    starts = np.flatnonzero(np.r_[True, np.diff(contours[:, 4]) != 0])  # First row of each contour
+    ends = np.r_[starts[1:], len(contours)]
+    nums = contours[starts, 4]
+    # Contours that could not be closed and slivers with less than 3 vertices do not enclose an area
+    keep = ~np.isin(nums, list(open_contours)) & (ends - starts >= 3)
+    starts, ends, nums = starts[keep], ends[keep], nums[keep]
+
+    counts = ends - starts
+    offsets = np.r_[0, np.cumsum(counts)].astype(int)
+    rows = np.repeat(starts - offsets[:-1], counts) + np.arange(offsets[-1])  # Contour rows of the kept polygons
+    return nums, contours[rows, 0:2], offsets
+
+
+def next_vertex(offsets):
+    # Index of the following vertex for every vertex, wrapping around at the end of each polygon
+    nxt = np.arange(offsets[-1]) + 1
+    if len(offsets) > 1:
+        nxt[offsets[1:] - 1] = offsets[:-1]
+    return nxt
+
+
+def signed_areas(vertices, offsets):
+    # Shoelace formula for every polygon at once (positive = counter-clockwise)
+    if len(offsets) < 2:
+        return np.empty(0)
+    nxt = next_vertex(offsets)
+    cross = vertices[:, 0]*vertices[nxt, 1] - vertices[nxt, 0]*vertices[:, 1]
+    return 0.5*np.add.reduceat(cross, offsets[:-1])
+
+
+def bounding_boxes(vertices, offsets):
+    # Min X, min Y, max X, max Y of every polygon
+    return np.column_stack((np.minimum.reduceat(vertices[:, 0], offsets[:-1]),
+                            np.minimum.reduceat(vertices[:, 1], offsets[:-1]),
+                            np.maximum.reduceat(vertices[:, 0], offsets[:-1]),
+                            np.maximum.reduceat(vertices[:, 1], offsets[:-1])))
+
+
+def expand(counts):
+    # For groups of the given sizes, returns the group of every element and the position of the element in its group
+    group = np.repeat(np.arange(len(counts)), counts)
+    position = np.arange(len(group)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return group, position
+
+
+def candidate_pairs(px, py, boxes):
+    # (point, polygon) pairs where the point lies inside the polygon bounding box
+    # Each polygon box is registered in the cells of a uniform grid that it overlaps, so each point is only compared
+    # with the boxes registered in its own cell instead of with every polygon on the slice
+    if len(px) == 0 or len(boxes) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    n = max(1, int(np.sqrt(len(boxes))))  # Grid of n x n cells
+    x0, y0 = np.min(boxes[:, 0]), np.min(boxes[:, 1])
+    cw = max((np.max(boxes[:, 2]) - x0)/n, 1e-9)  # Cell width
+    ch = max((np.max(boxes[:, 3]) - y0)/n, 1e-9)  # Cell height
+
+    def cell(v, origin, size):
+        return np.clip(((v - origin)/size).astype(int), 0, n - 1)
+
+    # Register every box in each cell it overlaps
+    cx0, cx1 = cell(boxes[:, 0], x0, cw), cell(boxes[:, 2], x0, cw)
+    cy0, cy1 = cell(boxes[:, 1], y0, ch), cell(boxes[:, 3], y0, ch)
+    nx = cx1 - cx0 + 1
+    poly, position = expand(nx*(cy1 - cy0 + 1))
+    cells = (cy0[poly] + position//nx[poly])*n + cx0[poly] + position % nx[poly]
+    order = np.argsort(cells, kind='stable')
+    cells, poly = cells[order], poly[order]
+    first = np.searchsorted(cells, np.arange(n*n), side='left')  # Range of registered boxes for each cell
+    last = np.searchsorted(cells, np.arange(n*n), side='right')
+
+    # Pair each point with the boxes registered in its cell, then keep the pairs where the point is inside the box
+    inside_grid = (px >= x0) & (px <= x0 + n*cw) & (py >= y0) & (py <= y0 + n*ch)
+    pc = np.where(inside_grid, cell(py, y0, ch)*n + cell(px, x0, cw), 0)
+    counts = np.where(inside_grid, last[pc] - first[pc], 0)
+    point, position = expand(counts)
+    polygon = poly[first[pc[point]] + position]
+    keep = ((px[point] >= boxes[polygon, 0]) & (px[point] <= boxes[polygon, 2]) &
+            (py[point] >= boxes[polygon, 1]) & (py[point] <= boxes[polygon, 3]))
+
+    return point[keep], polygon[keep]
+
+
+def box_pairs(first, second):
+    # (i, j) pairs where the boxes first[i] and second[j] overlap (min X, min Y, max X, max Y rows)
+    # Each box of "second" is registered in the cells of a uniform grid that it overlaps and each box of "first" is only
+    # compared with the boxes registered in the cells it overlaps
+    if len(first) == 0 or len(second) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    n = max(1, int(np.sqrt(len(second))))  # Grid of n x n cells
+    origin = np.min(second[:, 0:2], axis=0)
+    size = np.maximum((np.max(second[:, 2:4], axis=0) - origin)/n, 1e-9)  # Cell width and height
+
+    def cells(boxes):
+        # Box index and grid cell of every (box, cell) overlap and the lowest cell (X, Y) of every box
+        c0 = np.clip(((boxes[:, 0:2] - origin)/size).astype(int), 0, n - 1)
+        c1 = np.clip(((boxes[:, 2:4] - origin)/size).astype(int), 0, n - 1)
+        nx = c1[:, 0] - c0[:, 0] + 1
+        box, position = expand(nx*(c1[:, 1] - c0[:, 1] + 1))
+        return box, (c0[box, 1] + position//nx[box])*n + c0[box, 0] + position % nx[box], c0
+
+    registered, cell, low = cells(second)
+    order = np.argsort(cell, kind='stable')
+    registered, cell = registered[order], cell[order]
+    start = np.searchsorted(cell, np.arange(n*n), side='left')  # Range of registered boxes for each cell
+    stop = np.searchsorted(cell, np.arange(n*n), side='right')
+
+    # Pair each box with the boxes registered in its cells, each overlapping pair is kept once in the cell holding the
+    # low corner of the overlap
+    box, cell, c0 = cells(first)
+    pair, position = expand(stop[cell] - start[cell])
+    i, j, cell = box[pair], registered[start[cell[pair]] + position], cell[pair]
+    keep = ((cell % n == np.maximum(c0[i, 0], low[j, 0])) & (cell//n == np.maximum(c0[i, 1], low[j, 1])) &
+            np.all((first[i, 0:2] <= second[j, 2:4]) & (second[j, 0:2] <= first[i, 2:4]), axis=1))
+    return i[keep], j[keep]
+
+
+def winding_numbers(px, py, point, polygon, vertices, offsets, chunk=2000000):
+    # Winding number of polygon[k] around point[k] for every pair k (+1 inside a counter-clockwise polygon, -1 inside a
+    # clockwise one), vectorized over all of the polygon edges of all of the pairs (processed in chunks of about
+    # "chunk" edges to bound the memory use)
+    winding = np.zeros(len(point), dtype=int)
+    if len(point) == 0:
+        return winding
+    nxt = next_vertex(offsets)
+    counts = np.diff(offsets)[polygon]  # Number of edges to test for each pair
+    bounds = np.r_[0, np.cumsum(counts)]
+    start = 0
+    while start < len(point):
+        stop = max(np.searchsorted(bounds, bounds[start] + chunk, side='right') - 1, start + 1)
+        pair, position = expand(counts[start:stop])
+        v1 = offsets[polygon[start:stop]][pair] + position  # First vertex of each edge
+        v2 = nxt[v1]
+        x, y = px[point[start:stop]][pair], py[point[start:stop]][pair]
+        y1, y2 = vertices[v1, 1], vertices[v2, 1]
+        # Edge straddles the horizontal ray through the point and crosses it to the right of the point, counted +1
+        # going up and -1 going down
+        straddle = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xcross = vertices[v1, 0] + (y - y1)*(vertices[v2, 0] - vertices[v1, 0])/(y2 - y1)
+        crossings = np.where(straddle & (x < xcross), np.where(y2 > y1, 1, -1), 0)
+        winding[start:stop] = np.rint(np.bincount(pair, weights=crossings, minlength=stop - start)).astype(int)
+        start = stop
+
+    return winding
+
+
+def points_in_polygons(px, py, point, polygon, vertices, offsets, chunk=2000000):
+    # Even-odd crossing test of point[k] against polygon[k] for every pair k (odd number of crossings)
+    return winding_numbers(px, py, point, polygon, vertices, offsets, chunk) % 2 == 1
+
+
+def hierarchy(contours, open_contours=()):
+    # Returns the contour numbers of the closed contours, the index of the parent of each one (-1 for none), the nesting
+    # depth (0 = outermost) and the signed area
+    nums, vertices, offsets = polygons(contours, open_contours)
+    count = len(nums)
+    areas = signed_areas(vertices, offsets)
+    if count == 0:
+        return nums, np.empty(0, dtype=int), np.empty(0, dtype=int), areas
+    size = np.abs(areas)
+
+    # Test the first vertex of each polygon against every larger polygon whose bounding box contains it
+    px, py = vertices[offsets[:-1], 0], vertices[offsets[:-1], 1]
+    point, polygon = candidate_pairs(px, py, bounding_boxes(vertices, offsets))
+    larger = (size[polygon] > size[point]) | ((size[polygon] == size[point]) & (polygon < point))
+    point, polygon = point[larger], polygon[larger]
+    inside = points_in_polygons(px, py, point, polygon, vertices, offsets)
+    point, polygon = point[inside], polygon[inside]
+
+    # Depth is the number of enclosing polygons and the parent is the smallest of them
+    depth = np.bincount(point, minlength=count)
+    parent = np.full(count, -1)
+    order = np.lexsort((size[polygon], point))
+    point, polygon = point[order], polygon[order]
+    first = np.r_[True, point[1:] != point[:-1]] if len(point) else np.empty(0, dtype=bool)
+    parent[point[first]] = polygon[first]
+
+    return nums, parent, depth, areas
+
+
+def islands(contours, open_contours=()):
+    # Group the closed contours into islands: lists of contour numbers [outer, hole, hole, ...]
+    # Contours inside a hole start a new island of their own
+    nums, parent, depth, _ = hierarchy(contours, open_contours)
+    groups = {}
+    for i in range(len(nums)):
+        if depth[i] % 2 == 0:
+            groups.setdefault(i, []).insert(0, nums[i])
+        elif parent[i] >= 0:
+            groups.setdefault(parent[i], []).append(nums[i])
+
+    return [groups[i] for i in sorted(groups)]
+
+
+def by_number(contours):
+    # Dictionary of contour number -> X1,Y1,X2,Y2,contour_num rows of that contour
+    if len(contours) == 0:
+        return {}
+    starts = np.flatnonzero(np.diff(contours[:, 4])) + 1
+    return {loop[0, 4]: loop for loop in np.split(contours, starts)}
@@ -0,0 +1,337 @@
+import numpy as np
+import nesting
+
+'''
+Codes to offset the closed contours of an island inwards to create extra perimeter shells
+ - oriented_polygons: converts the island contours into polygons oriented so the material is on the left of each edge
+                      (outer walls counter-clockwise and holes clockwise)
+ - offset_polygons: moves every edge of every polygon to its left by the offset distance, vectorized over all of the
+                    edges of the slice, adding mitre, bevel or round joins at corners
+ - edge_pairs: pairs of edges with overlapping bounding boxes, found with a uniform grid over the slice
+ - split_edges: splits the edges at every point where they cross or touch another edge (including collinear overlaps)
+ - chain_loops: joins the split edges that were kept back into closed polygons by matching their end points
+ - segment_distance: distance from points to line segments (element by element, numpy broadcasting)
+ - nearest_distances: distance from every point to the nearest of the line segments within a given reach of it
+ - winding_filter: removes the self-intersections of the offset polygons of a slice (winding number filter) and the
+                   loops left where the shell is thinner than twice the offset
+ - inset: creates the contour array of one inward shell at a given distance from the closed contours of a slice
+
+Each offset polygon is described by its edges (start point and direction). Each corner is where the offset lines of
+two consecutive edges intersect. This raw offset intersects itself wherever the shell is thinner than twice the offset:
+edges shorter than the offset turn backwards into small loops, and edges that are not next to each other overlap
+across necks, slots and holes close to a wall.
+
+The self-intersections are cleaned up for the whole slice at once: the offset polygons are split at all of their
+intersections and only the pieces with material (a positive winding number counted over every offset polygon) on their
+left and none on their right are kept and joined again. A piece is also dropped when a source edge is closer to it than
+the source edge or vertex it was offset from (an offset larger than the inscribed circle of a convex part folds over
+into a smaller loop with the same orientation). A neck that is too thin splits its island into separate shells and the
+rest of the island is kept.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+def cross(a, b):
+    # Z component of the cross product of 2D vectors stored in rows
+    return a[:, 0]*b[:, 1] - a[:, 1]*b[:, 0]
+
+
+def oriented_polygons(contours, holes=()):
+    # Returns the polygon vertices (Nx2), CSR offsets and a hole flag for every polygon, with the outer contours
+    # ordered counter-clockwise and the holes clockwise
+    nums, vertices, offsets = nesting.polygons(contours)
+    is_hole = np.isin(nums, list(holes))
+    areas = nesting.signed_areas(vertices, offsets)
+    # Reverse polygons with the wrong orientation (reverse the vertex order within those polygons only)
+    flip = (areas < 0) != is_hole
+    poly, position = nesting.expand(np.diff(offsets))
+    reverse_position = np.diff(offsets)[poly] - 1 - position
+    order = offsets[poly] + np.where(flip[poly], reverse_position, position)
+
+    return vertices[order], offsets, is_hole
+
+
+def neighbours(poly):
+    # Index of the previous and next edge within each polygon (edges grouped by polygon in order, wrapping around)
+    counts = np.bincount(poly)
+    counts = counts[counts > 0]
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    group, position = nesting.expand(counts)
+    prev = starts[group] + (position - 1) % counts[group]
+    nxt = starts[group] + (position + 1) % counts[group]
+    return prev, nxt
+
+
+def corners(start, u, prev, distance):
+    # Intersection of the offset line of each edge with the offset line of the previous edge
+    normal = np.column_stack((-u[:, 1], u[:, 0]))  # Left hand normal of each edge
+    a = start[prev] + distance*normal[prev]  # Point on the offset line of the previous edge
+    b = start + distance*normal  # Point on the offset line of this edge
+    denom = cross(u[prev], u)
+    parallel = np.abs(denom) < 1e-9
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = np.where(parallel, 0.0, cross(b - a, u)/np.where(parallel, 1.0, denom))
+    return np.where(parallel[:, None], b, a + s[:, None]*u[prev])
+
+
+def offset_edges(start, end, u, prev, nxt, distance):
+    # Start and end point of the offset of every edge: the intersection with the neighbouring offset line at corners
+    # turning towards the offset side, or the edge end point moved along the normal at corners turning away from it
+    normal = np.column_stack((-u[:, 1], u[:, 0]))
+    outside = cross(u[prev], u) < -1e-9  # Right turn into the edge - the offset lines do not meet
+    point = corners(start, u, prev, distance)
+    first = np.where(outside[:, None], start + distance*normal, point)
+    last = np.where(outside[nxt][:, None], end + distance*normal, point[nxt])
+    return first, last, outside
+
+
+def offset_polygons(vertices, offsets, distance, join='mitre', limit=2.0, arc_step=np.pi/8):
+    # Offset all of the polygons to the left of their edges by "distance"
+    # join: 'mitre' (corners sharper than "limit" times the distance are bevelled), 'bevel' or 'round'
+    # Returns the offset vertices, CSR offsets and the index of the source polygon of every offset polygon
+    empty = np.empty((0, 2)), np.zeros(1, dtype=int), np.empty(0, dtype=int)
+    if len(offsets) < 2:
+        return empty
+    poly, _ = nesting.expand(np.diff(offsets))
+    start = vertices
+    end = vertices[nesting.next_vertex(offsets)]
+    length = np.hypot(*(end - start).T)
+    keep = length > 1e-9  # Drop zero length edges
+    start, end, length, poly = start[keep], end[keep], length[keep], poly[keep]
+    u = (end - start)/length[:, None]  # Unit direction of each edge
+
+    # Polygons with less than 3 edges left enclose no area
+    keep = np.bincount(poly)[poly] >= 3
+    start, end, u, poly = start[keep], end[keep], u[keep], poly[keep]
+    if len(poly) == 0:
+        return empty
+
+    # Corner points: the offset line intersection at inside corners, and a join at outside corners
+    prev, nxt = neighbours(poly)
+    first, last, outside = offset_edges(start, end, u, prev, nxt, distance)
+    adjacent = np.all(np.abs(end[prev] - start) < 1e-9, axis=1)  # Source edges still meet at a common vertex
+    normal = np.column_stack((-u[:, 1], u[:, 0]))
+    mitre = corners(start, u, prev, distance)
+    if join == 'mitre':
+        # Sharp corners stay sharp unless the mitre point is too far from the corner
+        sharp = outside & adjacent & (np.hypot(*(mitre - start).T) <= limit*distance)
+        outside &= ~sharp
+        first = np.where(sharp[:, None], mitre, first)
+    # Outside corners are joined with an arc around the source vertex (round) or a straight bevel (2 points)
+    sweep = np.arctan2(cross(normal[prev], normal), np.sum(normal[prev]*normal, axis=1))  # Negative (right turn)
+    steps = np.where(outside, 1, 0)
+    if join == 'round':
+        steps = np.where(outside & adjacent, np.maximum(np.ceil(np.abs(sweep)/arc_step), 1).astype(int), steps)
+    corner, position = nesting.expand(steps + 1)
+    theta = np.arctan2(normal[prev, 1], normal[prev, 0])[corner] + position/np.maximum(steps[corner], 1)*sweep[corner]
+    arc = start[corner] + distance*np.column_stack((np.cos(theta), np.sin(theta)))
+    previous_end = end[prev] + distance*normal[prev]  # End of the offset of the previous edge
+    result = np.where(((position == 0) & outside[corner])[:, None], previous_end[corner],
+                      np.where((position == steps[corner])[:, None], first[corner], arc))
+
+    # Source edge (offset edges) or vertex (joins, as a segment of length 0) that every offset edge was offset from
+    along = (position == steps[corner])[:, None]
+    generator = np.hstack((start[corner], np.where(along, end[corner], start[corner])))
+
+    # CSR offsets of the offset polygons
+    counts = np.bincount(poly[corner])
+    source = np.flatnonzero(counts)
+    new_offsets = np.r_[0, np.cumsum(counts[source])]
+
+    return winding_filter(result, new_offsets, source, generator, np.hstack((start, end)))
+
+
+def edge_pairs(start, end):
+    # (i, j) pairs of edges (i < j) whose bounding boxes overlap
+    boxes = np.hstack((np.minimum(start, end), np.maximum(start, end)))
+    i, j = nesting.box_pairs(boxes, boxes)
+    return i[i < j], j[i < j]
+
+
+def row_ids(rows):
+    # Index of the distinct row of every row (equal rows get the same index), from a sort of the columns
+    order = np.lexsort(rows.T[::-1])
+    distinct = np.r_[True, np.any(rows[order][1:] != rows[order][:-1], axis=1)]
+    ids = np.empty(len(rows), dtype=int)
+    ids[order] = np.cumsum(distinct) - 1
+    return ids
+
+
+def split_edges(start, end, tol=1e-9):
+    # Split every edge at the points where other edges cross it, end on it or overlap it (collinear), returns the start
+    # and end points of the pieces, the edge each piece comes from and whether each piece starts at a split point. A
+    # crossing point is computed once and used for both edges and the other split points are existing vertices, so the
+    # pieces meet at exactly equal points.
+    d = end - start
+    length = np.hypot(*d.T)
+    i, j = edge_pairs(start, end)
+    edge, t, point = [], [], []
+
+    def add(e, param, p, valid):
+        # Split edge e at the parameter if it is inside the edge (not within tol of its ends)
+        valid &= (param*length[e] > tol) & ((1 - param)*length[e] > tol)
+        edge.append(e[valid])
+        t.append(param[valid])
+        point.append(p[valid])
+
+    denom = cross(d[i], d[j])
+    w = start[j] - start[i]
+    parallel = np.abs(denom) <= 1e-12*length[i]*length[j]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ti = np.where(parallel, -1.0, cross(w, d[j])/np.where(parallel, 1.0, denom))
+        tj = np.where(parallel, -1.0, cross(w, d[i])/np.where(parallel, 1.0, denom))
+    hit = ~parallel & (ti*length[i] >= -tol) & ((1 - ti)*length[i] >= -tol)
+    hit &= (tj*length[j] >= -tol) & ((1 - tj)*length[j] >= -tol)
+    # Snap to the end point of an edge when the intersection is within tol of it (one edge ending on the other)
+    at_j = np.where((tj*length[j] <= tol)[:, None], start[j], end[j])
+    j_end = (tj*length[j] <= tol) | ((1 - tj)*length[j] <= tol)
+    at_i = np.where((ti*length[i] <= tol)[:, None], start[i], end[i])
+    i_end = (ti*length[i] <= tol) | ((1 - ti)*length[i] <= tol)
+    crossing = start[i] + ti[:, None]*d[i]
+    add(i, ti, np.where(j_end[:, None], at_j, crossing), hit)
+    add(j, tj, np.where(i_end[:, None], at_i, crossing), hit)
+
+    # Collinear overlaps: split each edge at the end points of the other that lie on it
+    collinear = parallel & (np.abs(cross(w, d[i])) <= tol*length[i])
+    for a, b in ((i, j), (j, i)):
+        for p in (start[b], end[b]):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                param = np.sum((p - start[a])*d[a], axis=1)/length[a]**2  # Not a number for edges of length 0
+            add(a, param, p, collinear.copy())
+
+    # Pieces between consecutive split points of every edge
+    splits = len(np.concatenate(edge))
+    edge = np.concatenate([np.arange(len(start))]*2 + edge)
+    t = np.concatenate([np.zeros(len(start)), np.ones(len(start))] + t)
+    point = np.concatenate([start, end] + point)
+    node = row_ids(point)
+    joint = np.isin(node, node[len(point) - splits:])
+    order = np.lexsort((t, edge))
+    edge, point, joint = edge[order], point[order], joint[order]
+    piece = (edge[1:] == edge[:-1]) & np.any(point[1:] != point[:-1], axis=1)
+    return point[:-1][piece], point[1:][piece], edge[:-1][piece], joint[:-1][piece]
+
+
+def chain_loops(start, end):
+    # Join the pieces into closed polygons (each piece starts at the end of the previous one), returns the index of the
+    # pieces of every loop in order. Chains left open (a piece dropped inside a sliver thinner than the rounding error)
+    # are joined to the open chain starting nearest to their end.
+    node = row_ids(np.vstack((start, end)))
+    head, tail = node[:len(start)], node[len(start):]
+    order = np.argsort(head, kind='stable')
+    first = np.searchsorted(head[order], np.arange(np.max(node) + 2)).tolist()
+    order, head, tail = order.tolist(), head.tolist(), tail.tolist()
+    used = [False]*len(start)
+    loops, chains = [], []
+    for piece in range(len(start)):
+        if used[piece]:
+            continue
+        loop = [piece]
+        used[piece] = True
+        while tail[loop[-1]] != head[piece]:
+            found = [k for k in order[first[tail[loop[-1]]]:first[tail[loop[-1]] + 1]] if not used[k]]
+            if not found:
+                break
+            loop.append(found[0])
+            used[found[0]] = True
+        (loops if tail[loop[-1]] == head[piece] else chains).append(loop)
+
+    while chains:
+        loop = chains.pop(0)
+        while True:
+            gaps = [np.hypot(*(start[chain[0]] - end[loop[-1]])) for chain in chains]
+            if not chains or np.hypot(*(start[loop[0]] - end[loop[-1]])) <= min(gaps):
+                break
+            loop += chains.pop(int(np.argmin(gaps)))
+        loops.append(loop)
+    return loops
+
+
+def segment_distance(points, segments):
+    # Distance from the points (..., 2) to the segments (..., 4 = X1,Y1,X2,Y2)
+    p = points - segments[..., 0:2]
+    d = segments[..., 2:4] - segments[..., 0:2]
+    t = np.clip(np.sum(p*d, axis=-1)/np.maximum(np.sum(d**2, axis=-1), 1e-18), 0, 1)
+    return np.hypot(*np.moveaxis(p - t[..., None]*d, -1, 0))
+
+
+def nearest_distances(points, segments, reach):
+    # Distance from every point to the nearest of the segments within "reach" of it (infinite when there is none)
+    # Only the (point, segment) pairs whose boxes overlap, the point box grown by its reach, are measured
+    nearest = np.full(len(points), np.inf)
+    i, j = nesting.box_pairs(np.hstack((points - reach[:, None], points + reach[:, None])),
+                             np.hstack((np.minimum(segments[:, 0:2], segments[:, 2:4]),
+                                        np.maximum(segments[:, 0:2], segments[:, 2:4]))))
+    np.minimum.at(nearest, i, segment_distance(points[i], segments[j]))
+    return nearest
+
+
+def winding_filter(vertices, offsets, source, generator, segments, tol=1e-9):
+    # Keep the parts of the offset polygons that bound the region with a positive winding number (material on the left
+    # of every kept edge and none on its right, counted over all of the offset polygons) and that are not closer to
+    # another source edge than to the edge or vertex they were offset from ("generator" of each offset edge, X1,Y1,X2,Y2
+    # rows of the source "segments"), then join them into polygons
+    empty = np.empty((0, 2)), np.zeros(1, dtype=int), np.empty(0, dtype=int)
+    if len(offsets) < 2:
+        return empty
+    poly, _ = nesting.expand(np.diff(offsets))
+    start, end, edge, joint = split_edges(vertices, vertices[nesting.next_vertex(offsets)], tol)
+    # Overlapping edges running the same way are kept once
+    unique = np.sort(np.unique(row_ids(np.hstack((start, end))), return_index=True)[1])
+    start, end, edge, joint = start[unique], end[unique], edge[unique], joint[unique]
+    # Points where more than two pieces meet (polygons touching at a vertex) also start a new run
+    node = row_ids(np.vstack((start, end)))
+    joint |= np.bincount(node)[node[:len(start)]] > 2
+
+    # The winding numbers on either side only change at split points, so the pieces of a polygon between two such
+    # points (a run) are tested together at the middle of their longest piece, just to its left and just to its right
+    d = end - start
+    length = np.hypot(*d.T)
+    run = np.cumsum(joint | np.r_[True, poly[edge[1:]] != poly[edge[:-1]]]) - 1
+    order = np.lexsort((-length, run))
+    probe = order[np.r_[True, run[order][1:] != run[order][:-1]]]
+    step = np.minimum(1e-3*length[probe], 1e-9)[:, None]*np.column_stack((-d[probe, 1], d[probe, 0]))
+    step /= length[probe][:, None]
+    middle = (start[probe] + end[probe])/2
+    px, py = np.r_[middle[:, 0] + step[:, 0], middle[:, 0] - step[:, 0]], np.r_[middle[:, 1] + step[:, 1],
+                                                                                middle[:, 1] - step[:, 1]]
+    point, polygon = nesting.candidate_pairs(px, py, nesting.bounding_boxes(vertices, offsets))
+    winding = nesting.winding_numbers(px, py, point, polygon, vertices, offsets)
+    winding = np.rint(np.bincount(point, weights=winding, minlength=len(px))).astype(int)
+    own = segment_distance(middle, generator[edge[probe]])
+    keep = (winding[:len(probe)] >= 1) & (winding[len(probe):] <= 0)
+    keep &= nearest_distances(middle, segments, own) >= own - 1e-6*np.maximum(own, 1)
+    keep = keep[run]
+    start, end, edge = start[keep], end[keep], edge[keep]
+    if len(start) == 0:
+        return empty
+
+    # Join the kept pieces, dropping slivers, and list the polygons in the order of their source polygons
+    loops = [loop for loop in chain_loops(start, end) if len(loop) >= 3]
+    counts = np.array([len(loop) for loop in loops], dtype=int)
+    result = start[np.concatenate(loops)] if loops else np.empty((0, 2))
+    new_offsets = np.r_[0, np.cumsum(counts)].astype(int)
+    valid = np.abs(nesting.signed_areas(result, new_offsets)) > 1e-9
+    loop_source = source[poly[edge[[loop[0] for loop in loops]]]] if loops else np.empty(0, dtype=int)
+    order = np.flatnonzero(valid)[np.argsort(loop_source[valid], kind='stable')]
+    group, position = nesting.expand(counts[order])
+    result = result[new_offsets[order][group] + position]
+    return result, np.r_[0, np.cumsum(counts[order])].astype(int), loop_source[order]
+
+
+def inset(contours, holes, distance, join='mitre', start=1):
+    # Shell "distance" inside the closed contours, where "holes" are the contour numbers of the holes
+    # Returns the contour array of the shell (X1,Y1,X2,Y2,contour_num, numbered from "start") and the contour number of
+    # the source contour of each shell contour
+    nums, _, _ = nesting.polygons(contours)
+    vertices, offsets, _ = oriented_polygons(contours, holes)
+    vertices, offsets, source = offset_polygons(vertices, offsets, distance, join)
+    if len(vertices) == 0:
+        return np.empty((0, 5)), np.empty(0)
+    nxt = nesting.next_vertex(offsets)
+    poly, _ = nesting.expand(np.diff(offsets))
+
+    return np.column_stack((vertices, vertices[nxt], poly + start)), nums[source]
@@ -1,4 +1,3 @@
-import numpy as np
 import gtransform
 
 '''
@@ -11,26 +10,33 @@ echodor@clemson.edu
 '''
 
 
-def to_origin(geometry):
+def to_origin(geometry, bounds=None):
+    # Returns the moved geometry and its bounding box (computed from the geometry if no cached box is supplied)
+    if bounds is None:
+        bounds = gtransform.bounding_box(geometry)
 
     # Compute object dimensions and distance from the origin
-    max_size = np.max(geometry, axis=0)  # Max X,Y,Z values of the object
-    min_size = np.min(geometry, axis=0)  # Min X,Y,Z values of the object
+    min_size, max_size = bounds  # Min and max X,Y,Z values of the object
     x_trans = 0 - 0.5*(max_size[0]+min_size[0])  # Avg X distance from the origin (center of the object)
     y_trans = 0 - 0.5*(max_size[1]+min_size[1])  # Avg Y distance from the origin (center of the object)
     z_trans = 0 - 0.5*(max_size[2]+min_size[2])  # Avg Z distance from the origin (center of the object)
-    geometry = gtransform.translate(geometry, x_trans, y_trans, z_trans)  # Translate object accordingly to origin
+    mat = gtransform.translation_matrix(x_trans, y_trans, z_trans)
+    geometry = gtransform.apply(geometry, mat)  # Translate object accordingly to origin
 
-    return geometry
+    return geometry, gtransform.transform_bounds(bounds, mat)
 
 
-def fit_bed(geometry, xdim, ydim, zdim):
+def fit_bed(geometry, xdim, ydim, zdim, bounds=None):
+    # Returns the scaled geometry and its bounding box (computed from the geometry if no cached box is supplied)
+    if bounds is None:
+        bounds = gtransform.bounding_box(geometry)
 
     # Scale object to fit in printing space (8in x 8in x 6in)
-    max_size = np.max(geometry, axis=0)  # Max X,Y,Z values of the object
+    max_size = bounds[1]  # Max X,Y,Z values of the object
 
     # Compute object scaling based on the minimum ratio between the print bed dimensions and the object size
     scale = min(xdim/max_size[0], ydim/max_size[1], zdim/max_size[2])
-    geometry = gtransform.scale(geometry, 1 / scale)  # Apply global scaling with appropriate factor
+    mat = gtransform.scale_matrix(1 / scale)
+    geometry = gtransform.apply(geometry, mat)  # Apply global scaling with appropriate factor
 
-    return geometry
+    return geometry, gtransform.transform_bounds(bounds, mat)
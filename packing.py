@@ -0,0 +1,60 @@
+import numpy as np
+
+'''
+Code to pack the footprints of several parts onto as few print beds (plates) as possible
+ - shelf_pack: first fit decreasing height shelf packing of rectangles onto plates, turning parts by 90 degrees when
+               that lets them lie with their long side along the shelves
+
+Parts are sorted from tallest to shortest footprint and placed left to right along horizontal shelves. Each part goes on
+the first shelf (of the first plate) with enough room, otherwise a new shelf is opened above the last one of the first
+plate with enough height left, otherwise a new plate is started.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+def shelf_pack(sizes, width, height, spacing=0.0):
+    # sizes is an Nx2 array of part footprints (size along the plate width, size along the plate height)
+    # Returns the plate number (-1 for parts too large for an empty plate), the X and Y position of the lower left
+    # corner of each part and whether the part was turned by 90 degrees (its footprint is then swapped)
+    sizes = np.asarray(sizes, dtype=float).reshape((-1, 2))
+    count = len(sizes)
+    plate = np.full(count, -1)
+    position = np.zeros((count, 2))
+    # Lie long side along the shelves when the part still fits across the plate that way
+    turned = (sizes[:, 1] > sizes[:, 0]) & (sizes[:, 1] <= width)
+    # Turn parts that only fit across the plate the other way
+    turned |= (sizes[:, 0] > width) & (sizes[:, 1] <= width) & (sizes[:, 0] <= height)
+    footprint = np.where(turned[:, None], sizes[:, ::-1], sizes) + spacing  # Each part keeps "spacing" clear
+    fits = (footprint[:, 0] <= width + spacing) & (footprint[:, 1] <= height + spacing)
+
+    plates = []  # For each plate: list of shelves [y, shelf height, used width]
+    for i in np.lexsort((-footprint[:, 0], -footprint[:, 1])):
+        if not fits[i]:
+            continue
+        w, h = footprint[i]
+        placed = False
+        for p, shelves in enumerate(plates):
+            # First existing shelf with enough height and width left
+            for shelf in shelves:
+                if h <= shelf[1] and shelf[2] + w <= width + spacing:
+                    plate[i], position[i] = p, (shelf[2], shelf[0])
+                    shelf[2] += w
+                    placed = True
+                    break
+            if placed:
+                break
+            # New shelf above the last shelf of this plate
+            top = shelves[-1][0] + shelves[-1][1]
+            if top + h <= height + spacing:
+                shelves.append([top, h, w])
+                plate[i], position[i] = p, (0.0, top)
+                placed = True
+                break
+        if not placed:
+            plates.append([[0.0, h, w]])
+            plate[i], position[i] = len(plates) - 1, (0.0, 0.0)
+
+    return plate, position, turned
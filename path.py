@@ -1,15 +1,22 @@
-import svgwrite
+import contextlib
 import csv
-import math
 import os
+import numpy as np
+import motion
 
 '''
 Codes generate a print head path from a contour data set a specific z-level
  - svgcreate: create an SVG file composed of line segments connecting each of the point pairs on z slice
  - headpath: create a CSV file describing the position of the print in (X,Y,Z) coordinates and whether the extruder 
              should be turned on when moving to that location (outline and infill pattern)
+ - infill_points: path rows of the infill moves of a slice (grid lines and sparse pattern segments)
+ - infill_time: print time of the infill moves of a slice with the motion model, used to report the time saved by a
+                sparse infill compared to the full grid
  - time_calc: append the total elapsed time to the headpath CSV file to show the total elapsed time and the time at 
-              each point
+              each point (acceleration limited motion model), and report the print time of each layer
+ - report_create: create a CSV file with one row of slicing statistics per layer
+
+The outputs can also be written through a streams.OutputStreams (compressed path file and SVG archive).
 
 Evan Chodora, 2018
 https://github.com/evanchodora/stl-slicer
@@ -17,9 +24,12 @@ echodor@clemson.edu
 '''
 
 
-def svgcreate(pairs, z, ymax, fillx, filly):
+def svgcreate(pairs, z, ymax, fillx, filly, outputdir='outputs', fill_segments=(), streams=None):
+    import svgwrite  # Imported on first use, it is slow to import and only needed for the SVG output
     # Create a new SVG file with the file name as the z-coordinate (inches) of the slice (round to 0.001 in)
-    dwg = svgwrite.Drawing('outputs/' + str(round(z/25.4, 3)) + '.svg')
+    # streams is a streams.OutputStreams that writes the file instead (possibly into the SVG archive)
+    name = str(round(z/25.4, 3)) + '.svg'
+    dwg = svgwrite.Drawing(os.path.join(outputdir, name))
 
     # Create lines for the geometry segment point pairs sliced on the given z-plane
     for pair in pairs:
@@ -37,11 +47,22 @@ def svgcreate(pairs, z, ymax, fillx, filly):
         for pts in range(int(len(fill_line[1])/2)):
             dwg.add(dwg.line((fill_line[1][2*pts], ymax - fill_line[0]), (fill_line[1][2*pts+1], ymax - fill_line[0]),
                              stroke=svgwrite.rgb(0, 0, 0, "%")))
-    dwg.save()  # Save the SVG file to the output folder
+    # Create lines for the segments of sparse infill patterns
+    for seg in fill_segments:
+        dwg.add(dwg.line((seg[0], ymax-seg[1]), (seg[2], ymax-seg[3]), stroke=svgwrite.rgb(0, 0, 0, "%")))
+    if streams is not None:
+        streams.svg(name, dwg.write)
+    else:
+        dwg.save()  # Save the SVG file to the output folder
 
 
-def headpath(contour, fillx, filly, z):
+def headpath(contour, fillx, filly, z, outputdir='outputs', open_contours=(), fill_segments=(), stream=None):
     # Create a path for the print head to follow based a supplied contour path
+    # Contours numbered in open_contours could not be closed (cracks in the mesh) and are printed without returning to
+    # their start point
+    # fill_segments are X1,Y1,X2,Y2 infill segments in print order (sparse infill patterns), the head only travels to
+    # the start of a segment when it does not continue from the end of the previous one
+    # stream is an open text stream of the path rows to append to instead of the path.csv file
     # Format = [ X, Y, Z, On/Off]
     # On/Off denoted by a 1 or 0, respectively
     # 1 = extruder printing when moving to that coordinate from previous print head position
@@ -51,11 +72,13 @@ def headpath(contour, fillx, filly, z):
     d = 4  # Number of decimals places to round the coordinates (0.0001 in)
 
     if len(contour) != 0:
-        contour_num = 1  # Start with the first (possibly the only contour on that slice)
+        contour_num = contour[0][4]  # Start with the first (possibly the only contour on that slice)
         start = 1  # Indicates the start of a contour to handle contour looping
         begin = []
+        end = []
         # Open the path.csv file to append new lines, create it if it does not exist
-        with open('outputs/path.csv', 'a', newline='') as csvfile:
+        with (open(os.path.join(outputdir, 'path.csv'), 'a', newline='') if stream is None else
+              contextlib.nullcontext(stream)) as csvfile:
             path_writer = csv.writer(csvfile, delimiter=' ', quotechar='|', quoting=csv.QUOTE_MINIMAL)
             # Loop over the contour segments
             for segment in contour:
@@ -73,73 +96,114 @@ def headpath(contour, fillx, filly, z):
                 # If this is a new contour:
                 else:
                     # Add the beginning coordinate to the end of a contour to complete the contour
+                    if contour_num in open_contours:
+                        row1 = [round(end[0]/c, d), round(end[1]/c, d), round(z/c, d), 1]  # End of open contour
+                    else:
+                        row1 = [round(begin[0]/c, d), round(begin[1]/c, d), round(z/c, d), 1]  # End of previous contour
                     contour_num = segment[4]  # Update contour number
-                    row1 = [round(begin[0]/c, d), round(begin[1]/c, d), round(z/c, d), 1]  # End of previous contour
                     row2 = [round(segment[0]/c, d), round(segment[1]/c, d), round(z/c, d), 0]  # Start of next contour
                     path_writer.writerow(row1)
                     path_writer.writerow(row2)
                     begin = [segment[0], segment[1]]  # Store the start of the next contour
+                end = [segment[2], segment[3]]  # Store the end of the segment for contours that are not closed
             # Write the last stored begin point to the end of the contour to print the entire loop for the slice
-            row = [round(begin[0]/c, d), round(begin[1]/c, d), round(z/c, d), 1]
+            if contour_num in open_contours:
+                row = [round(end[0]/c, d), round(end[1]/c, d), round(z/c, d), 1]  # End of open contour
+            else:
+                row = [round(begin[0]/c, d), round(begin[1]/c, d), round(z/c, d), 1]
             path_writer.writerow(row)
 
             # Print the position directions for the calculated infill patterns
-            for fill_line in fillx:
-                # Loop over points for each fill line in X (always even number)
-                for pts in range(int(len(fill_line[1])/2)):
-                    # Move to first point in infill line and extrude when moving to the second
-                    row1 = [round(fill_line[0]/c, d), round(fill_line[1][2*pts]/c, d), round(z/c, d), 0]
-                    row2 = [round(fill_line[0]/c, d), round(fill_line[1][2*pts+1]/c, d), round(z/c, d), 1]
-                    path_writer.writerow(row1)
-                    path_writer.writerow(row2)
-            for fill_line in filly:
-                # Loop over points for each fill line in Y (always even number)
-                for pts in range(int(len(fill_line[1]) / 2)):
-                    # Move to first point in infill line and extrude when moving to the second
-                    row1 = [round(fill_line[1][2*pts]/c, d), round(fill_line[0]/c, d), round(z/c, d), 0]
-                    row2 = [round(fill_line[1][2*pts+1]/c, d), round(fill_line[0]/c, d), round(z/c, d), 1]
-                    path_writer.writerow(row1)
-                    path_writer.writerow(row2)
+            for x, y, height, on in infill_points(fillx, filly, z, fill_segments).tolist():
+                path_writer.writerow([round(x, d), round(y, d), round(height, d), int(on)])
 
     return
 
 
-def time_calc(speed):
+def infill_points(fillx, filly, z, fill_segments=()):
+    # X, Y, Z, On/Off path rows (inches, not rounded) of the infill of a slice: the X and Y grid lines followed by the
+    # segments of a sparse pattern (the head only travels to the start of a segment that does not continue the
+    # previous one)
+    c = 25.4  # Conversion from mm to in
+    rows = [np.empty((0, 4))]
+    for fill, axis in ((fillx, 0), (filly, 1)):
+        # Move to the first point of each infill line (head off) and extrude when moving to the second
+        pts = [np.asarray(fill_line[1], dtype=float)[:len(fill_line[1])//2*2] for fill_line in fill]
+        if len(pts) == 0:
+            continue
+        along = np.concatenate(pts)
+        across = np.repeat([float(fill_line[0]) for fill_line in fill], [len(p) for p in pts])
+        x, y = (across, along) if axis == 0 else (along, across)
+        rows.append(np.column_stack((x/c, y/c, np.full(len(along), z/c), np.arange(len(along)) % 2)))
+    seg = np.asarray(fill_segments, dtype=float).reshape(-1, 4)
+    if len(seg):
+        travel = np.r_[True, np.any(np.abs(seg[1:, 0:2] - seg[:-1, 2:4]) > 1e-9, axis=1)]  # Not continuing a polyline
+        pts = np.vstack((seg[travel, 0:2], seg[:, 2:4]))
+        order = np.argsort(np.r_[2*np.flatnonzero(travel), 2*np.arange(len(seg)) + 1])  # Travel before each segment
+        on = np.r_[np.zeros(np.count_nonzero(travel)), np.ones(len(seg))]
+        rows.append(np.column_stack((pts[order]/c, np.full(len(pts), z/c), on[order])))
+
+    return np.concatenate(rows)
+
+
+def infill_time(fillx, filly, z, machine, fill_segments=()):
+    # Print time (s) of the infill moves of a slice with the motion model of the machine (same as time_calc, from the
+    # rounded coordinates written to the path file), from the start of the first infill move
+    points = np.round(infill_points(fillx, filly, z, fill_segments), 4)
+    return float(np.sum(motion.move_times(points, machine)))
+
+
+def time_calc(speed, outputdir='outputs', machine=None, streams=None):
     # Calculate the time corresponding to the location of the print head at each point in the path CSV file
-    # Speed input into the function based on machine specifications
+    # Move times come from the acceleration limited motion model of the machine (motion.Machine), which defaults to
+    # extruding at "speed" (in/s) with the default travel speed and axis limits
+    # Returns the print time of each layer as a dictionary of z (inches, as written in the CSV file) -> seconds
+    # With a streams.OutputStreams the path rows are read from its "path_rows.csv" file (see job.slice_model) and the
+    # timed path is written through its codec
     d = 4  # Decimal places to round time
-
-    # Open the generated CSV file and open a new temporary CSV file
-    with open('outputs/path.csv', 'r') as csvfile, open('outputs/path_temp.csv', 'w', newline='') as outfile:
-        reader = csv.reader(csvfile, delimiter=',', quoting=csv.QUOTE_NONE)
-        writer = csv.writer(outfile, delimiter=' ')
-
-        previous_line = []  # Initialize variable to track the coordinates of the previous line
-        start = 0  # Variable to indicate if the point is the first in the file
-        for line in reader:
-            # Convert read text string to float variables
-            line = line[0].split()
-            line = [float(i) for i in line]
-            if start != 0:
-                pre_row = previous_line
-                pre_time = pre_row[0]
-                p_x, p_y, p_z = pre_row[1], pre_row[2], pre_row[3]
-                n_x, n_y, n_z = line[0], line[1], line[2]
-                # Calculate the distance from one point to the next
-                dist = math.sqrt((n_x-p_x)**2 + (n_y-p_y)**2 + (n_z-p_z)**2)
-                # Calculate the time to move that distance based on the applied speed
-                time = round(pre_time + (dist/speed), d)
-            else:
-                time = 0  # Time at start is 0
-                start = 1
-
-            # Create new row for the CSV file and write to the file
-            row = [time, line[0], line[1], line[2], line[3]]
-            writer.writerow(row)
-            previous_line = row  # Update the previous line for the next calculation
-
-    # Remove the old file and rename the temporary file
-    os.remove('outputs/path.csv')
-    os.rename('outputs/path_temp.csv', 'outputs/path.csv')
+    if machine is None:
+        machine = motion.Machine(print_speed=speed)
+
+    csvpath = os.path.join(outputdir, 'path.csv')
+    temppath = os.path.join(outputdir, 'path_temp.csv')
+    if streams is not None:
+        csvpath = streams.filename('path_rows.csv')  # Decompressed by loadtxt from the file extension
+
+    # Read the whole path (X, Y, Z, On/Off rows) and time every move at once
+    points = np.loadtxt(csvpath, delimiter=' ', ndmin=2)
+    times = motion.move_times(points, machine)
+    elapsed = np.round(np.cumsum(times), d)
+
+    # Moves count towards the layer they end on
+    layers, index = np.unique(points[:, 2], return_inverse=True)
+    layer_times = dict(zip(layers.tolist(), np.bincount(index, weights=times).tolist()))
+
+    # Write the time in front of every row to a temporary CSV file (to the compressed path file with streams)
+    rows = np.column_stack((elapsed, points)).tolist()
+    if streams is not None:
+        outfile = streams.open('path.csv')
+        csv.writer(outfile, delimiter=' ').writerows(rows)
+        streams.finish(outfile)
+        os.remove(csvpath)
+    else:
+        with open(temppath, 'w', newline='') as outfile:
+            writer = csv.writer(outfile, delimiter=' ')
+            writer.writerows(rows)
+
+        # Remove the old file and rename the temporary file
+        os.remove(csvpath)
+        os.rename(temppath, csvpath)
+
+    return layer_times
+
+
+def report_create(report, outputdir='outputs'):
+    # Write the per-layer statistics (list of dicts with the same keys, z in inches) to report.csv
+    if len(report) == 0:
+        return
+    with open(os.path.join(outputdir, 'report.csv'), 'w', newline='') as csvfile:
+        report_writer = csv.DictWriter(csvfile, fieldnames=list(report[0].keys()))
+        report_writer.writeheader()
+        report_writer.writerows(report)
 
     return
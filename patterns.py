@@ -0,0 +1,214 @@
+import numpy as np
+import nesting
+
+'''
+Codes to generate sparse infill patterns inside the infill boundary of an island
+ - scanlines: clips parallel lines at any angle against the contours (vectorized scanline crossings) and returns the
+              inside intervals of every line
+ - rectilinear: one set of parallel lines per layer, alternating between the X and Y directions on every layer
+ - triangles: three sets of parallel lines at 0, 60 and 120 degrees meeting at common points
+ - honeycomb: hexagon cells built from dashed lines at 0, 60 and 120 degrees
+ - gyroid: cross section of the gyroid surface at the layer height as wavy polylines clipped against the contours
+ - fill: creates the infill segments of a pattern for a given density
+
+Density is relative to the full X and Y grid at the infill spacing (1.0 = the same extruded length as the grid), so the
+spacing of each pattern is chosen to give that length of infill per unit area. Patterns use fixed positions on the print
+bed so the infill of consecutive layers stacks. Infill segments are returned as an X1,Y1,X2,Y2 array in print order,
+where consecutive segments of a polyline share their end points.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+PATTERNS = ['grid', 'rectilinear', 'triangles', 'honeycomb', 'gyroid']
+
+
+def scanlines(contours, angle, spacing, offset=0.0):
+    # Clip the lines at "angle" (degrees from the X axis) spaced "spacing" apart (one line through the point "offset"
+    # across the lines from the origin) against the closed contours
+    # Returns the line index, the start and end positions along the line of each inside interval and the unit vectors
+    # along and across the lines
+    along = np.array([np.cos(np.radians(angle)), np.sin(np.radians(angle))])
+    across = np.array([-along[1], along[0]])
+    empty = np.empty(0, dtype=int), np.empty(0), np.empty(0), along, across
+    if len(contours) == 0:
+        return empty
+    # Segment points in the rotated frame: u along the lines and v across them
+    u1, u2 = contours[:, 0:2].dot(along), contours[:, 2:4].dot(along)
+    v1, v2 = contours[:, 0:2].dot(across) - offset, contours[:, 2:4].dot(across) - offset
+
+    # Every (segment, line) crossing at once (same method as the X and Y grid infill), counting the lines in [lo, hi)
+    # of each segment so a line through a vertex crosses only one of the two segments meeting there (as in raster)
+    lo, hi = np.minimum(v1, v2), np.maximum(v1, v2)
+    k_lo = np.floor(lo/spacing).astype(int)
+    counts = np.maximum(np.ceil(hi/spacing).astype(int) - k_lo + 1, 0)
+    segment, position = nesting.expand(counts)
+    k = k_lo[segment] + position
+    loc = k*spacing
+    cross = (lo[segment] <= loc) & (loc < hi[segment])
+    segment, k, loc = segment[cross], k[cross], loc[cross]
+    pts = u1[segment] + (loc - v1[segment])*(u2[segment] - u1[segment])/(v2[segment] - v1[segment])
+
+    # Sort the crossings along each line and pair them up into inside intervals (even-odd rule)
+    order = np.lexsort((pts, k))
+    k, pts = k[order], pts[order]
+    starts = np.flatnonzero(np.r_[True, k[1:] != k[:-1]]) if len(k) else np.empty(0, dtype=int)
+    counts = np.diff(np.r_[starts, len(k)])
+    _, position = nesting.expand(counts)
+    keep = (position % 2 == 0) & (position + 1 < np.repeat(counts, counts))  # First crossing of each pair
+    first = np.flatnonzero(keep)
+    if len(first) == 0:
+        return empty
+
+    return k[first], pts[first], pts[first + 1], along, across
+
+
+def lines(k, u0, u1, along, across, spacing, offset=0.0):
+    # X1,Y1,X2,Y2 segments from the intervals [u0, u1] along the lines k*spacing + offset across the origin
+    v = k*spacing + offset
+    start = np.outer(u0, along) + np.outer(v, across)
+    end = np.outer(u1, along) + np.outer(v, across)
+    return np.column_stack((start, end))
+
+
+def zigzag(k, u0, u1):
+    # Reverse the direction of every other line so the print head snakes across the island
+    flip = k % 2 == 1
+    return k, np.where(flip, u1, u0), np.where(flip, u0, u1)
+
+
+def rectilinear(contours, spacing, layer):
+    # Parallel lines in X on even layers and in Y on odd layers
+    angle = 0 if layer % 2 == 0 else 90
+    k, u0, u1, along, across = scanlines(contours, angle, spacing)
+    return lines(*zigzag(k, u0, u1), along, across, spacing)
+
+
+def triangles(contours, spacing):
+    # Three sets of lines with the same spacing through the origin form a grid of equilateral triangles
+    segments = []
+    for angle in (0, 60, 120):
+        k, u0, u1, along, across = scanlines(contours, angle, spacing)
+        segments.append(lines(*zigzag(k, u0, u1), along, across, spacing))
+    return np.concatenate(segments)
+
+
+def honeycomb(contours, side):
+    # Hexagon cells with edges of length "side": the edges of each direction lie on lines spaced sqrt(3)/2*side apart
+    # and are dashes of length "side" repeating every 3*side, shifted by 1.5*side on alternate lines
+    spacing = np.sqrt(3)/2*side
+    period = 3*side
+    segments = []
+    for angle in (90, 30, 150):
+        k, u0, u1, along, across = scanlines(contours, angle, spacing)
+        # Dashes overlapping each inside interval, clipped to the interval
+        shift = ((k + 1) % 2)*1.5*side - 0.5*side  # Start of the dashes (the origin is the centre of a hexagon)
+        d_lo = np.floor((u0 - shift)/period).astype(int)
+        counts = np.maximum(np.ceil((u1 - shift)/period).astype(int) - d_lo, 0)
+        interval, position = nesting.expand(counts)
+        dash = shift[interval] + (d_lo[interval] + position)*period
+        start = np.maximum(dash, u0[interval])
+        end = np.minimum(dash + side, u1[interval])
+        keep = end - start > 1e-6
+        interval, start, end = interval[keep], start[keep], end[keep]
+        segments.append(lines(k[interval], start, end, along, across, spacing))
+    return np.concatenate(segments)
+
+
+def inside(px, py, vertices, offsets):
+    # Even-odd test of points against all of the polygons of an island (inside the outer contour and not in a hole)
+    point, polygon = nesting.candidate_pairs(px, py, nesting.bounding_boxes(vertices, offsets))
+    hits = nesting.points_in_polygons(px, py, point, polygon, vertices, offsets)
+    return np.bincount(point[hits], minlength=len(px)) % 2 == 1
+
+
+def clip(segments, contours):
+    # Cut the segments at every point where they cross a contour segment and keep the pieces inside the closed contours
+    # (even-odd test of the middle of each piece), in the order of the segments
+    # Only the (segment, contour segment) pairs with overlapping bounding boxes are tested (uniform grid pruning)
+    if len(segments) == 0:
+        return np.empty((0, 4))
+    p, q = segments[:, 0:2], segments[:, 2:4]
+    a, b = contours[:, 0:2], contours[:, 2:4]
+    i, j = nesting.box_pairs(np.hstack((np.minimum(p, q), np.maximum(p, q))),
+                             np.hstack((np.minimum(a, b), np.maximum(a, b))))
+    d, e, w = q[i] - p[i], b[j] - a[j], a[j] - p[i]
+    denom = d[:, 0]*e[:, 1] - d[:, 1]*e[:, 0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        s = (w[:, 0]*e[:, 1] - w[:, 1]*e[:, 0])/denom  # Along p->q
+        r = (w[:, 0]*d[:, 1] - w[:, 1]*d[:, 0])/denom  # Along the contour segment
+    cut = (s > 0) & (s < 1) & (r >= 0) & (r <= 1)
+
+    # Pieces between consecutive cut positions of every segment (the whole segment when it is not cut)
+    segment = np.r_[np.arange(len(segments)), i[cut]]
+    frac = np.r_[np.zeros(len(segments)), s[cut]]
+    order = np.lexsort((frac, segment))
+    segment, frac = segment[order], frac[order]
+    last = np.r_[segment[1:] != segment[:-1], True]  # Last piece of each segment ends at the end point
+    stop = np.where(last, 1.0, np.r_[frac[1:], 1.0])
+    start = np.where((frac == 0)[:, None], p[segment], p[segment] + frac[:, None]*(q - p)[segment])
+    end = np.where(last[:, None], q[segment], p[segment] + stop[:, None]*(q - p)[segment])
+
+    _, vertices, offsets = nesting.polygons(contours)
+    middle = (start + end)/2
+    keep = inside(middle[:, 0], middle[:, 1], vertices, offsets) & (stop > frac)
+    return np.column_stack((start, end))[keep]
+
+
+def gyroid(contours, period, z, samples=16):
+    # Section of the gyroid sin(x)cos(y) + sin(y)cos(z) + sin(z)cos(x) = 0 (one cell every "period") at height z
+    # Solved for y along X when |cos z| >= |sin z|, otherwise for x along Y (the curves then run in the Y direction)
+    if len(contours) == 0:
+        return np.empty((0, 4))
+    w = 2*np.pi/period  # Model coordinates to gyroid phase
+    zp = z*w
+    swap = abs(np.cos(zp)) < abs(np.sin(zp))
+    pts = contours[:, [1, 0, 3, 2]] if swap else contours
+    lo = np.min(np.r_[pts[:, 0], pts[:, 2]]), np.min(np.r_[pts[:, 1], pts[:, 3]])
+    hi = np.max(np.r_[pts[:, 0], pts[:, 2]]), np.max(np.r_[pts[:, 1], pts[:, 3]])
+
+    # Sample positions along the curves and the copies of each curve (every 2*pi) across the island
+    t = np.arange(np.floor(lo[0]*w/(2*np.pi/samples)), np.ceil(hi[0]*w/(2*np.pi/samples)) + 1)*2*np.pi/samples
+    # Written as a*cos(s) + b*sin(s) = -c for the unknown s and solved as s = phase +/- arccos(-c/sqrt(a^2 + b^2))
+    if swap:
+        # sin(z)cos(x) + cos(y)sin(x) = -sin(y)cos(z) solved for x along y
+        a, b, c = np.full(len(t), np.sin(zp)), np.cos(t), np.sin(t)*np.cos(zp)
+    else:
+        # sin(x)cos(y) + cos(z)sin(y) = -sin(z)cos(x) solved for y along x
+        a, b, c = np.sin(t), np.full(len(t), np.cos(zp)), np.sin(zp)*np.cos(t)
+    phase = np.unwrap(np.arctan2(b, a))  # Continuous along the curve (no jumps of 2*pi)
+    spread = np.arccos(np.clip(-c/np.hypot(a, b), -1, 1))
+    copies = np.arange(np.floor(lo[1]*w/(2*np.pi)) - 1, np.ceil(hi[1]*w/(2*np.pi)) + 2)*2*np.pi
+    segments = []
+    for curve, sign in enumerate((1, -1)):
+        for j, offset in enumerate(copies):
+            s = (phase + sign*spread + offset)/w
+            poly = np.column_stack((t/w, s))
+            if (curve + j) % 2 == 1:
+                poly = poly[::-1]  # Alternate the print direction of neighbouring curves
+            segments.append(np.column_stack((poly[:-1], poly[1:])))
+    segments = np.concatenate(segments)
+    if swap:
+        segments = segments[:, [1, 0, 3, 2]]
+
+    # Keep the parts of the polylines inside the island, cutting the segments at every contour they cross
+    return clip(segments, contours)
+
+
+def fill(contours, pattern, spacing, density, layer, z):
+    # Infill segments of "pattern" inside the closed contours with the same extruded length per unit area as "density"
+    # times the full X and Y grid at "spacing" (the grid has 2/spacing of line per unit area)
+    if len(contours) == 0:
+        return np.empty((0, 4))
+    per_area = 2*density/spacing
+    if pattern == 'rectilinear':
+        return rectilinear(contours, 1/per_area, layer)
+    if pattern == 'triangles':
+        return triangles(contours, 3/per_area)
+    if pattern == 'honeycomb':
+        return honeycomb(contours, 2/(np.sqrt(3)*per_area))  # Hexagons have 2/(sqrt(3)*side) of edge per unit area
+    if pattern == 'gyroid':
+        return gyroid(contours, 2.4/per_area, z)  # Two curves per period, each about 1.2 times longer than a line
+    raise ValueError('Unknown infill pattern: ' + str(pattern))
+
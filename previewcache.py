@@ -0,0 +1,153 @@
+import numpy as np
+import threading
+from collections import OrderedDict
+import gtransform
+import orient
+from drawlines import draw_lines
+
+'''
+Code to cache rendered preview frames for the 24 axis-aligned orientations reachable with the rotation buttons
+ - BUTTON_ROTATIONS: the +/-90 degree rotations about X, Y and Z applied by the rotation buttons
+ - orientation_key: converts a composed rotation matrix into a hashable key (entries are exactly 0, 1 or -1)
+ - orientations: enumerates the 24 orientations reachable from the loaded orientation with the rotation buttons
+ - rasterize: converts the projected edge pixels from draw_lines into a greyscale frame of the preview window
+ - render_frame: projects and rasterizes the preview mesh of an oriented (centered and bed fitted) geometry
+ - PreviewCache: thread-safe least recently used cache of frames with a memory cap
+ - PreviewWorker: background thread that fills the cache for every orientation after a model is loaded
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+BUTTON_ROTATIONS = [[3, -90], [3, 90], [1, -90], [1, 90], [2, 90], [2, -90]]
+
+
+def orientation_key(rot):
+    # Rotations by multiples of 90 degrees only contain 0 and +/-1 (up to floating point error)
+    return tuple(np.rint(rot[0:3, 0:3]).astype(int).flatten())
+
+
+def orientations():
+    # Breadth-first search over the button rotations starting from the loaded orientation
+    found = OrderedDict()
+    start = np.identity(4)
+    found[orientation_key(start)] = start
+    queue = [start]
+    while queue:
+        rot = queue.pop(0)
+        for axis, ang in BUTTON_ROTATIONS:
+            new = np.rint(rot.dot(gtransform.rotation_matrix(axis, ang)))  # Snap to exact integer entries
+            key = orientation_key(new)
+            if key not in found:
+                found[key] = new
+                queue.append(new)
+
+    return found
+
+
+def rasterize(line_points, view, width, height):
+    # Build the greyscale preview frame (indexed [x][y] like the PyGame pixel array) from the edge pixels
+    frame = np.full((width, height), 255, dtype=np.uint8)  # Clear to white
+    if len(line_points) == 0:
+        return frame
+
+    x = (width/2 + line_points[:, 0]).astype(int)  # X coordinate (0,0 of screen is top left)
+    y = (height/2 + line_points[:, 1]).astype(int)  # Y coordinate (0,0 of screen is top left)
+    front = line_points[:, 2] == 1
+    on_screen = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+
+    # Grey back facing lines first so that black lines are always drawn over them
+    if view == 'grey':
+        back = on_screen & ~front
+        frame[x[back], y[back]] = 210  # Color = grey
+    # Plot all front facing lines and back facing when wireplot is selected
+    black = on_screen & (front | (view == 'wire'))
+    frame[x[black], y[black]] = 0  # Color = black
+
+    return frame
+
+
+def render_frame(geometry, normal, preview_vertex, preview_face, view, width, height):
+    # Apply isometric perspective to the reduced preview geometry and draw lines between points of the faces
+    plot_geometry, camera = gtransform.perspective(geometry[preview_vertex])
+    line_points = draw_lines(plot_geometry, normal[preview_face], camera, view)
+
+    return rasterize(line_points, view, width, height)
+
+
+class PreviewCache:
+    # Least recently used cache of preview frames keyed by (orientation key, view type)
+
+    def __init__(self, max_bytes=64*1024*1024):
+        self.max_bytes = max_bytes  # Memory cap for the stored frames
+        self.size = 0  # Bytes currently stored
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            frame = self.frames.get(key)
+            if frame is not None:
+                self.frames.move_to_end(key)  # Mark as most recently used
+            return frame
+
+    def put(self, key, frame):
+        with self.lock:
+            if key in self.frames:
+                self.size -= self.frames.pop(key).nbytes
+            self.frames[key] = frame
+            self.size += frame.nbytes
+            # Evict the least recently used frames until back under the memory cap (always keep the newest frame)
+            while self.size > self.max_bytes and len(self.frames) > 1:
+                _, old = self.frames.popitem(last=False)
+                self.size -= old.nbytes
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.frames
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.size = 0
+
+
+class PreviewWorker(threading.Thread):
+    # Background thread rendering every orientation of a model into the preview cache
+
+    def __init__(self, cache, geometry, normal, bounds, base, preview_vertex, preview_face, view, xdim, ydim, zdim,
+                 width, height):
+        threading.Thread.__init__(self, daemon=True)
+        self.cache = cache
+        # Private copies so the GUI can keep transforming the model while the worker runs
+        self.geometry = np.array(geometry)
+        self.normal = np.array(normal)
+        self.bounds = np.array(bounds)  # Cached bounding box of the copied geometry
+        self.base = np.array(base)  # Orientation of the copied geometry relative to the loaded orientation
+        self.preview_vertex = preview_vertex
+        self.preview_face = preview_face
+        self.view = view
+        self.bed = (xdim, ydim, zdim)
+        self.screen = (width, height)
+        self.stop_event = threading.Event()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        # Rotation that takes the copied geometry back to the loaded orientation
+        undo = self.base.T
+        for key, rot in orientations().items():
+            if self.stop_event.is_set():
+                return
+            if (key, self.view) in self.cache:
+                continue
+            rot = undo.dot(rot)
+            # Orient the object to the origin and scale to fit the print bed dimensions as DrawObject.plot does
+            bounds = gtransform.transform_bounds(self.bounds, rot)
+            geometry, bounds = orient.to_origin(gtransform.apply(self.geometry, rot), bounds)
+            geometry, bounds = orient.fit_bed(geometry, *self.bed, bounds)
+            frame = render_frame(geometry, gtransform.apply(self.normal, rot), self.preview_vertex, self.preview_face,
+                                 self.view, *self.screen)
+            self.cache.put((key, self.view), frame)
@@ -0,0 +1,142 @@
+import os
+import queue
+import struct
+import threading
+import time
+import zipfile
+import zlib
+import numpy as np
+
+'''
+Code to write a bitmap mask of every layer for mask based (DLP/SLA) resin printers
+ - fill_mask: even-odd scanline fill of the closed contours of a layer into a bitmap of the print bed (holes stay empty)
+ - png_bytes: encodes a bitmap as a 1-bit (black and white) or 8-bit greyscale PNG file (zlib compressed, no imaging
+              library needed)
+ - MaskWriter: fills, encodes and writes the masks of the layers on a background thread while the slicer carries on,
+               either as one PNG file per layer or packed in one zip archive, and reports the throughput in layers/s
+
+The scanline fill finds where every contour segment crosses the centre line of each pixel row and toggles the pixels
+from each crossing to the right edge of the row: a pixel is inside when an odd number of crossings lie to its left
+(even-odd rule). The crossings of all segments are computed at once and the toggles are accumulated along the rows, so
+a layer costs a few array operations whatever its number of segments.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+def fill_mask(segments, width, height, pixel):
+    # Bitmap (rows from the back to the front of the bed, 255 = exposed) of the area enclosed by closed contour segments
+    # (X1,Y1,X2,Y2 rows in mm) on a print bed of width x height mm with square pixels of "pixel" mm
+    cols, rows = int(np.ceil(width/pixel)), int(np.ceil(height/pixel))
+    segments = np.asarray(segments, dtype=float)
+    if len(segments) == 0:
+        return np.zeros((rows, cols), dtype=np.uint8)
+    x1, y1, x2, y2 = segments[:, 0], segments[:, 1], segments[:, 2], segments[:, 3]
+
+    # Pixel rows (numbered from the front, Y = 0) whose centre line (b + 0.5)*pixel lies in [low Y, high Y) of each
+    # segment, half open so the shared end of two segments is only counted once and horizontal segments are skipped
+    first = np.clip(np.ceil(np.minimum(y1, y2)/pixel - 0.5), 0, rows).astype(int)
+    last = np.clip(np.ceil(np.maximum(y1, y2)/pixel - 0.5), 0, rows).astype(int)
+    count = np.maximum(last - first, 0)
+    seg = np.repeat(np.arange(len(segments)), count)
+    row = first[seg] + np.arange(len(seg)) - np.repeat(np.cumsum(count) - count, count)
+
+    # X of each crossing and the first pixel column whose centre lies to its right
+    yc = (row + 0.5)*pixel
+    x = x1[seg] + (yc - y1[seg])*(x2[seg] - x1[seg])/(y2[seg] - y1[seg])
+    col = np.clip(np.ceil(x/pixel - 0.5), 0, cols).astype(int)
+
+    # Toggle (XOR with 255) the pixel at each crossing (one spare column for crossings right of the bed), then the
+    # running XOR along each row is 255 inside (odd number of crossings to the left) and 0 outside
+    toggles = np.zeros(rows*(cols + 1), dtype=np.uint8)
+    np.bitwise_xor.at(toggles, row*(cols + 1) + col, 255)
+    inside = np.bitwise_xor.accumulate(toggles.reshape((rows, cols + 1))[:, 0:cols], axis=1)
+    return inside[::-1]  # Image rows go from the back (largest Y) to the front of the bed
+
+
+def png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+
+def png_bytes(image, level=6, bits=1):
+    # Greyscale PNG: signature, header, one zlib stream of the rows (each starting with filter type 0) and end
+    # With bits = 1 every non-zero pixel is white and 8 pixels are packed per byte (8 times less data to compress)
+    height, width = image.shape
+    if bits == 1:
+        image = np.packbits(image, axis=1)
+    raw = np.hstack((np.zeros((height, 1), dtype=np.uint8), image)).tobytes()
+    return (b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, bits, 0, 0, 0, 0)) +
+            png_chunk(b'IDAT', zlib.compress(raw, level)) + png_chunk(b'IEND', b''))
+
+
+class MaskWriter:
+    # Background writer of the layer masks of a slicing job (see job.slice_model)
+
+    def __init__(self, pixel, archive=False, level=6, bits=1, queue_size=16):
+        self.pixel = pixel  # Pixel size of the masks (mm)
+        self.archive = archive  # Pack all masks in one masks.zip file instead of one PNG file per layer
+        self.level = level  # zlib compression level of the PNG files (0-9)
+        self.bits = bits  # Bits per pixel of the PNG files (1 = black and white, 8 = greyscale)
+        self.queue_size = queue_size  # Layers waiting to be written before add() blocks (bounds the memory used)
+        self.layers = 0  # Masks written
+        self.bytes = 0  # Size of the PNG data written
+        self.busy = 0.0  # Time spent filling, encoding and writing masks (s)
+        self.error = None
+        self.thread = None
+
+    def start(self, directory, width, height):
+        # Start writing masks of a width x height mm bed into the directory
+        self.directory, self.width, self.height = directory, width, height
+        os.makedirs(directory, exist_ok=True)
+        self.zip = None
+        if self.archive:
+            # The PNG data is already compressed, so the archive only stores it
+            self.zip = zipfile.ZipFile(os.path.join(directory, 'masks.zip'), 'w', zipfile.ZIP_STORED)
+        self.layers, self.bytes, self.busy, self.error = 0, 0, 0.0, None
+        self.queue = queue.Queue(self.queue_size)
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def add(self, z, contours):
+        # Queue the closed contours (X1,Y1,X2,Y2,... rows in mm) of the next layer
+        self.queue.put((z, np.array(contours, dtype=float)))
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if self.error is not None:
+                continue  # Drain the queue after a failure, the error is raised by close()
+            start = time.perf_counter()
+            try:
+                data = png_bytes(fill_mask(item[1], self.width, self.height, self.pixel), self.level, self.bits)
+                name = 'layer_{:05d}.png'.format(self.layers + 1)
+                if self.zip is not None:
+                    self.zip.writestr(name, data)
+                else:
+                    with open(os.path.join(self.directory, name), 'wb') as pngfile:
+                        pngfile.write(data)
+                self.layers += 1
+                self.bytes += len(data)
+            except Exception as error:
+                self.error = error
+            self.busy += time.perf_counter() - start
+
+    def close(self):
+        # Wait for the queued masks to be written
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+            self.thread = None
+            if self.zip is not None:
+                self.zip.close()
+        if self.error is not None:
+            raise self.error
+        return self
+
+    def rate(self):
+        # Layers per second of the mask backend (fill, encode and write)
+        return self.layers/self.busy if self.busy > 0 else 0.0
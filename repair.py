@@ -0,0 +1,139 @@
+import math as m
+import numpy as np
+
+'''
+Codes to repair open contours caused by small cracks in the mesh
+ - GridIndex: uniform grid hash of 2D points for fast fixed radius neighbour searches
+ - chains: splits a contour array into its separate contour loops
+ - reverse: reverses the direction of travel along a contour loop
+ - close_gaps: joins the nearest pairs of dangling contour ends within a gap tolerance, merging open contours into
+               longer contours or closing them, and reports the number of repaired and still open contours
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+class GridIndex:
+    # Uniform grid hash of 2D points - points are stored in square cells of size "cell" so that every point within a
+    # distance of "cell" from a query point is found by searching the 3x3 block of cells around it
+
+    def __init__(self, cell):
+        self.cell = cell
+        self.cells = {}
+
+    def key(self, x, y):
+        return int(m.floor(x/self.cell)), int(m.floor(y/self.cell))
+
+    def insert(self, item, x, y):
+        self.cells.setdefault(self.key(x, y), []).append((item, x, y))
+
+    def near(self, x, y, radius):
+        # All stored (item, x, y) within "radius" in both X and Y of the point (radius must not exceed the cell size)
+        kx, ky = self.key(x, y)
+        for i in (kx-1, kx, kx+1):
+            for j in (ky-1, ky, ky+1):
+                for item, px, py in self.cells.get((i, j), ()):
+                    if abs(px-x) < radius and abs(py-y) < radius:
+                        yield item, px, py
+
+
+def chains(contours):
+    # Split the X1,Y1,X2,Y2,contour_num array into a list of X1,Y1,X2,Y2 arrays (one per contour, in order)
+    if len(contours) == 0:
+        return []
+    starts = np.flatnonzero(np.diff(contours[:, 4])) + 1  # Rows where a new contour number starts
+    return np.split(contours[:, 0:4], starts)
+
+
+def reverse(chain):
+    # Travel the contour in the opposite direction (reverse the segment order and swap each segment's points)
+    return chain[::-1][:, [2, 3, 0, 1]]
+
+
+def close_gaps(contours, gap, tol=0.005):
+    # Join dangling contour ends closer than "gap" (mm), a gap of 0 only lists the open contours
+    # Returns the repaired contours (renumbered from 1), the set of contour numbers that are still open and the number
+    # of gaps that were bridged
+    loops = chains(contours)
+    closed = [abs(c[0, 0]-c[-1, 2]) < tol and abs(c[0, 1]-c[-1, 3]) < tol for c in loops]
+    open_loops = [i for i in range(len(loops)) if not closed[i]]
+
+    # Index the two ends of every open contour: end 2k is the head (start) and end 2k+1 is the tail of open contour k
+    ends = []
+    for i in open_loops:
+        ends.append((loops[i][0, 0], loops[i][0, 1]))
+        ends.append((loops[i][-1, 2], loops[i][-1, 3]))
+    index = GridIndex(max(gap, tol))
+    if gap > 0:
+        for e, (x, y) in enumerate(ends):
+            index.insert(e, x, y)
+
+    # Candidate joins between ends within the gap tolerance, nearest first
+    candidates = []
+    for e, (x, y) in enumerate(ends):
+        for other, px, py in index.near(x, y, gap):
+            if other <= e:
+                continue
+            # Do not close a contour of 1 or 2 segments onto itself (it would enclose no area)
+            if other == e + 1 and e % 2 == 0 and len(loops[open_loops[e//2]]) < 3:
+                continue
+            dist = m.hypot(px-x, py-y)
+            if dist <= gap:
+                candidates.append((dist, e, other))
+    candidates.sort()
+    match = {}
+    for dist, e, other in candidates:
+        if e not in match and other not in match:
+            match[e] = other
+            match[other] = e
+
+    # Follow the joins to merge open contours: each contour connects its own two ends and each end has at most one
+    # join, so every group of joined contours is either a path (still open) or a cycle (now closed)
+    visited = [False]*len(open_loops)
+    merged = []  # (X1,Y1,X2,Y2 array, closed flag)
+
+    def walk(k, enter):
+        # Walk joined contours starting with contour k entered through end "enter"
+        pieces = []
+        while True:
+            visited[k] = True
+            loop = loops[open_loops[k]]
+            pieces.append(loop if enter % 2 == 0 else reverse(loop))
+            leave = enter + 1 if enter % 2 == 0 else enter - 1  # Other end of the same contour
+            nxt = match.get(leave)
+            if nxt is None:
+                return pieces, False
+            bridge = [ends[leave][0], ends[leave][1], ends[nxt][0], ends[nxt][1]]
+            if visited[nxt//2]:  # Back at the first contour - the group is a cycle
+                pieces.append(np.array([bridge]))
+                return pieces, True
+            pieces.append(np.array([bridge]))
+            k, enter = nxt//2, nxt
+
+    # Paths start from an end without a join
+    for k in range(len(open_loops)):
+        for enter in (2*k, 2*k+1):
+            if not visited[k] and enter not in match:
+                pieces, is_closed = walk(k, enter)
+                merged.append((np.concatenate(pieces), is_closed))
+    # Everything left over is part of a cycle
+    for k in range(len(open_loops)):
+        if not visited[k]:
+            pieces, is_closed = walk(k, 2*k)
+            merged.append((np.concatenate(pieces), is_closed))
+
+    # Renumber: closed contours in their original order followed by the merged contours
+    result = [(loops[i], True) for i in range(len(loops)) if closed[i]] + merged
+    rows = []
+    open_contours = set()
+    for num, (loop, is_closed) in enumerate(result, start=1):
+        rows.append(np.column_stack((loop, np.full(len(loop), num))))
+        if not is_closed:
+            open_contours.add(num)
+    repaired = len(match)//2
+    if not rows:
+        return np.empty((0, 5)), open_contours, repaired
+
+    return np.concatenate(rows), open_contours, repaired
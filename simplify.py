@@ -0,0 +1,89 @@
+import numpy as np
+
+'''
+Code to simplify the contours of a slice by removing the vertices that do not change their shape by more than a chord
+error tolerance
+ - polylines: converts X1,Y1,X2,Y2,contour_num rows into one array of contour vertices (the start of every segment and
+              the end of the last segment of each contour, which repeats the first vertex of a closed contour)
+ - douglas_peucker: marks the vertices to keep of all of the polylines at once
+ - contours: simplified X1,Y1,X2,Y2,contour_num rows of the contours of a slice
+
+Douglas-Peucker keeps the two ends of a polyline, then keeps the vertex farthest from the chord between them if it is
+more than the tolerance away and repeats on the two halves. The halves of every contour are processed together: each
+pass measures all of the vertices of all pending halves against their chords and splits the halves in one go, so the
+number of passes only depends on the depth of the splitting. Collinear vertices (zero distance) are always removed.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+def polylines(rows):
+    # Vertices of the contours and the index of the first vertex of each contour (plus the total at the end)
+    starts = np.r_[0, np.flatnonzero(np.diff(rows[:, 4])) + 1]
+    ends = np.r_[starts[1:], len(rows)] - 1
+    points = np.empty((len(rows) + len(starts), 2))
+    position = np.arange(len(rows)) + np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, len(rows)]))
+    points[position] = rows[:, 0:2]  # Start of every segment
+    points[ends + np.arange(len(starts)) + 1] = rows[ends, 2:4]  # End of the last segment of every contour
+    return points, np.r_[starts + np.arange(len(starts)), len(points)]
+
+
+def douglas_peucker(points, offsets, tolerance):
+    # Boolean mask of the vertices kept, the first and last vertex of every polyline are always kept
+    keep = np.zeros(len(points), dtype=bool)
+    keep[offsets[:-1]] = True
+    keep[offsets[1:] - 1] = True
+    tolerance = max(tolerance, 1e-9)  # Always drop collinear vertices (up to rounding error)
+
+    # Pending (first, last) vertex ranges with interior vertices
+    first, last = offsets[:-1], offsets[1:] - 1
+    while True:
+        pending = last - first >= 2
+        first, last = first[pending], last[pending]
+        if len(first) == 0:
+            return keep
+        interior = last - first - 1
+        rid = np.repeat(np.arange(len(first)), interior)
+        idx = first[rid] + np.arange(len(rid)) - np.repeat(np.cumsum(interior) - interior, interior) + 1
+
+        # Distance of every interior vertex to the chord of its range (to the end point when the chord has no length,
+        # which happens for the first pass of a closed contour)
+        a, b, p = points[first[rid]], points[last[rid]], points[idx]
+        chord = b - a
+        length = np.sqrt(np.sum(chord**2, axis=1))
+        offset = p - a
+        cross = np.abs(chord[:, 0]*offset[:, 1] - chord[:, 1]*offset[:, 0])
+        dist = np.where(length > 1e-12, cross/np.where(length > 1e-12, length, 1), np.sqrt(np.sum(offset**2, axis=1)))
+
+        # Farthest vertex of each range (first one on ties), split the ranges where it is out of tolerance
+        farthest = np.maximum.reduceat(dist, np.cumsum(interior) - interior)
+        candidate = np.flatnonzero(dist == farthest[rid])
+        ranges, at = np.unique(rid[candidate], return_index=True)
+        split = idx[candidate[at]]
+        out = farthest[ranges] > tolerance
+        ranges, split = ranges[out], split[out]
+        keep[split] = True
+        first, last = np.r_[first[ranges], split], np.r_[split, last[ranges]]
+
+
+def contours(rows, tolerance):
+    # Simplify the contours with the chord error tolerance (mm), the contour numbers and the first vertex of every
+    # contour are unchanged. Closed contours that would be left with fewer than 3 segments are kept as they are.
+    rows = np.asarray(rows, dtype=float)
+    if len(rows) == 0:
+        return rows
+    points, offsets = polylines(rows)
+    keep = douglas_peucker(points, offsets, tolerance)
+    counts = np.add.reduceat(keep.astype(int), offsets[:-1]) - 1  # Segments left in each contour
+    closed = np.all(np.abs(points[offsets[:-1]] - points[offsets[1:] - 1]) < 1e-9, axis=1)
+    original = np.repeat(closed & (counts < 3), np.diff(offsets))
+    keep |= original  # Keep every vertex of contours that would collapse
+
+    # Segments between consecutive kept vertices of the same contour
+    kept = np.flatnonzero(keep)
+    contour = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))[kept]
+    same = contour[1:] == contour[:-1]
+    nums = rows[np.r_[0, np.flatnonzero(np.diff(rows[:, 4])) + 1], 4]
+    return np.column_stack((points[kept[:-1][same]], points[kept[1:][same]], nums[contour[:-1][same]]))
@@ -1,6 +1,7 @@
 import numpy as np
 import gtransform
-from math import isinf
+import repair
+from collections import deque
 
 '''
 Codes to slice geometry at a given value Z (height above the print bed)
@@ -9,6 +10,7 @@ Functions:
  - interpolation: interpolates between 2 points in 3D space based on a specific Z value between the points
  - compute_points_on_z: converts each STL face that is cut by the Z slice to a pair of points to build an outer contour
  - build_contours: converts the previously calculated discontinous point pairs into sets of continous contours
+                   (open contours left by cracks in the mesh are joined afterwards by repair.close_gaps)
  - infill: calculates the start and stop points for grid infill lines filling in the previously calculated contours
 
 Evan Chodora, 2018
@@ -17,19 +19,24 @@ echodor@clemson.edu
 '''
 
 
-def geom_to_bed_coords(geometry, xdim, ydim, zdim):
+def geom_to_bed_coords(geometry, xdim, ydim, zdim, bounds=None):
     # Rescale object geometry to the size of the print bed volume and translate from the origin to the center of the
     # print bed. The object plotted on the screen is larger for visual representation and centered at the origin in
     # order to conduct object rotations naturally
+    # Returns the moved geometry and its bounding box (computed from the geometry if no cached box is supplied)
+    if bounds is None:
+        bounds = gtransform.bounding_box(geometry)
 
-    max_size = np.max(geometry, axis=0)  # Max X,Y,Z values of the object
+    max_size = bounds[1]  # Max X,Y,Z values of the object
     # Scale geometry to fit within the bed dimensions (convert from viewing size to actual)
     scale = min(xdim/(2*max_size[0]), ydim/(2*max_size[1]), zdim/(2*max_size[2]))
-    geometry = gtransform.scale(geometry, 1/scale)  # Apply global scaling with appropriate factor
-    max_size = np.max(geometry, axis=0)  # Max X,Y,Z values of the object
-    geometry = gtransform.translate(geometry, xdim/2, max_size[1], zdim/2)  # Translate object onto print bed surface
+    scale_mat = gtransform.scale_matrix(1/scale)  # Apply global scaling with appropriate factor
+    bounds = gtransform.transform_bounds(bounds, scale_mat)
+    max_size = bounds[1]  # Max X,Y,Z values of the object
+    trans_mat = gtransform.translation_matrix(xdim/2, max_size[1], zdim/2)  # Translate object onto print bed surface
+    geometry = gtransform.apply(geometry, scale_mat.dot(trans_mat))  # Scale and translate in a single pass
 
-    return geometry
+    return geometry, gtransform.transform_bounds(bounds, trans_mat)
 
 
 def interpolation(p1, p2, slice_z):
@@ -42,9 +49,9 @@ def interpolation(p1, p2, slice_z):
     return points
 
 
-def compute_points_on_z(geometry, z, xdim, ydim, zdim):
+def compute_points_on_z(geometry, z):
     # Compute the points on the z slice plane
-    geometry = geom_to_bed_coords(geometry, xdim, ydim, zdim)  # Position and size geometry correctly
+    # The geometry must already be positioned and sized on the print bed (geom_to_bed_coords)
     geometry = np.around(geometry, 5)  # Round geometry data
     num_faces = int((geometry.shape[0]) / 3)  # Every 3 points represents a single face (length/3)
     geometry = geometry[:, 0:3]  # Specifically pull the X,Y,Z coordinates - ignore H
@@ -101,82 +108,101 @@ def compute_points_on_z(geometry, z, xdim, ydim, zdim):
 
 def build_contours(edge_points):
     # Function to build continuous contours for point sets on the slice z
+    # Segment endpoints are stored in a grid index so the matching segment for each contour tail is found directly
+    # instead of rescanning all of the remaining points
     contours = []  # Initialize contour point loop array
-    contour_num = 1  # Initialize the count for the number of contours
+    contour_num = 0  # Initialize the count for the number of contours
     tol = 0.005  # Tolerance criteria for matching the next point in the contour
-    points_left = edge_points  # Initialize points that are remaining = original points
-    tail = []
-    loop_cnt = 1  # Count number of times searched over the remaining points for geometry error handling
-    while len(points_left) != 0:  # Loop over the point pairs and the index in the data array
-        j = 1
-        if not contours:  # First point pair needs to always be added to the contour data if variable is empty
-            pair = points_left[0, :]
-            contours.append([pair[0], pair[1], pair[2], pair[3], contour_num])
-            tail = [pair[2], pair[3]]  # Tail is the second point of the line pair
-            points_left = np.delete(points_left, 0, axis=0)  # Remove the point pair from the array of points
-        while j <= len(points_left):
-            pair = points_left[j-1, :]
-            # If either point in that pair matches the tail from the previous head-tail pair:
-            if abs(pair[0]-tail[0]) < tol and abs(pair[1]-tail[1]) < tol:
-                contours.append([pair[0], pair[1], pair[2], pair[3], contour_num])
-                points_left = np.delete(points_left, j-1, axis=0)  # Remove the point pair from the array of points
-                tail = [pair[2], pair[3]]  # Tail is the second point of the line pair
-                loop_cnt = 1  # Reset search loop counter
+    pairs = np.asarray(edge_points).reshape((-1, 4)).tolist()
+    used = [False]*len(pairs)  # Point pairs already added to a contour
+
+    # Index both points of every point pair
+    index = repair.GridIndex(tol)
+    for i, pair in enumerate(pairs):
+        index.insert((i, 0), pair[0], pair[1])
+        index.insert((i, 1), pair[2], pair[3])
+
+    def next_pair(x, y):
+        # Find an unused point pair with either point matching (x, y), returns (pair index, matched point) or None
+        for (i, point), px, py in index.near(x, y, tol):
+            if not used[i]:
+                return i, point
+        return None
+
+    for first in range(len(pairs)):
+        if used[first]:
+            continue
+        # Start a new contour loop with the first unused point pair
+        used[first] = True
+        contour_num = contour_num + 1  # Increment contour loop number
+        loop = deque([pairs[first]])
+        closed = False
+        # Add point pairs matching the tail (second point of the last pair) until the loop is closed
+        while not closed:
+            found = next_pair(loop[-1][2], loop[-1][3])
+            if found is None:
                 break
-            if abs(pair[2] - tail[0]) < tol and abs(pair[3] - tail[1]) < tol:
-                contours.append([pair[2], pair[3], pair[0], pair[1], contour_num])
-                points_left = np.delete(points_left, j-1, axis=0)  # Remove the point pair from the array of points
-                tail = [pair[0], pair[1]]  # Tail is the second point of the line pair
-                loop_cnt = 1  # Reset search loop counter
+            i, point = found
+            used[i] = True
+            pair = pairs[i]
+            loop.append(pair if point == 0 else [pair[2], pair[3], pair[0], pair[1]])
+            closed = abs(loop[0][0]-loop[-1][2]) < tol and abs(loop[0][1]-loop[-1][3]) < tol
+        # Open contour (crack in the mesh) - also extend backwards from the head of the contour
+        while not closed:
+            found = next_pair(loop[0][0], loop[0][1])
+            if found is None:
                 break
-            j = j + 1
-        loop_cnt = loop_cnt + 1  # Increment loop search counter
-        # If there are still points left and either the last point in the contour equals the first (completed loop) or
-        # have unsuccessfully searched over all the points twice to find a match then create a new contour loop
-        if (len(points_left) != 0 and abs(contours[0][0]-contours[-1][2]) < tol and
-           abs(contours[0][1]-contours[-1][3]) < tol) or loop_cnt > 2*len(edge_points):
-                contour_num = contour_num + 1  # Increment contour loop number
-                pair = points_left[0, :]
-                contours.append([pair[0], pair[1], pair[2], pair[3], contour_num])
-                tail = [pair[2], pair[3]]  # Tail is the second point of the line pair
-                points_left = np.delete(points_left, 0, axis=0)  # Remove the point pair from the array of points
+            i, point = found
+            used[i] = True
+            pair = pairs[i]
+            loop.appendleft(pair if point == 1 else [pair[2], pair[3], pair[0], pair[1]])
+            closed = abs(loop[0][0]-loop[-1][2]) < tol and abs(loop[0][1]-loop[-1][3]) < tol
+        contours.extend([pair + [contour_num] for pair in loop])
     contours = np.asarray(contours).reshape((-1, 5))  # Reshape and convert to X1,Y1,X2,Y2,contour_num numpy array
 
     return contours
 
 
-def infill(pairs, direct, spacing):
+def infill(pairs, direct, spacing, origin=None):
     # Function to compute the line infill spacing for the 3D printing
     # direction (direct): X-axis = 0 and Y-axis = 1
+    # Infill lines are placed at origin + k*spacing (origin defaults to the minimum position of the point pairs) so
+    # that separate islands of the same slice share one grid
+    # Every (segment, infill line) crossing is computed at once with numpy instead of looping over lines and segments
     fill = []
 
     if len(pairs) != 0:
+        pairs = np.asarray(pairs)
+        a, b = pairs[:, direct], pairs[:, direct+2]  # Positions of the segment points along the infill direction
         # Calculate max and min dimensions of the sliced points (in either X or Y)
-        min_pos = min(np.min(pairs[:, direct]), np.min(pairs[:, direct+2]))
-        max_pos = max(np.max(pairs[:, direct]), np.max(pairs[:, direct+2]))
-
-        num_passes = int((max_pos - min_pos)/spacing)  # Number of infill lines to cover the object
-
-        # Loop over the number of infill lines needed
+        min_pos = min(np.min(a), np.min(b))
+        max_pos = max(np.max(a), np.max(b))
+        if origin is None:
+            origin = min_pos
+        first = int(np.floor((min_pos - origin)/spacing))  # First infill line at or below the points
+        num_passes = int((max_pos - origin)/spacing) - first  # Number of infill lines to cover the object
+
+        # Range of infill lines that fall between the two points of each segment
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        k_lo = np.floor((lo - origin)/spacing).astype(int)
+        k_hi = np.ceil((hi - origin)/spacing).astype(int)
+        counts = np.maximum(k_hi - k_lo + 1, 0)
+        segment = np.repeat(np.arange(len(pairs)), counts)
+        k = np.repeat(k_lo, counts) + np.arange(len(segment)) - np.repeat(np.cumsum(counts) - counts, counts)
+        loc = origin + k*spacing
+        # If the line falls on either side of the current fill pass line position
+        cross = (lo[segment] < loc) & (loc < hi[segment])
+        segment, k, loc = segment[cross], k[cross], loc[cross]
+        # Intercept of the infill line with each segment (other coordinate, linear interpolation between the points)
+        p1, p2 = pairs[segment, 1-direct], pairs[segment, 3-direct]
+        pts = p1 + (loc - a[segment])*(p2 - p1)/(b[segment] - a[segment])
+
+        # Sort points in order along each infill line to construct infill path lines
+        order = np.lexsort((pts, k))
+        k, pts = k[order], pts[order]
+        split = np.searchsorted(k, np.arange(first, first + num_passes + 2))
         for fill_pass in range(num_passes+1):
-            loc = min_pos + fill_pass*spacing  # Increment fill pass position by the infill spacing variable
-            pts = []
-            # Loop over each segment in the list of contour point pairs
-            for segment in pairs:
-                # If the line falls on either side of the current fill pass line position
-                if segment[direct] < loc < segment[direct+2] or segment[direct+2] < loc < segment[direct]:
-                    m = (segment[3]-segment[1])/(segment[2]-segment[0])  # Calculate the slope of the line
-                    # Fill lines at x-locations
-                    if direct == 0:
-                        pts.append(m * (loc - segment[direct]) + segment[direct+1])  # y = m(x_loc-x1)+y1
-                    # Fill lines at y-locations
-                    else:
-                        # Check if the slope is infinite (#/0)
-                        if isinf(m):
-                            pts.append(segment[direct+1])  # Intercept at either x-location of the segment (pick 2nd)
-                        else:
-                            pts.append((loc-segment[direct])/m + segment[direct-1])  # x = (y_loc-y1)/m + x1
-            pts.sort()  # Sort points in order to construct infill path lines
-            fill.append((loc, pts))  # Append to fill path list
+            loc = origin + (first + fill_pass)*spacing  # Increment fill pass position by the infill spacing variable
+            fill.append((loc, pts[split[fill_pass]:split[fill_pass+1]].tolist()))  # Append to fill path list
 
     return fill
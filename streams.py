@@ -0,0 +1,116 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import zipfile
+
+'''
+Code to stream the outputs of a slicing job into few, compressed files instead of thousands of small plain files
+ - CODECS: file name extension and opener of the compressed stream of each codec for the path CSV file ('none' writes
+           plain text)
+ - OutputStreams: opens the text streams of the path CSV file through the selected codec and writes the SVG file of
+                  every layer either as its own file or as one entry of a single zip archive written incrementally, and
+                  counts the bytes of output data and the bytes actually written to disk
+
+The compressed files are written through a buffered file of "buffer_size" bytes so that slow (network) file systems
+see few large writes. Files written with a codec keep their usual name plus the codec extension (path.csv.gz) and can
+be read back directly with numpy.loadtxt, gzip/bz2/lzma or any archive tool, and the SVG files are in svg.zip.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+# Codec name -> (file name extension, function(binary file, level) returning the compressed binary stream)
+CODECS = {'none': ('', None),
+          'gzip': ('.gz', lambda fileobj, level: gzip.GzipFile(fileobj=fileobj, mode='wb', compresslevel=level)),
+          'bz2': ('.bz2', lambda fileobj, level: bz2.BZ2File(fileobj, 'wb', compresslevel=max(level, 1))),
+          'lzma': ('.xz', lambda fileobj, level: lzma.LZMAFile(fileobj, 'wb', preset=level))}
+
+
+class OutputStreams:
+    # Output files of a slicing job (see job.slice_model)
+
+    def __init__(self, codec='none', level=6, buffer_size=1 << 20, archive=False):
+        self.codec = codec  # Compression of the path CSV file, one of CODECS
+        self.level = level  # Compression level (0-9) of the codec and of the SVG archive
+        self.buffer_size = buffer_size  # Bytes buffered before each write to disk
+        self.archive = archive  # Write the SVG files of all layers into one svg.zip file
+        self.raw = 0  # Bytes of output data (before compression)
+        self.written = 0  # Bytes of the output files on disk
+        self.files = 0  # Output files created
+        self.zip = None
+        self.open_files = {}
+
+    def start(self, directory):
+        # Start writing the outputs of a job into the directory
+        self.directory = directory
+        self.raw, self.written, self.files = 0, 0, 0
+        self.open_files = {}
+        self.zip = None
+        if self.archive:
+            self.zipfile = open(os.path.join(directory, 'svg.zip'), 'wb', buffering=self.buffer_size)
+            method = zipfile.ZIP_DEFLATED if self.level > 0 else zipfile.ZIP_STORED
+            self.zip = zipfile.ZipFile(self.zipfile, 'w', method, compresslevel=self.level if self.level > 0 else None)
+            self.files += 1
+
+    def filename(self, name):
+        # Path of an output file written through the codec
+        return os.path.join(self.directory, name + CODECS[self.codec][0])
+
+    def open(self, name):
+        # Text stream writing the output file "name" through the codec, closed with finish()
+        fileobj = open(self.filename(name), 'wb', buffering=self.buffer_size)
+        compress = CODECS[self.codec][1]
+        binary = fileobj if compress is None else compress(fileobj, self.level)
+        stream = io.TextIOWrapper(binary, encoding='utf-8', newline='')
+        self.open_files[stream] = fileobj
+        self.files += 1
+        return stream
+
+    def finish(self, stream, count=True):
+        # Close a stream from open(), counting its bytes unless it is an intermediate file
+        stream.flush()
+        raw = stream.buffer.tell()  # Position in the uncompressed data
+        stream.close()
+        fileobj = self.open_files.pop(stream)
+        fileobj.close()
+        if count:
+            self.raw += raw
+            self.written += os.path.getsize(fileobj.name)
+        else:
+            self.files -= 1
+
+    def svg(self, name, write):
+        # Write one SVG file with write(text stream), into the archive or as its own file
+        if self.zip is not None:
+            with self.zip.open(name, 'w') as entry:
+                stream = io.TextIOWrapper(entry, encoding='utf-8')
+                write(stream)
+                stream.flush()
+                stream.detach()
+            self.raw += self.zip.getinfo(name).file_size
+        else:
+            filename = os.path.join(self.directory, name)
+            with open(filename, 'w', encoding='utf-8', buffering=self.buffer_size) as svgfile:
+                write(svgfile)
+            size = os.path.getsize(filename)
+            self.raw += size
+            self.written += size
+            self.files += 1
+
+    def close(self):
+        # Close every stream still open (cancelled job) and the SVG archive
+        for stream in list(self.open_files):
+            self.finish(stream, count=False)
+        if self.zip is not None:
+            self.zip.close()
+            self.zipfile.close()
+            self.written += os.path.getsize(self.zipfile.name)
+            self.zip = None
+        return self
+
+    def ratio(self):
+        # Output data size relative to the bytes written to disk
+        return self.raw/self.written if self.written > 0 else 0.0
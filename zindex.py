@@ -0,0 +1,118 @@
+import numpy as np
+import slice
+
+'''
+Code to find the facets cut by a slice plane without testing every facet of the model
+ - face_ranges: lowest and highest slice height (screen Y, mm) of every facet of geometry positioned on the print bed
+ - vertical_faces: facets parallel to the build direction, which cut every slice plane along the same line
+ - ZIndex: interval tree over the height ranges of the facets, built once after the geometry is oriented and positioned
+           on the print bed (see slice.geom_to_bed_coords)
+   - query: numbers of the facets whose height range contains z (in facet order)
+   - section: the sliced point pairs at height z, identical to slice.compute_points_on_z over the whole geometry but
+              computed from the facets returned by query only (or the facets given)
+
+The tree is a centered interval tree stored in flat arrays. Each node keeps the facets whose range contains the node's
+center twice: sorted by their lowest height and sorted by their highest height. A query walks from the root to a leaf
+(one node per level) and at each node takes the facets starting below z (z under the center) or ending above z (z over
+the center) as one slice of the sorted arrays found by a binary search, so a query costs O(log^2 n + k) for k facets cut
+by the plane. Nodes with few facets are not split further and are filtered directly.
+
+Evan Chodora, 2018
+https://github.com/evanchodora/stl-slicer
+echodor@clemson.edu
+'''
+
+
+def face_ranges(geometry):
+    # Rounded the same way as compute_points_on_z so facets touching the plane at a vertex are always included
+    height = np.around(np.asarray(geometry[:, 1], dtype=float), 5).reshape((-1, 3))
+    return np.min(height, axis=1), np.max(height, axis=1)
+
+
+def vertical_faces(geometry, tol=1e-9):
+    # Facets whose normal has no height (screen Y) component, i.e. whose projection onto the print bed has no area
+    corners = np.asarray(geometry[:, 0:3], dtype=float).reshape((-1, 3, 3))
+    normal = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    return np.abs(normal[:, 1]) <= tol*np.sqrt(np.sum(normal**2, axis=1))
+
+
+class ZIndex:
+
+    def __init__(self, geometry, leaf_size=256):
+        self.geometry = geometry
+        self.low, self.high = face_ranges(geometry)
+        self.leaf_size = leaf_size  # Largest number of facets of a node that is not split
+
+        # Node arrays: center, children (-1 = none), leaf flag and the slices [first, last) of the sorted facet lists
+        center, left, right, leaf, first, last = [], [], [], [], [], []
+        by_low, by_high = [], []  # Facet numbers of every node sorted by lowest and by highest height
+        count = 0
+        stack = [(np.arange(len(self.low)), -1, 0)]  # (facets, parent node, side of the parent: 0 = left, 1 = right)
+        while stack:
+            faces, parent, side = stack.pop()
+            node = len(center)
+            if parent >= 0:
+                (left if side == 0 else right)[parent] = node
+            lo, hi = self.low[faces], self.high[faces]
+            mid = float(np.median((lo + hi)/2)) if len(faces) else 0.0
+            is_leaf = len(faces) <= leaf_size
+            here = np.ones(len(faces), dtype=bool) if is_leaf else (lo <= mid) & (hi >= mid)
+            if not is_leaf and np.all(here):
+                is_leaf = True  # Every facet spans the center, nothing to split
+            center.append(mid)
+            left.append(-1)
+            right.append(-1)
+            leaf.append(is_leaf)
+            first.append(count)
+            count += int(np.count_nonzero(here))
+            last.append(count)
+            by_low.append(faces[here][np.argsort(lo[here], kind='stable')])
+            by_high.append(faces[here][np.argsort(-hi[here], kind='stable')])
+            if not is_leaf:
+                below, above = faces[hi < mid], faces[lo > mid]
+                if len(above):
+                    stack.append((above, node, 1))
+                if len(below):
+                    stack.append((below, node, 0))
+
+        self.center = np.array(center)
+        self.left = np.array(left, dtype=int)
+        self.right = np.array(right, dtype=int)
+        self.leaf = np.array(leaf, dtype=bool)
+        self.first = np.array(first, dtype=int)
+        self.last = np.array(last, dtype=int)
+        self.by_low = np.concatenate([np.empty(0, dtype=int)] + by_low)
+        self.by_high = np.concatenate([np.empty(0, dtype=int)] + by_high)
+        self.sorted_low = self.low[self.by_low]  # Ascending within each node
+        self.sorted_high = -self.high[self.by_high]  # Negated so it is ascending within each node too
+
+    def __len__(self):
+        return len(self.low)
+
+    def query(self, z):
+        found = []
+        node = 0 if len(self.center) else -1
+        while node >= 0:
+            start, end = self.first[node], self.last[node]
+            if self.leaf[node]:
+                # Facets starting at or below z, then keep those ending at or above z
+                stop = start + np.searchsorted(self.sorted_low[start:end], z, side='right')
+                faces = self.by_low[start:stop]
+                found.append(faces[self.high[faces] >= z])
+                break
+            if z <= self.center[node]:
+                # Every facet of the node ends at or above the center, so it contains z if it starts at or below z
+                found.append(self.by_low[start:start + np.searchsorted(self.sorted_low[start:end], z, side='right')])
+                node = self.left[node] if z < self.center[node] else -1
+            else:
+                # Every facet of the node starts at or below the center, so it contains z if it ends at or above z
+                found.append(self.by_high[start:start + np.searchsorted(self.sorted_high[start:end], -z, side='right')])
+                node = self.right[node]
+        return np.sort(np.concatenate([np.empty(0, dtype=int)] + found))
+
+    def section(self, z, faces=None):
+        # Slice only the facets whose height range contains z (in the original order, so the output is identical)
+        if faces is None:
+            faces = self.query(z)
+        rows = (3*faces[:, None] + np.arange(3)).reshape(-1)
+        return slice.compute_points_on_z(self.geometry[rows], z)